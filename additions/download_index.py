@@ -0,0 +1,228 @@
+# persistent index of downloaded files by source id and content hash, so known content is not downloaded again
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+
+from etltools.additions.logger import Logger
+
+
+class DownloadIndexError(Exception):
+    pass
+
+
+class DownloadIndex(Logger):
+    '''
+    SQLite index of downloaded files in any number of directories: every file has its size, mtime and content hash,
+    every source id (for example, 'youtube:<video id>' or url) has the hash of its content and optionally
+    the validator of the remote content (ETag or Last-Modified), so the caller can check that the source isn't changed
+
+    before downloading a source `reuse()` hardlinks (or copies, between file systems) a known file with
+    the same content to the target path; `scan()` indexes existing files and rehashes only the files with
+    changed size or mtime
+
+    :Example:
+
+    >>> with DownloadIndex('downloads.sqlite', dirs=['/video/playlist1', '/video/playlist2']) as index:
+    ...     index.scan()
+    ...     if not index.reuse('youtube:dQw4w9WgXcQ', '/video/playlist3/video.mp4'):
+    ...         download(...)
+    ...         index.add('/video/playlist3/video.mp4', source='youtube:dQw4w9WgXcQ')
+    '''
+    DDL = '''
+        CREATE TABLE IF NOT EXISTS file (
+            path        TEXT PRIMARY KEY,
+            size        INTEGER NOT NULL,
+            mtime_ns    INTEGER NOT NULL,
+            hash        TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS file_hash_idx ON file (hash);
+        CREATE TABLE IF NOT EXISTS source (
+            source      TEXT PRIMARY KEY,
+            hash        TEXT NOT NULL,
+            validator   TEXT
+        );
+    '''
+
+    def __init__(self, db_path: str, dirs: list=(), hash_algorithm: str='sha256'):
+        '''
+        in:
+            db_path, str - SQLite database file, it is created if not exists
+            dirs, list - download directories for `scan()`
+            hash_algorithm, str - name of `hashlib` algorithm
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if hash_algorithm not in hashlib.algorithms_available:
+            msg = f'Unknown hash algorithm : {hash_algorithm=}'
+            self.logger.error(self.log_msg(msg))
+            raise DownloadIndexError(msg)
+
+        self.db_path = db_path
+        self.dirs = [os.path.abspath(directory) for directory in dirs]
+        self.hash_algorithm = hash_algorithm
+
+        # one connection for all threads of downloaders
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(self.DDL)
+            # indexes created before validators were stored
+            if 'validator' not in [row[1] for row in self._conn.execute('PRAGMA table_info(source);')]:
+                self._conn.execute('ALTER TABLE source ADD COLUMN validator TEXT;')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def hash_file(self, path: str) -> str:
+        digest = hashlib.new(self.hash_algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def scan(self, dirs: list=None) -> dict:
+        '''
+        index all files in the directories (recursively): files with the same size and mtime as in the index
+        are not read, new and changed files are hashed, deleted files are removed from the index
+
+        in: dirs, list - directories, `self.dirs` if None
+        out: dict - numbers of files, hashed files and removed files
+        '''
+        dirs = self.dirs if dirs is None else [os.path.abspath(directory) for directory in dirs]
+        with self._lock:
+            known = {path: (size, mtime_ns) for path, size, mtime_ns in self._conn.execute('SELECT path, size, mtime_ns FROM file;')}
+
+        stats = {'files': 0, 'hashed': 0, 'removed': 0}
+        seen = set()
+        for directory in dirs:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if path == os.path.abspath(self.db_path) or name.endswith(('.part', '.part.json', '.tmp')):
+                        continue # the index itself and unfinished downloads
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    seen.add(path)
+                    stats['files'] += 1
+                    if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                        self._add(path, stat)
+                        stats['hashed'] += 1
+
+        # files of the scanned directories which don't exist anymore
+        removed = [path for path in known if path not in seen and any(path.startswith(directory + os.sep) for directory in dirs)]
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM file WHERE path = ?;', [(path,) for path in removed])
+        stats['removed'] = len(removed)
+
+        self.logger.info(self.log_msg(f'Scan of {dirs} finished : {stats}'))
+        return stats
+
+    def add(self, path: str, source: str=None, validator: str=None) -> str:
+        '''
+        index the downloaded file
+
+        in:
+            path, str
+            source, str - source id of the content
+            validator, str - validator of the remote content of the source, for example ETag
+        out: content hash, str
+        '''
+        path = os.path.abspath(path)
+        content_hash = self._add(path, os.stat(path))
+        if source is not None:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO source (source, hash, validator) VALUES (?, ?, ?);',
+                    (source, content_hash, validator)
+                )
+        return content_hash
+
+    def _add(self, path: str, stat: os.stat_result, content_hash: str=None) -> str:
+        if content_hash is None:
+            content_hash = self.hash_file(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO file (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?);',
+                (path, stat.st_size, stat.st_mtime_ns, content_hash)
+            )
+        return content_hash
+
+    def validator(self, source: str) -> str:
+        '''
+        out: validator of the source stored by `add()` or None
+        '''
+        with self._lock:
+            row = self._conn.execute('SELECT validator FROM source WHERE source = ?;', (source,)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, source: str=None, content_hash: str=None) -> str:
+        '''
+        existing file with the content of the source or with the hash
+
+        a file changed after indexing is rehashed, missing files are removed from the index
+
+        out: path or None
+        '''
+        with self._lock:
+            if content_hash is None:
+                row = self._conn.execute('SELECT hash FROM source WHERE source = ?;', (source,)).fetchone()
+                if row is None:
+                    return None
+                content_hash = row[0]
+            rows = self._conn.execute('SELECT path, size, mtime_ns FROM file WHERE hash = ?;', (content_hash,)).fetchall()
+
+        for path, size, mtime_ns in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self._lock, self._conn:
+                    self._conn.execute('DELETE FROM file WHERE path = ?;', (path,))
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns) or self._add(path, stat) == content_hash:
+                return path
+        return None
+
+    def reuse(self, source: str, path: str) -> bool:
+        '''
+        create `path` from a known file with the content of the source instead of downloading it
+
+        out: bool - True if the file is created or already exists with the same content
+        '''
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute('SELECT hash FROM source WHERE source = ?;', (source,)).fetchone()
+            indexed = self._conn.execute('SELECT size, mtime_ns, hash FROM file WHERE path = ?;', (path,)).fetchone()
+        if row is None:
+            return False
+        content_hash = row[0]
+
+        if os.path.exists(path):
+            # an existing file is never overwritten
+            stat = os.stat(path)
+            return indexed == (stat.st_size, stat.st_mtime_ns, content_hash) or self._add(path, stat) == content_hash
+
+        existing = self.lookup(content_hash=content_hash)
+        if existing is None:
+            return False
+        try:
+            os.link(existing, path)
+            how = 'hardlinked'
+        except OSError:
+            # another file system or hardlinks are not supported
+            shutil.copy2(existing, path)
+            how = 'copied'
+        self._add(path, os.stat(path), content_hash=content_hash)
+        self.logger.info(self.log_msg(f'{source=} is {how} from {existing} to {path}'))
+        return True
@@ -0,0 +1,67 @@
+# benchmark: import time of modules used by worker processes and short CLI jobs, checked against a budget
+
+import os
+import subprocess
+import sys
+
+
+REPEATS = 5
+# module : budget of the cumulative import time in milliseconds, without the interpreter startup
+IMPORT_BUDGETS = {
+    'etltools.parsers.parser'           : 25,
+    'etltools.parsers.utils'            : 25,
+    'etltools.additions.download_index' : 30,
+    'etltools.pg_tools.pg_connector'    : 100,
+}
+HEAVIEST_TOTAL = 5
+
+
+def import_times(module: str) -> list:
+    '''
+    out: [(cumulative time in ms, nesting level, module name), ...] from `python -X importtime`
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        times.append((int(cumulative) / 1000, (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return times
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    print(f'Import time, the best of {REPEATS} runs:\n')
+    over_budget = []
+    for module, budget in IMPORT_BUDGETS.items():
+        runs = [import_times(module) for _ in range(REPEATS)]
+        best = min(runs, key=lambda times: next(ms for ms, _, name in times if name == module))
+        duration = next(ms for ms, _, name in best if name == module)
+
+        status = 'ok' if duration <= budget else 'OVER BUDGET'
+        print(f'{module:<40} : {duration:8.2f} ms, budget {budget} ms, {status}')
+        # the heaviest direct imports of the module, they are printed before the module by `-X importtime`
+        index = next(index for index, (_, _, name) in enumerate(best) if name == module)
+        children = []
+        for ms, level, name in reversed(best[:index]):
+            if level == 0:
+                break
+            if level == 1:
+                children.append((ms, name))
+        children.sort(reverse=True)
+        for ms, name in children[:HEAVIEST_TOTAL]:
+            print(f'{"":<4}{name:<36} : {ms:8.2f} ms')
+        if duration > budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f'\nOver budget : {over_budget}')
+        sys.exit(1)
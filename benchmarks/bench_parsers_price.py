@@ -0,0 +1,56 @@
+# benchmark: hand-rolled per-field price parsing against `PriceParser`
+
+import os
+import random
+import re
+import subprocess
+import time
+
+from etltools.parsers.utils import PriceParser
+
+
+VALUES_TOTAL = 200_000
+REPEATS = 5
+
+
+def parse_price_old(text: str) -> tuple:
+    '''
+    typical hand-rolled parsing of a price in a parser, with module-level `re` functions
+    '''
+    try:
+        currency = re.search(r'[^\d\s,.\-]+', text)
+        number = re.sub(r'[^\d,\-]', '', text).replace(',', '.')
+        return float(number), currency.group() if currency else None
+    except (ValueError, TypeError):
+        return None
+
+
+def bench(title: str, f):
+    '''
+    run f() `REPEATS` times and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    for _ in range(REPEATS):
+        f()
+    duration = (time.perf_counter() - start_time) / REPEATS
+    print(f'{title:<50} : {duration * 1000:8.2f} ms, {VALUES_TOTAL / duration:12.0f} values/s')
+    return duration
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    print(f'Columns of {VALUES_TOTAL} prices\n')
+
+    parser = PriceParser('uk')
+    for title, distinct in (('distinct prices', VALUES_TOTAL), ('catalog prices, 1000 distinct', 1000)):
+        prices = [f'{random.randrange(distinct) * 1.01:,.2f} \u20b4'.replace(',', '\u00a0').replace('.', ',') for _ in range(VALUES_TOTAL)]
+        print(f'{title}, for example {prices[0]!r}:')
+        base = bench('parse_price_old() per value', lambda: [parse_price_old(price) for price in prices])
+        duration = bench('PriceParser.parse() per value', lambda: [parser.parse(price) for price in prices])
+        print(f'{"":<50}   x{base / duration:.1f}')
+        duration = bench('PriceParser.parse_many()', lambda: parser.parse_many(prices))
+        print(f'{"":<50}   x{base / duration:.1f}\n')
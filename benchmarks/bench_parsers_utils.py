@@ -0,0 +1,74 @@
+# benchmark: per-call text normalization against the batch API of `Utils`
+
+import os
+import re
+import subprocess
+import time
+
+import numpy
+
+from etltools.parsers.utils import Utils
+
+
+VALUES_TOTAL = 200_000
+REPEATS = 5
+
+
+def clear_string_from_spaces_old(line: str) -> str:
+    '''
+    the previous implementation of `Utils.clear_string_from_spaces()`, with module-level `re` functions
+    '''
+    return re.sub(r'\s+', ' ', line.strip())
+
+
+def str_to_int_old(line: str) -> int:
+    '''
+    the previous implementation of `Utils.str_to_int()`, with module-level `re` functions
+    '''
+    try:
+        if not isinstance(line, (str,)) or not re.match(r'^[0-9]{1,3}(\s[0-9]{3})*$', line.strip()):
+            raise ValueError()
+        return int(re.sub(r'\s+', '', line))
+    except:
+        return None
+
+
+def bench(title: str, f):
+    '''
+    run f() `REPEATS` times and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    for _ in range(REPEATS):
+        f()
+    duration = (time.perf_counter() - start_time) / REPEATS
+    print(f'{title:<50} : {duration * 1000:8.2f} ms, {VALUES_TOTAL / duration:12.0f} values/s')
+    return duration
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    print(f'Columns of {VALUES_TOTAL} values\n')
+
+    titles = [f'  Item\n title {n}\t\tin  stock ' for n in range(VALUES_TOTAL)]
+    prices = [f' {n * 1000 + n % 1000:,} '.replace(',', ' ') if n % 10 else 'n/a' for n in range(VALUES_TOTAL)]
+
+    print('current per-call methods with precompiled patterns:')
+    bench('clear_string_from_spaces()', lambda: [Utils.clear_string_from_spaces(line) for line in titles])
+    bench('str_to_int()', lambda: [Utils.str_to_int(line) for line in prices])
+    print()
+
+    for title, old, new in (
+        ('spaces, list', lambda: [clear_string_from_spaces_old(line) for line in titles], lambda: Utils.normalize_many(titles)),
+        ('spaces, NumPy', lambda: [clear_string_from_spaces_old(line) for line in titles], lambda: Utils.normalize_many(numpy.array(titles), ('strip', 'spaces'))),
+        ('int, list', lambda: [str_to_int_old(line) for line in prices], lambda: Utils.normalize_many(prices, ('int',))),
+        ('spaces + lower + int, list',
+            lambda: [str_to_int_old(clear_string_from_spaces_old(line).lower()) for line in prices],
+            lambda: Utils.normalize_many(prices, ('spaces', 'lower', 'int'))),
+    ):
+        base = bench(f'{title}, old per-call methods', old)
+        duration = bench(f'{title}, normalize_many()', new)
+        print(f'{"":<50}   x{base / duration:.1f}')
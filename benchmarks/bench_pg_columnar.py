@@ -0,0 +1,65 @@
+# benchmark: rows of Python tuples converted into NumPy arrays against columnar fetch
+
+import os
+import subprocess
+import time
+
+import numpy
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+ROWS_TOTAL = 1_000_000
+BATCH_SIZE = 65536
+
+QUERY = (
+    "SELECT n::int4 AS n, n::int8 * 1000 AS big, n / 7.0::float8 AS x, TIMESTAMP '2021-01-01' + n * INTERVAL '1 second' AS ts "
+    'FROM generate_series(1, %s) AS s(n)'
+)
+
+
+def bench(title: str, f):
+    '''
+    run f() which returns the sum of column `x` and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    total = f()
+    duration = time.perf_counter() - start_time
+    print(f'{title:<40} : {duration:8.3f} s, {ROWS_TOTAL / duration:10.0f} rows/s, {total=:.1f}')
+    return duration
+
+
+def rows_to_numpy():
+    total = 0.0
+    with PgConnector(test_config) as db:
+        for rows in db.iter_query(QUERY + ';', (ROWS_TOTAL,), itersize=BATCH_SIZE, batches=True):
+            n, big, x, ts = (numpy.array(column) for column in zip(*rows))
+            total += x.sum()
+    return total
+
+
+def fetch_columns(arrow: bool):
+    def f():
+        total = 0.0
+        with PgConnector(test_config) as db:
+            for batch in db.fetch_columns(QUERY, (ROWS_TOTAL,), batch_size=BATCH_SIZE, arrow=arrow):
+                total += batch.column('x').to_numpy().sum() if arrow else batch['x'].sum()
+        return total
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    PgQueryStats.configure(enabled=False) # every query is a slow query here
+    print(f'Fetch {ROWS_TOTAL} rows of int4, int8, float8 and timestamp columns : {test_config}\n')
+
+    base = bench('iter_query() + numpy.array()', rows_to_numpy)
+    for arrow in (False, True):
+        duration = bench(f'fetch_columns(), {arrow=}', fetch_columns(arrow))
+        print(f'{"":<40}   x{base / duration:.1f}')
@@ -0,0 +1,63 @@
+# benchmark: per-row execute() against execute_many() and execute_values()
+
+import os
+import subprocess
+import time
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+
+
+ROWS_TOTAL = 20_000
+PAGE_SIZES = (100, 1000)
+
+DDL_CREATE_TABLE = 'CREATE TEMP TABLE bench_batch (bench_batch_id SERIAL PRIMARY KEY, title TEXT NOT NULL UNIQUE, amount INTEGER NOT NULL);'
+DML_TRUNCATE_TABLE = 'TRUNCATE TABLE bench_batch;'
+DML_INSERT = 'INSERT INTO bench_batch (title, amount) VALUES (%s, %s);'
+DML_INSERT_VALUES = 'INSERT INTO bench_batch (title, amount) VALUES %s;'
+
+
+def bench(title: str, f, rows: list, db: PgConnector):
+    '''
+    run f(rows) in a transaction and print the duration and the speed
+    '''
+    db.execute(DML_TRUNCATE_TABLE)
+    db.commit()
+
+    start_time = time.perf_counter()
+    f(rows)
+    db.commit()
+    duration = time.perf_counter() - start_time
+
+    inserted = db.execute('SELECT COUNT(*) FROM bench_batch;')[0][0]
+    print(f'{title:<40} : {duration:8.3f} s, {len(rows) / duration:10.0f} rows/s, {inserted=}')
+    return duration
+
+
+def per_row_loop(db: PgConnector):
+    def f(rows):
+        for row in rows:
+            db.execute(DML_INSERT, row)
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    rows = [(f'Mozilla/5.0 (bench {n})', n) for n in range(ROWS_TOTAL)]
+    print(f'Insert {ROWS_TOTAL} rows into a temporary table : {test_config}\n')
+
+    with PgConnector(test_config) as db:
+        db.execute(DDL_CREATE_TABLE)
+        db.commit()
+
+        base = bench('execute() per row', per_row_loop(db), rows, db)
+        for page_size in PAGE_SIZES:
+            duration = bench(f'execute_many(), {page_size=}', lambda rows: db.execute_many(DML_INSERT, rows, page_size=page_size), rows, db)
+            print(f'{"":<40}   x{base / duration:.1f}')
+        for page_size in PAGE_SIZES:
+            duration = bench(f'execute_values(), {page_size=}', lambda rows: db.execute_values(DML_INSERT_VALUES, rows, page_size=page_size), rows, db)
+            print(f'{"":<40}   x{base / duration:.1f}')
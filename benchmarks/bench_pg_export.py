@@ -0,0 +1,76 @@
+# benchmark: execute() loop with csv.writer against PgExporter with COPY TO
+
+import csv
+import gzip
+import os
+import subprocess
+import tempfile
+import time
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_export import PgExporter
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+ROWS_TOTAL = 1_000_000
+WORKERS = (1, 4)
+
+DDL_CREATE_TABLE = (
+    'CREATE UNLOGGED TABLE bench_export AS '
+    'SELECT n AS bench_export_id, md5(n::text) AS title, n / 7.0 AS amount FROM generate_series(1, %s) AS s(n);'
+)
+DDL_ADD_PRIMARY_KEY = 'ALTER TABLE bench_export ADD PRIMARY KEY (bench_export_id);'
+DDL_DROP_TABLE = 'DROP TABLE IF EXISTS bench_export;'
+
+
+def bench(title: str, f):
+    '''
+    run f(out_dir) and print the duration, the speed and the size of the files
+    '''
+    with tempfile.TemporaryDirectory() as out_dir:
+        start_time = time.perf_counter()
+        f(out_dir)
+        duration = time.perf_counter() - start_time
+        size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    print(f'{title:<40} : {duration:8.3f} s, {ROWS_TOTAL / duration:10.0f} rows/s, {size=}')
+    return duration
+
+
+def execute_loop(out_dir: str):
+    with PgConnector(test_config) as db, gzip.open(os.path.join(out_dir, 'bench_export.csv.gz'), 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('bench_export_id', 'title', 'amount'))
+        for rows in db.iter_query('SELECT * FROM bench_export;', batches=True):
+            writer.writerows(rows)
+
+
+def exporter(workers: int, compression: str):
+    def f(out_dir):
+        PgExporter(test_config, 'bench_export', out_dir, key_column='bench_export_id', workers=workers, compression=compression).export()
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    PgQueryStats.configure(enabled=False) # every query is a slow query here
+    print(f'Export {ROWS_TOTAL} rows into compressed CSV files : {test_config}\n')
+
+    with PgConnector(test_config) as db:
+        db.execute(DDL_DROP_TABLE)
+        db.execute(DDL_CREATE_TABLE, (ROWS_TOTAL,))
+        db.execute(DDL_ADD_PRIMARY_KEY)
+
+    try:
+        base = bench('iter_query() + csv.writer, gzip', execute_loop)
+        for compression in ('gzip', 'zstd'):
+            for workers in WORKERS:
+                duration = bench(f'PgExporter, {workers=}, {compression}', exporter(workers, compression))
+                print(f'{"":<40}   x{base / duration:.1f}')
+    finally:
+        with PgConnector(test_config) as db:
+            db.execute(DDL_DROP_TABLE)
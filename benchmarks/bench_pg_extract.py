@@ -0,0 +1,71 @@
+# benchmark: single cursor against parallel range extraction with several workers
+
+import os
+import subprocess
+import time
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_extract import PgParallelExtractor
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+ROWS_TOTAL = 2_000_000
+WORKERS = (1, 2, 4, 8)
+
+DDL_CREATE_TABLE = (
+    'CREATE UNLOGGED TABLE bench_extract AS '
+    "SELECT n AS bench_extract_id, md5(n::text) AS title, n %% 1000 AS amount FROM generate_series(1, %s) AS s(n);"
+)
+DDL_ADD_PRIMARY_KEY = 'ALTER TABLE bench_extract ADD PRIMARY KEY (bench_extract_id);'
+DDL_DROP_TABLE = 'DROP TABLE IF EXISTS bench_extract;'
+# the filter is evaluated on the server, so the server side of the extraction can be parallelized
+WHERE = "title LIKE '%%a%%'" # `%%` is processed by PgParallelExtractor
+
+
+def bench(title: str, f):
+    '''
+    run f() which returns the number of rows and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    rows = f()
+    duration = time.perf_counter() - start_time
+    print(f'{title:<40} : {duration:8.3f} s, {rows / duration:10.0f} rows/s, {rows=}')
+    return duration
+
+
+def single_cursor():
+    with PgConnector(test_config) as db:
+        return sum(len(batch) for batch in db.iter_query(f'SELECT * FROM bench_extract WHERE {WHERE};' % (), batches=True))
+
+
+def parallel(workers: int, key_column: str=None):
+    def f():
+        extractor = PgParallelExtractor(test_config, 'bench_extract', key_column=key_column, where=WHERE, workers=workers)
+        return sum(len(batch) for batch in extractor.extract())
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    PgQueryStats.configure(enabled=False) # every range is a slow query here
+    print(f'Extract {ROWS_TOTAL} rows from a table : {test_config}\n')
+
+    with PgConnector(test_config) as db:
+        db.execute(DDL_DROP_TABLE)
+        db.execute(DDL_CREATE_TABLE, (ROWS_TOTAL,))
+        db.execute(DDL_ADD_PRIMARY_KEY)
+
+    try:
+        base = bench('iter_query(), one cursor', single_cursor)
+        for key_column in ('bench_extract_id', None):
+            for workers in WORKERS:
+                duration = bench(f'extract(), {workers=}, {"key" if key_column else "ctid"}', parallel(workers, key_column))
+                print(f'{"":<40}   x{base / duration:.1f}')
+    finally:
+        with PgConnector(test_config) as db:
+            db.execute(DDL_DROP_TABLE)
@@ -0,0 +1,78 @@
+# benchmark: claims of jobs one by one against batch claims with several concurrent workers
+
+import os
+import subprocess
+import threading
+import time
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_pool import PgPool
+from etltools.pg_tools.pg_queue import PgJobQueue
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+JOBS_TOTAL = 20_000
+TABLE = 'bench_job'
+RUNS = ( # (workers, jobs claimed at once)
+    (1, 1),
+    (4, 1),
+    (1, 100),
+    (4, 100),
+    (8, 100),
+)
+
+
+def bench(title: str, f):
+    '''
+    run f() which returns the number of jobs and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    jobs = f()
+    duration = time.perf_counter() - start_time
+    print(f'{title:<40} : {duration:8.3f} s, {jobs / duration:10.0f} jobs/s, {jobs=}')
+    return duration
+
+
+def claim_ack(workers: int, limit: int):
+    def worker(done: list):
+        job_queue = PgJobQueue(test_config, 'bench', table=TABLE)
+        while jobs := job_queue.claim(limit):
+            job_queue.ack(jobs)
+            done.append(len(jobs))
+
+    def f():
+        done = []
+        threads = [threading.Thread(target=worker, args=(done,)) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(done)
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    PgQueryStats.configure(enabled=False)
+    PgPool.create(test_config, minconn=1, maxconn=max(workers for workers, _ in RUNS))
+    print(f'Claim and acknowledge {JOBS_TOTAL} jobs : {test_config}\n')
+
+    base = None
+    try:
+        for workers, limit in RUNS:
+            with PgConnector(test_config) as db:
+                db.execute(f'DROP TABLE IF EXISTS {TABLE};')
+            PgJobQueue(test_config, 'bench', table=TABLE).enqueue([{'url': f'/page/{n}'} for n in range(JOBS_TOTAL)])
+
+            duration = bench(f'claim({limit}), {workers=}', claim_ack(workers, limit))
+            base = base or duration
+            print(f'{"":<40}   x{base / duration:.1f}')
+    finally:
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS {TABLE};')
+        PgPool.close_all()
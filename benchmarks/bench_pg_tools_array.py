@@ -0,0 +1,79 @@
+# benchmark: encoding and decoding of large PostgreSQL arrays
+
+import os
+import random
+import subprocess
+import time
+
+import numpy
+import psycopg2.extensions
+
+from etltools.pg_tools.pg_tools import PgTools
+
+
+ELEMENTS_TOTAL = 200_000
+REPEATS = 10
+
+
+def list_to_array_old(lst: list, dtype: str='str') -> str:
+    '''
+    the previous implementation of `PgTools.list_to_array()`, without escaping and NULLs
+    '''
+    if dtype == 'int':
+        line = ','.join([str(int(value)) for value in lst])
+    elif dtype == 'float':
+        line = ','.join([str(float(value)) for value in lst])
+    else:
+        line = ','.join([f'"{str(value).strip()}"' for value in lst])
+    return '{' + line + '}'
+
+
+def bench(title: str, f):
+    '''
+    run f() `REPEATS` times and print the duration and the speed
+    '''
+    start_time = time.perf_counter()
+    for _ in range(REPEATS):
+        f()
+    duration = (time.perf_counter() - start_time) / REPEATS
+    print(f'{title:<45} : {duration * 1000:8.2f} ms, {ELEMENTS_TOTAL / duration:12.0f} elements/s')
+    return duration
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    print(f'Arrays of {ELEMENTS_TOTAL} elements\n')
+
+    ints = [random.randint(-10**9, 10**9) for _ in range(ELEMENTS_TOTAL)]
+    floats = [random.random() * 1000 for _ in range(ELEMENTS_TOTAL)]
+    strings = [f'title {n}' for n in range(ELEMENTS_TOTAL)]
+    int_array = numpy.array(ints, dtype='int64')
+    float_array = numpy.array(floats)
+
+    print('Encode:')
+    for title, old, new in (
+        ('int', lambda: list_to_array_old(ints, 'int'), lambda: PgTools.encode_array(ints)),
+        ('float', lambda: list_to_array_old(floats, 'float'), lambda: PgTools.encode_array(floats)),
+        ('str', lambda: list_to_array_old(strings, 'str'), lambda: PgTools.encode_array(strings)),
+        ('numpy int64', lambda: list_to_array_old(list(int_array), 'int'), lambda: PgTools.encode_array(int_array)),
+        ('numpy float64', lambda: list_to_array_old(list(float_array), 'float'), lambda: PgTools.encode_array(float_array)),
+    ):
+        base = bench(f'{title}, old list_to_array()', old)
+        duration = bench(f'{title}, encode_array()', new)
+        print(f'{"":<45}   x{base / duration:.1f}')
+
+    print('\nDecode (psycopg2 typecasters are in C, the tokenizer is the general path of decode_array()):')
+    for title, text, dtype, typecaster in (
+        ('int', PgTools.encode_array(ints), int, psycopg2.extensions.LONGINTEGERARRAY),
+        ('float', PgTools.encode_array(floats), float, psycopg2.extensions.FLOATARRAY),
+        ('str', PgTools.encode_array(strings), str, psycopg2.extensions.UNICODEARRAY),
+        ('int with NULL', PgTools.encode_array(ints[:-1] + [None]), int, psycopg2.extensions.LONGINTEGERARRAY),
+    ):
+        bench(f'{title}, psycopg2 typecaster', lambda: typecaster(text, None))
+        base = bench(f'{title}, tokenizer', lambda: PgTools._decode_tokens(text, dtype))
+        duration = bench(f'{title}, decode_array()', lambda: PgTools.decode_array(text, dtype))
+        print(f'{"":<45}   x{base / duration:.1f}')
@@ -0,0 +1,77 @@
+# benchmark: one transaction per parsed item inline against the background batch writer
+
+import os
+import subprocess
+import time
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_stats import PgQueryStats
+from etltools.pg_tools.pg_writer import PgBatchWriter
+
+
+ITEMS_TOTAL = 20_000
+FETCH_TIME = 0.0001 # imitation of downloading and parsing of one page, in seconds
+
+DDL_CREATE_TABLE = 'CREATE UNLOGGED TABLE bench_writer (url TEXT, title TEXT, price NUMERIC);'
+DDL_DROP_TABLE = 'DROP TABLE IF EXISTS bench_writer;'
+
+
+def items():
+    for n in range(ITEMS_TOTAL):
+        time.sleep(FETCH_TIME)
+        yield (f'https://www.somehost.com/item/{n}', f'title {n}', n / 100)
+
+
+def bench(title: str, f):
+    '''
+    run f() which returns the number of items and print the duration and the speed
+    '''
+    with PgConnector(test_config) as db:
+        db.execute(DDL_DROP_TABLE)
+        db.execute(DDL_CREATE_TABLE)
+
+    start_time = time.perf_counter()
+    rows = f()
+    duration = time.perf_counter() - start_time
+    print(f'{title:<40} : {duration:8.3f} s, {rows / duration:10.0f} items/s, {rows=}')
+    return duration
+
+
+def inline():
+    rows = 0
+    with PgConnector(test_config) as db:
+        for item in items():
+            db.execute('INSERT INTO bench_writer (url, title, price) VALUES (%s, %s, %s);', item)
+            db.commit()
+            rows += 1
+    return rows
+
+
+def writer(batch_size: int):
+    def f():
+        with PgBatchWriter(test_config, 'bench_writer', ('url', 'title', 'price'), batch_size=batch_size) as writer:
+            for item in items():
+                writer.put(item)
+        return writer.rows
+    return f
+
+
+if __name__ == '__main__':
+    if os.name == 'posix':
+        _ = subprocess.run('clear')
+    else:
+        print('\n' * 42)
+
+    PgQueryStats.configure(enabled=False)
+    print(f'Write {ITEMS_TOTAL} items : {test_config}\n')
+
+    try:
+        bench('fetch only, without writing', lambda: sum(1 for _ in items()))
+        base = bench('execute() and commit() per item', inline)
+        for batch_size in (100, 1000, 10000):
+            duration = bench(f'PgBatchWriter, {batch_size=}', writer(batch_size))
+            print(f'{"":<40}   x{base / duration:.1f}')
+    finally:
+        with PgConnector(test_config) as db:
+            db.execute(DDL_DROP_TABLE)
@@ -0,0 +1,74 @@
+# shared bandwidth limit and aggregated progress of concurrent downloads, without dependency on pytube
+
+import threading
+import time
+
+
+class BandwidthLimiter:
+    '''
+    global limit of download speed shared by threads: every chunk reserves its time of transfer
+    at `max_bandwidth` and the thread sleeps until the end of the reserved time
+    '''
+    def __init__(self, max_bandwidth: float):
+        '''
+        in: max_bandwidth, float - bytes per second
+        '''
+        self.max_bandwidth = max_bandwidth
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def consume(self, size: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._next_time = max(self._next_time, now) + size / self.max_bandwidth
+            delay = self._next_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DownloadProgress:
+    '''
+    aggregated progress of concurrent downloads, printed in one line not more often than every `interval` seconds
+    '''
+    def __init__(self, videos_total: int, interval: float=1.0):
+        self.videos_total = videos_total
+        self.interval = interval
+        self.bytes_total = 0 # sizes of videos with known metadata
+        self.bytes_done = 0
+        self.downloaded = 0
+        self.skipped = 0
+        self.reused = 0 # known content from `DownloadIndex`
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._report_time = 0.0
+
+    def add_video(self, size: int) -> None:
+        with self._lock:
+            self.bytes_total += size
+
+    def add_chunk(self, size: int) -> None:
+        with self._lock:
+            self.bytes_done += size
+        self.report()
+
+    def finish_video(self, status: str) -> None:
+        '''
+        in: status, str - 'downloaded', 'skipped', 'reused' or 'failed'
+        '''
+        with self._lock:
+            setattr(self, status, getattr(self, status) + 1)
+        self.report(force=True)
+
+    def report(self, force: bool=False) -> None:
+        now = time.monotonic()
+        if not force and now - self._report_time < self.interval:
+            return
+        self._report_time = now
+        speed = self.bytes_done / max(now - self._start_time, 1e-6) / 2**20
+        print(
+            f'\r{self.downloaded + self.skipped + self.reused + self.failed}/{self.videos_total} videos'
+            f' (skipped {self.skipped}, reused {self.reused}, failed {self.failed}),'
+            f' {self.bytes_done / 2**20:.1f}/{self.bytes_total / 2**20:.1f} MB, {speed:.2f} MB/s   ',
+            end='', flush=True
+        )
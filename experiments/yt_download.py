@@ -4,12 +4,18 @@
 import os
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 
-from pytube import Playlist, YouTube
+from pytube import Playlist, YouTube, request
 from pytube.cli import on_progress
 
+from etltools.experiments.download_progress import BandwidthLimiter, DownloadProgress
 from etltools.experiments.utility import Utility
 
+if TYPE_CHECKING:
+    from etltools.additions.download_index import DownloadIndex
+
 
 class YtDownload:
     class _Decorators:
@@ -36,15 +42,23 @@ class YtDownload:
 
     @classmethod
     @_Decorators.deco_downloader
-    def download_videos(cls, downloads_dir: str, urls: list, pause_between_downloads: int=3) -> None:
+    def download_videos(cls, downloads_dir: str, urls: list, pause_between_downloads: int=3, workers: int=1,
+                        metadata_workers: int=8, max_bandwidth: float=None, index: 'DownloadIndex'=None) -> None:
         '''
         download videos from YouTube to specified directory
 
         in:
             downloads_dir, str - directory for saving video; must already be created
             urls, list - list of videos url
-            pause_between_downloads, int - in seconds
+            pause_between_downloads, int - in seconds, only for one worker
+            workers, int - number of concurrent downloads, see `download_concurrently()`
+            metadata_workers, int - number of concurrent requests of streams metadata, only for several workers
+            max_bandwidth, float - total download speed limit in bytes per second, only for several workers
+            index, DownloadIndex - reuse known videos from other directories, only for several workers
         '''
+        if workers > 1:
+            return cls.download_concurrently(downloads_dir, urls, workers, metadata_workers, max_bandwidth, index)
+
         for idx, url in enumerate(urls):
             try:
                 yt = YouTube(url)
@@ -64,7 +78,8 @@ class YtDownload:
 
     @classmethod
     @_Decorators.deco_downloader
-    def download_playlist(cls, downloads_dir: str, pl_url: str, pause_between_downloads: int=3):
+    def download_playlist(cls, downloads_dir: str, pl_url: str, pause_between_downloads: int=3, workers: int=1,
+                          metadata_workers: int=8, max_bandwidth: float=None, index: 'DownloadIndex'=None):
         '''
         download videos from YouTube Playlist to specified directory
         subdirectory for the playlist will be created
@@ -72,12 +87,16 @@ class YtDownload:
         in:
             downloads_dir, str - base directory for saving video; must already be created
             pl_url, str - YouTube playlist url
-            pause_between_downloads, int - in seconds
+            pause_between_downloads, int - in seconds, only for one worker
+            workers, int - number of concurrent downloads, see `download_concurrently()`
+            metadata_workers, int - number of concurrent requests of streams metadata, only for several workers
+            max_bandwidth, float - total download speed limit in bytes per second, only for several workers
+            index, DownloadIndex - reuse known videos from other directories, only for several workers
         '''
         pl = Playlist(pl_url)
         PLAYLIST_SUBDIR = Utility.string_to_filename(pl.title)
 
-        PL_DOWNLOADS_DIR = os.path.join(DOWNLOADS_DIR, PLAYLIST_SUBDIR)
+        PL_DOWNLOADS_DIR = os.path.join(downloads_dir, PLAYLIST_SUBDIR)
         if os.path.exists(PL_DOWNLOADS_DIR):
             msg = f'Directory {PL_DOWNLOADS_DIR} already exists'
             print(msg)
@@ -85,6 +104,10 @@ class YtDownload:
         else:
             os.mkdir(PL_DOWNLOADS_DIR)
 
+        if workers > 1:
+            # only urls, `pl.videos` would request metadata of videos one by one
+            return cls.download_concurrently(PL_DOWNLOADS_DIR, list(pl.video_urls), workers, metadata_workers, max_bandwidth, index)
+
         for idx, video in enumerate(pl.videos):
             try:
                 video.register_on_progress_callback(on_progress)
@@ -103,6 +126,93 @@ class YtDownload:
 
             time.sleep(pause_between_downloads) # pause before downloading the next video
 
+    @classmethod
+    def download_concurrently(cls, downloads_dir: str, urls: list, workers: int=4, metadata_workers: int=8,
+                              max_bandwidth: float=None, index: 'DownloadIndex'=None) -> dict:
+        '''
+        download videos with a pool of workers instead of one by one with pauses
+
+        metadata of streams (the best progressive mp4 and its size) is requested concurrently
+        by `metadata_workers` threads, every video is passed to the download pool as soon as its metadata is known;
+        the progress of all downloads is printed in one line
+
+        in:
+            downloads_dir, str - directory for saving video; must already exist
+            urls, list - list of videos url
+            workers, int - number of concurrent downloads
+            metadata_workers, int - number of concurrent requests of metadata
+            max_bandwidth, float - total download speed limit in bytes per second, None for no limit;
+                pytube's chunk size is decreased, so the limit is applied smoothly
+            index, DownloadIndex - a video known by its id and stream is hardlinked from another directory
+                (for example, of another playlist) instead of downloading; downloaded videos are indexed
+        out: dict - numbers of downloaded, skipped, reused and failed videos, bytes and errors by url
+        '''
+        progress = DownloadProgress(len(urls))
+        limiter = BandwidthLimiter(max_bandwidth) if max_bandwidth else None
+        default_range_size = request.default_range_size
+        if limiter is not None:
+            # callbacks are called after every chunk, 4 chunks per second of the limit
+            request.default_range_size = max(64 * 1024, min(request.default_range_size, int(max_bandwidth / 4)))
+
+        def on_chunk(stream, chunk: bytes, bytes_remaining: int):
+            progress.add_chunk(len(chunk))
+            if limiter is not None:
+                limiter.consume(len(chunk))
+
+        def prefetch(url: str):
+            yt = YouTube(url, on_progress_callback=on_chunk)
+            stream = yt.streams.filter(mime_type='video/mp4', progressive=True).order_by('resolution').desc().first()
+            if stream is None:
+                raise ValueError(f'No progressive mp4 stream for {url}')
+            progress.add_video(stream.filesize)
+            return yt, stream
+
+        def download(yt: YouTube, stream) -> str:
+            path = stream.get_file_path(output_path=downloads_dir)
+            if stream.exists_at_path(path):
+                return 'skipped'
+            source = f'youtube:{yt.video_id}:{stream.itag}'
+            if index is not None and index.reuse(source, path):
+                return 'reused'
+            stream.download(output_path=downloads_dir, filename_prefix=None, skip_existing=True)
+            if index is not None:
+                index.add(path, source=source)
+            return 'downloaded'
+
+        errors = {}
+        try:
+            with ThreadPoolExecutor(metadata_workers) as metadata_pool, ThreadPoolExecutor(workers) as download_pool:
+                prefetched = {metadata_pool.submit(prefetch, url): url for url in urls}
+                downloads = {}
+                for future in as_completed(prefetched):
+                    try:
+                        downloads[download_pool.submit(download, *future.result())] = prefetched[future]
+                    except Exception as ex:
+                        errors[prefetched[future]] = ex
+                        progress.finish_video('failed')
+
+                for future in as_completed(downloads):
+                    try:
+                        progress.finish_video(future.result())
+                    except Exception as ex:
+                        errors[downloads[future]] = ex
+                        progress.finish_video('failed')
+        finally:
+            # the chunk size is global in pytube, other downloads must not be slowed down
+            request.default_range_size = default_range_size
+        print()
+
+        for url, ex in errors.items():
+            print(f'{url}: {ex=}')
+        return {
+            'downloaded'    : progress.downloaded,
+            'skipped'       : progress.skipped,
+            'reused'        : progress.reused,
+            'failed'        : progress.failed,
+            'bytes'         : progress.bytes_done,
+            'errors'        : errors,
+        }
+
 
 if __name__ == '__main__':
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -119,6 +229,15 @@ if __name__ == '__main__':
     #     pause_between_downloads=3
     # )
 
+    # or concurrently, with the total speed limit of 5 MB/s
+
+    # yt.download_playlist(
+    #     downloads_dir=DOWNLOADS_DIR,
+    #     pl_url=PLAYLIST_URL,
+    #     workers=4,
+    #     max_bandwidth=5 * 2**20
+    # )
+
     # or
 
     # <download videos>
@@ -0,0 +1,295 @@
+# segmented downloader: a large file is fetched by byte ranges over several connections and can be resumed
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import requests
+
+from etltools.additions.logger import Logger
+
+if TYPE_CHECKING:
+    from etltools.additions.download_index import DownloadIndex
+
+
+class DownloaderError(Exception):
+    pass
+
+
+class DownloadState:
+    '''
+    state of one download, shared by the threads of its segments and saved into `<path>.part.json`:
+    url, size and validator of the remote file and segments [first byte, last byte, number of downloaded bytes]
+    '''
+    def __init__(self, path: str, interval: float=1.0):
+        '''
+        in:
+            path, str - state file name
+            interval, float (in seconds) - how often the state is saved
+        '''
+        self.path = path
+        self.interval = interval
+        self.data = None
+        self.lock = threading.Lock()
+        self._save_time = 0.0
+
+    def save(self, force: bool=False):
+        '''
+        write the state file, not more often than every `interval` seconds; the caller holds `lock`
+        '''
+        now = time.monotonic()
+        if not force and now - self._save_time < self.interval:
+            return
+        self._save_time = now
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.data, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SegmentedDownloader(Logger):
+    '''
+    downloader of large files by byte ranges in parallel connections
+
+    the file is written into `<path>.part`, the progress of every segment is saved into `<path>.part.json`,
+    so an interrupted download continues from the saved offsets (if the remote file has the same size and
+    validator, ETag or Last-Modified); at the end the size and the checksum are verified and the file
+    is renamed to `path`; servers without range requests are downloaded over one connection
+
+    the state of a download is kept in `DownloadState`, so one downloader can be used by several threads
+    for different files
+
+    :Example:
+
+    >>> downloader = SegmentedDownloader(segments=8)
+    >>> downloader.download('https://www.somehost.com/data/items.csv.gz', '/data/items.csv.gz', checksum='sha256:9f86d0...')
+    '/data/items.csv.gz'
+    '''
+    PART_SUFFIX = '.part'
+    STATE_SUFFIX = '.part.json'
+
+    def __init__(self, segments: int=4, min_segment_size: int=1024*1024, chunk_size: int=256*1024,
+                 attempts_total: int=5, pause_duration: float=1.0, timeout: float=30, headers: dict=None,
+                 state_interval: float=1.0):
+        '''
+        in:
+            segments, int - maximum number of parallel connections
+            min_segment_size, int - minimum size of one segment in bytes, small files have less segments
+            chunk_size, int - size of chunks read from a connection
+            attempts_total, int - number of attempts to download one segment
+            pause_duration, float (in seconds) - pause before the second attempt, doubled for every next one
+            timeout, float (in seconds) - timeout of connecting and reading
+            headers, dict - additional request headers, for example User-Agent
+            state_interval, float (in seconds) - how often the progress is saved
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.attempts_total = attempts_total
+        self.pause_duration = pause_duration
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.state_interval = state_interval
+
+    def download(self, url: str, path: str, expected_size: int=None, checksum: str=None, index: 'DownloadIndex'=None) -> str:
+        '''
+        download `url` into `path`, continue the previous interrupted download if it exists
+
+        in:
+            url, str
+            path, str - target file name
+            expected_size, int - verify the size of the file
+            checksum, str - verify the checksum of the file, '<algorithm>:<hex digest>', for example 'sha256:9f86d0...'
+            index, DownloadIndex - reuse a file already downloaded from `url` if it is verified and the remote file
+                has the same size and validator, index the downloaded file
+        out: path, str
+        '''
+        part_path = path + self.PART_SUFFIX
+        state = DownloadState(path + self.STATE_SUFFIX, self.state_interval)
+
+        reused = index is not None and index.reuse(url, path)
+        if reused:
+            try:
+                self._verify(path, expected_size, checksum, state)
+            except DownloaderError as ex:
+                self.logger.warning(self.log_msg(f'Known content is not verified, download it : {url=}, {path=}, {ex=}'))
+                reused = False
+
+        size, validator, ranges = self._probe(url)
+        if expected_size is not None and size is not None and size != expected_size:
+            raise DownloaderError(f'Remote size {size} differs from expected size {expected_size} : {url=}')
+
+        if reused:
+            # without the validator of the remote file only its size can be compared
+            if (size is None or size == os.path.getsize(path)) and (validator is None or validator == index.validator(url)):
+                self.logger.info(self.log_msg(f'Known content is reused, not downloaded : {url=}, {path=}'))
+                return path
+            self.logger.info(self.log_msg(f'The remote file is changed, known content is downloaded again : {url=}, {path=}'))
+
+        start = time.perf_counter()
+        if size and ranges:
+            self._load_state(state, url, size, validator, part_path)
+            self._download_segments(url, part_path, state)
+        else:
+            self.logger.info(self.log_msg(f'Range requests are not supported, download over one connection : {url=}'))
+            self._download_whole(url, part_path)
+
+        self._verify(part_path, size if size is not None else expected_size, checksum, state)
+        os.replace(part_path, path)
+        state.remove()
+        if index is not None:
+            index.add(path, source=url, validator=validator)
+        self.logger.info(self.log_msg(f'Downloaded {os.path.getsize(path)} bytes in {time.perf_counter() - start:.3f} s : {url=}, {path=}'))
+        return path
+
+    def _get(self, url: str, headers: dict=None, **kwargs) -> requests.Response:
+        return requests.get(url, headers=self.headers | (headers or {}), timeout=self.timeout, **kwargs)
+
+    def _probe(self, url: str) -> tuple:
+        '''
+        out: (size or None, validator or None, bool - the server supports range requests)
+        '''
+        try:
+            response = self._get(url, {'Range': 'bytes=0-0'}, stream=True)
+            response.close()
+        except requests.RequestException as ex:
+            raise DownloaderError(f'Error requesting {url=}') from ex
+
+        # a weak ETag can't be used in `If-Range`, Last-Modified is preferred to it
+        etag = response.headers.get('ETag')
+        if etag and etag.startswith('W/'):
+            validator = response.headers.get('Last-Modified') or etag
+        else:
+            validator = etag or response.headers.get('Last-Modified')
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '') # 'bytes 0-0/12345'
+            total = content_range.rpartition('/')[2]
+            return (int(total), validator, True) if total.isdigit() else (None, validator, False)
+        if response.status_code == 200:
+            length = response.headers.get('Content-Length')
+            return (int(length) if length and length.isdigit() else None), validator, False
+        raise DownloaderError(f'Error requesting {url=}, status code={response.status_code}')
+
+    def _load_state(self, state: DownloadState, url: str, size: int, validator: str, part_path: str):
+        '''
+        load the saved state of the same remote file or create a new state with the file split into segments
+        '''
+        try:
+            with open(state.path) as f:
+                data = json.load(f)
+            if (data['url'], data['size'], data['validator']) == (url, size, validator) and os.path.exists(part_path):
+                done = sum(segment[2] for segment in data['segments'])
+                self.logger.info(self.log_msg(f'Resume download from {done}/{size} bytes : {url=}'))
+                state.data = data
+                return
+            self.logger.info(self.log_msg(f'The remote file is changed, download from the beginning : {url=}'))
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as ex:
+            self.logger.warning(self.log_msg(f'Incorrect state file {state.path}, download from the beginning, {ex=}'))
+
+        segments_total = max(1, min(self.segments, size // self.min_segment_size))
+        bounds = [size * n // segments_total for n in range(segments_total + 1)]
+        state.data = {
+            'url'       : url,
+            'size'      : size,
+            'validator' : validator,
+            # [first byte, last byte, number of downloaded bytes]
+            'segments'  : [[bounds[n], bounds[n + 1] - 1, 0] for n in range(segments_total)],
+        }
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+
+    def _download_segments(self, url: str, part_path: str, state: DownloadState):
+        segments = [segment for segment in state.data['segments'] if segment[0] + segment[2] <= segment[1]]
+        try:
+            with ThreadPoolExecutor(max(1, len(segments))) as pool:
+                for future in [pool.submit(self._download_segment, url, part_path, segment, state) for segment in segments]:
+                    future.result()
+        finally:
+            with state.lock:
+                state.save(force=True)
+
+    def _download_segment(self, url: str, part_path: str, segment: list, state: DownloadState):
+        '''
+        download the rest of the segment, repeat on errors from the last written byte
+        '''
+        for attempt in range(self.attempts_total):
+            offset = segment[0] + segment[2]
+            if offset > segment[1]:
+                return
+            headers = {'Range': f'bytes={offset}-{segment[1]}'}
+            validator = state.data['validator']
+            if validator and not validator.startswith('W/'):
+                headers['If-Range'] = validator # the whole file (200) if it is changed
+            try:
+                with self._get(url, headers, stream=True) as response:
+                    if response.status_code != 206:
+                        raise DownloaderError(f'Range request failed, status code={response.status_code} : {url=}')
+                    with open(part_path, 'r+b') as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(self.chunk_size):
+                            chunk = chunk[:segment[1] + 1 - offset]
+                            f.write(chunk)
+                            f.flush() # the state never counts bytes which are not written
+                            offset += len(chunk)
+                            with state.lock:
+                                segment[2] += len(chunk)
+                                state.save()
+                if offset <= segment[1]:
+                    raise DownloaderError(f'Connection closed at {offset} of segment {segment[0]}-{segment[1]} : {url=}')
+                return
+            except (requests.RequestException, DownloaderError) as ex:
+                if attempt == self.attempts_total - 1:
+                    self.logger.error(self.log_msg(f'Error downloading segment {segment[0]}-{segment[1]}, {ex=}'))
+                    raise DownloaderError(f'Error downloading segment {segment[0]}-{segment[1]} : {url=}') from ex
+                pause = self.pause_duration * 2 ** attempt
+                self.logger.warning(self.log_msg(f'Error downloading segment {segment[0]}-{segment[1]}, repeat in {pause} s, {ex=}'))
+                time.sleep(pause)
+
+    def _download_whole(self, url: str, part_path: str):
+        for attempt in range(self.attempts_total):
+            try:
+                with self._get(url, stream=True) as response:
+                    if response.status_code != 200:
+                        raise DownloaderError(f'Error downloading {url=}, status code={response.status_code}')
+                    with open(part_path, 'wb') as f:
+                        for chunk in response.iter_content(self.chunk_size):
+                            f.write(chunk)
+                return
+            except (requests.RequestException, DownloaderError) as ex:
+                if attempt == self.attempts_total - 1:
+                    raise DownloaderError(f'Error downloading {url=}') from ex
+                pause = self.pause_duration * 2 ** attempt
+                self.logger.warning(self.log_msg(f'Error downloading {url=}, repeat in {pause} s, {ex=}'))
+                time.sleep(pause)
+
+    def _verify(self, part_path: str, size: int, checksum: str, state: DownloadState):
+        actual_size = os.path.getsize(part_path)
+        if size is not None and actual_size != size:
+            raise DownloaderError(f'Size of {part_path} is {actual_size}, expected {size}')
+        if checksum is None:
+            return
+
+        algorithm, _, expected = checksum.partition(':')
+        try:
+            digest = hashlib.new(algorithm)
+        except ValueError as ex:
+            raise DownloaderError(f'Unknown checksum algorithm : {checksum=}') from ex
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != expected.lower():
+            # the data is wrong, it can't be resumed
+            os.remove(part_path)
+            state.remove()
+            raise DownloaderError(f'Checksum mismatch of {part_path} : {algorithm}:{digest.hexdigest()}, expected {checksum}')
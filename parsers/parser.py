@@ -1,17 +1,13 @@
 # Parser implementation
 
+# `requests` and `UserAgent` (with `psycopg2`) are imported in `get_html()`,
+# so processes which don't download pages start faster
+
 import copy
-import logging
-import logging.config
 import os
-import subprocess
 import time
 
-import requests
-
 from etltools.additions.logger import Logger
-from etltools.local_settings import parsers_config
-from etltools.parsers.user_agent import UserAgent, UserAgentError
 
 
 class ParserError(Exception):
@@ -70,6 +66,9 @@ class Parser(Logger):
             True - successfully downloaded html
             False - error while downloading html
         '''
+        import requests
+        from etltools.parsers.user_agent import UserAgent, UserAgentError
+
         self.html = None
         self.err_msg = None
 
@@ -141,6 +140,48 @@ class Parser(Logger):
         else:
             return False # error while downloading html
 
+    def process_queue(self, job_queue: 'PgJobQueue', handler=None, batch_size: int=10, idle_timeout: float=None, **kwargs) -> int:
+        '''
+        download pages of urls from the job queue (jobs with payload `{'url': ...}`) and process them;
+        parsers on any number of nodes can process the same queue
+
+        in:
+            job_queue, PgJobQueue - queue of urls
+            handler, callable(job) - process `self.html` of the job, `parse_item_page_html()` if None;
+                a job is done if the handler does not raise an exception
+            batch_size, int - number of jobs claimed at once
+            idle_timeout, float (in seconds) - stop when there are no jobs during this time, None - never stop
+            kwargs - arguments for `get_html()`
+
+        out: number of processed jobs, int
+        '''
+        processed = 0
+        while True:
+            jobs = job_queue.claim(batch_size, wait=idle_timeout if idle_timeout is not None else job_queue.POLL_INTERVAL)
+            if not jobs:
+                if idle_timeout is not None:
+                    break
+                continue
+
+            for job in jobs:
+                try:
+                    if not self.get_html(job.payload['url'], **kwargs):
+                        job_queue.fail([job], error=f'Error downloading html : {self.err_msg}')
+                        continue
+                    if handler is None:
+                        self.parse_item_page_html()
+                    else:
+                        handler(job)
+                except Exception as ex:
+                    self.logger.exception(self.log_msg(f'Error processing {job=}, {ex=}'))
+                    job_queue.fail([job], error=repr(ex))
+                else:
+                    job_queue.ack([job])
+                    processed += 1
+
+        self.logger.info(self.log_msg(f'{processed} jobs processed from {job_queue.queue=}'))
+        return processed
+
     def get_html_from_file(self, file_name: str) -> bool:
         '''
         read local file and store its content in self.html
@@ -1,14 +1,12 @@
 # UserAgent implementation
 
-import logging
-import logging.config
+import functools
 import os
+import re
 
 from psycopg2.extensions import quote_ident
 
 from etltools.additions.logger import Logger
-from etltools.local_settings import parsers_config
-from etltools.local_settings import test_config
 from etltools.pg_tools.db_config import DBConfig
 from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
 
@@ -17,6 +15,151 @@ class UserAgentError(Exception):
     pass
 
 
+# number of tab delimited values in the User-Agent text files : `title	version	os_type	hardware	popularity`
+USER_AGENT_FIELDS_TOTAL = 5
+
+
+def _parse_user_agents_file(file_name: str) -> tuple:
+    '''
+    read one text file with User-Agents and parse it into rows for the `user_agent` table
+    this function is executed in the worker processes, so it must be defined at the module level
+
+    in: file_name, str - full file name, for example `/some/path/Chrome.txt`
+
+    out: (rows, lines, errors), tuple
+        rows, list - tuples (software, title, version, os_type, hardware, popularity)
+        lines, int - total number of lines in the file
+        errors, int - total number of lines with incorrect format
+    '''
+    software = os.path.basename(file_name).removesuffix('.txt')
+    rows = []
+    lines = 0
+    errors = 0
+
+    with open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            lines += 1
+            user_agent_data = line.strip().split('\t')
+            if len(user_agent_data) != USER_AGENT_FIELDS_TOTAL:
+                errors += 1
+                continue
+            rows.append((software, *user_agent_data))
+
+    return rows, lines, errors
+
+
+class UserAgentClassifier:
+    '''
+    derive software, version, os and hardware from a raw User-Agent string, for example from access logs
+
+    all patterns are compiled once at the class level and every pattern is guarded by a cheap substring check,
+    so most of the patterns are never executed for a given string; results for repeated strings
+    are taken from a bounded LRU cache
+
+    :Example:
+
+    >>> classifier = UserAgentClassifier()
+    >>> classifier.classify('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:66.0) Gecko/20100101 Firefox/66.0')
+    ('Firefox', '66', 'Windows', 'Computer')
+    '''
+    # software is returned when the User-Agent can't be classified
+    UNKNOWN = None
+
+    # (software, substrings to check before the pattern, pattern with the major version in the first matched group)
+    # the order is important: for example, Edge and Opera strings also contain `Chrome/` and `Safari/`
+    SOFTWARE_RULES = (
+        # `bot` is a separate word or ends a name with a version or a suffix (`Googlebot/2.1`, `AdsBot-Google`),
+        # not a part of a word as in the phone brands `Cubot` and `Abbot`
+        ('Crawler', ('bot', 'Bot', 'crawl', 'spider', 'Slurp'),
+            re.compile(r'(?:\b[Bb]ot\b|[Bb]ot(?=[/;)_-]|$)|crawler|spider|Slurp)(?:[/ ]v?(\d+))?')),
+        ('Edge', ('Edg',), re.compile(r'Edg(?:e|A|iOS)?/(\d+)')),
+        ('Opera', ('OPR/', 'Opera'), re.compile(r'OPR/(\d+)|Opera.*Version/(\d+)|Opera[/ ](\d+)')),
+        ('Yandex Browser', ('YaBrowser/',), re.compile(r'YaBrowser/(\d+)')),
+        ('Samsung Internet', ('SamsungBrowser/',), re.compile(r'SamsungBrowser/(\d+)')),
+        ('Firefox', ('Firefox/', 'FxiOS/'), re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+        ('Chrome', ('Chrome/', 'CriOS/'), re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+        ('Internet Explorer', ('MSIE', 'Trident/'), re.compile(r'MSIE (\d+)|Trident/.*rv:(\d+)')),
+        ('Safari', ('Safari/',), re.compile(r'Version/(\d+).*Safari/')),
+    )
+
+    # (os, substrings), the first matched rule wins; iOS strings contain `like Mac OS X`, Android strings contain `Linux`
+    OS_RULES = (
+        ('Windows', ('Windows', 'Win64', 'Win32')),
+        ('Android', ('Android',)),
+        ('iOS', ('iPhone', 'iPad', 'iPod')),
+        ('Chrome OS', ('CrOS',)),
+        ('macOS', ('Macintosh', 'Mac OS X')),
+        ('Linux', ('Linux', 'X11')),
+    )
+
+    # (hardware, substrings), `Computer` by default
+    HARDWARE_RULES = (
+        ('Large Screen - TV', ('SMART-TV', 'SmartTV', 'Smart-TV', 'Web0S', 'AppleTV', 'GoogleTV', 'BRAVIA')),
+        ('Mobile - Tablet', ('iPad', 'Tablet')),
+        ('Mobile - Phone', ('Mobile', 'iPhone', 'iPod', 'Windows Phone')),
+        ('Mobile - Tablet', ('Android',)), # Android devices without `Mobile` token are tablets
+    )
+    DEFAULT_HARDWARE = 'Computer'
+
+    def __init__(self, cache_size: int=2**16):
+        '''
+        in: cache_size, int - maximum number of distinct User-Agent strings in the LRU cache
+        '''
+        self.classify = functools.lru_cache(maxsize=cache_size)(self._classify)
+
+    @classmethod
+    def _classify(cls, user_agent: str) -> tuple:
+        '''
+        classify one User-Agent string without cache
+
+        in: user_agent, str - raw User-Agent string
+
+        out: (software, version, os, hardware), tuple
+            software is `UserAgentClassifier.UNKNOWN` if the User-Agent can't be classified,
+            version and os are None if they can't be derived
+        '''
+        software = cls.UNKNOWN
+        version = None
+        for name, tokens, pattern in cls.SOFTWARE_RULES:
+            if any(token in user_agent for token in tokens) and (match := pattern.search(user_agent)):
+                software = name
+                version = next((group for group in match.groups() if group), None)
+                break
+
+        os_type = None
+        for name, tokens in cls.OS_RULES:
+            if any(token in user_agent for token in tokens):
+                os_type = name
+                break
+
+        hardware = cls.DEFAULT_HARDWARE
+        for name, tokens in cls.HARDWARE_RULES:
+            if any(token in user_agent for token in tokens):
+                hardware = name
+                break
+
+        return software, version, os_type, hardware
+
+    def classify_many(self, user_agents):
+        '''
+        classify many User-Agent strings
+
+        in: user_agents, iterable of str - for example, an opened access log file with one User-Agent per line
+
+        out: generator of (title, software, version, os, hardware) tuples, title is the stripped User-Agent string
+        '''
+        classify = self.classify
+        for user_agent in user_agents:
+            title = user_agent.strip()
+            yield (title, *classify(title))
+
+    def cache_info(self):
+        '''
+        LRU cache statistics : hits, misses, maxsize, currsize
+        '''
+        return self.classify.cache_info()
+
+
 class UserAgent(Logger):
     # User-Agent is returned by default if there is no database connection
     DEFAULT_USER_AGENT_TITLE = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.88 Safari/537.36'
@@ -26,6 +169,9 @@ class UserAgent(Logger):
     ERRORS_FIELD = 'errors'         # status code = 429
     UPDATE_TZ_FIELD = 'update_tz'   # status code not in (200, 429) or other error while HTTP request
 
+    # hot queries are prepared on the server after this number of executions on the same (pooled) connection
+    PREPARE_THRESHOLD = 5
+
     def __init__(self, config: DBConfig):
         super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
 
@@ -52,7 +198,7 @@ class UserAgent(Logger):
         if self._title is None:
             query = "SELECT title FROM user_agent WHERE hardware='Computer' ORDER BY update_tz NULLS FIRST, title LIMIT 1;"
             try:
-                with PgConnector(self._config) as db:
+                with PgConnector(self._config, prepare_threshold=self.__class__.PREPARE_THRESHOLD, read_only=True) as db:
                     self._title = db.execute(query)[0][0]
                 self.logger.info(self.log_msg(f'New User-Agent received : {self._title}'))
             except PgConnectorError as ex:
@@ -101,7 +247,7 @@ class UserAgent(Logger):
             return
 
         try:
-            with PgConnector(self._config) as db:
+            with PgConnector(self._config, prepare_threshold=self.__class__.PREPARE_THRESHOLD) as db:
                 if field_name in (self.__class__.SUCCESSES_FIELD, self.__class__.ERRORS_FIELD):
                     query = 'UPDATE user_agent SET {field_name}={field_name}+1 WHERE title=%s;'.format(field_name=quote_ident(field_name, db._conn))
                 else: # field_name == self.__class__.UPDATE_TZ_FIELD:
@@ -157,7 +303,7 @@ class UserAgent(Logger):
         query = 'SELECT user_agent_insert_func(%s, %s, %s, %s, %s, %s);'
 
         try:
-            with PgConnector(self._config) as db:
+            with PgConnector(self._config, prepare_threshold=self.__class__.PREPARE_THRESHOLD) as db:
                 fnames = os.listdir(dir_name)
 
                 # for each file in the given directory
@@ -210,3 +356,195 @@ class UserAgent(Logger):
 
         self.logger.info(self.log_msg(f'Total stats for all processed files: {total_stats=}'))
         return total_stats.copy()
+
+    def bulk_insert_user_agents_from_files(self, dir_name: str, workers: int=None) -> dict:
+        '''
+        insert User-Agents from text files into the database using `COPY` instead of one query per line
+
+        text files are parsed in parallel processes, all valid lines are streamed with `COPY` into a temporary
+        staging table and then merged into the `user_agent` table with one `INSERT ... ON CONFLICT DO NOTHING`;
+        the format of the text files is the same as for `insert_user_agents_from_files()`
+
+        in:
+            dir_name, str - absolute path to the directory with User-Agents text files
+            workers, int - number of processes to parse text files, defaults to the number of processors
+
+        out:
+            total_stats {
+                'lines'     : 0, # total number of lines in all files
+                'successes' : 0, # total number of successful inserts into the database
+                'passes'    : 0, # total number of passes - if we already have the same User-Agent in the database
+                'errors'    : 0, # total number of lines with incorrect format in the files
+            }, dict
+        '''
+        self.logger.info(self.log_msg('Started bulk import from text files into the database'))
+
+        if not os.path.exists(dir_name):
+            msg = f"Path doesn't exist : {dir_name=}"
+            self.logger.error(self.log_msg(msg))
+            raise UserAgentError(msg)
+
+        total_stats = {
+            'lines'     : 0,
+            'successes' : 0,
+            'passes'    : 0,
+            'errors'    : 0,
+        }
+
+        from concurrent.futures import ProcessPoolExecutor # `multiprocessing` is imported only for the bulk import
+
+        try:
+            fnames = os.listdir(dir_name)
+
+            with PgConnector(self._config) as db, ProcessPoolExecutor(max_workers=workers) as executor:
+                self._create_stage_table(db)
+
+                line_no = 0
+                futures = [executor.submit(_parse_user_agents_file, os.path.join(dir_name, fname)) for fname in fnames]
+
+                # for each file in the given directory; results are received in the order of files
+                for idx, (fname, future) in enumerate(zip(fnames, futures)):
+                    print(f'{idx+1}/{len(fnames)} : {fname=}', end='')
+                    try:
+                        rows, lines, errors = future.result()
+                    except Exception as ex:
+                        self.logger.error(self.log_msg(f'Error reading data from file {fname=}, {ex=}'))
+                        print(f' - error')
+                        continue
+
+                    if errors:
+                        self.logger.warning(self.log_msg(f'Incorrect input data format in file `{fname}`. Expected five tab delimited values in {errors} lines'))
+
+                    line_no = self._copy_to_stage_table(db, rows, line_no)
+
+                    total_stats['lines'] += lines
+                    total_stats['errors'] += errors
+
+                    print(f' - ok, {lines=}, {errors=}')
+                    self.logger.info(self.log_msg(f'For file `{fname}`: {lines=}, {errors=}'))
+
+                total_stats['successes'] = self._merge_stage_table(db)
+                db.commit()
+
+            total_stats['passes'] = line_no - total_stats['successes']
+
+        # we don't need to analyze errors separately here
+        except Exception as ex:
+            self.logger.exception(self.log_msg(ex))
+            raise UserAgentError('Error') from ex
+
+        self.logger.info(self.log_msg(f'Total stats for all processed files: {total_stats=}'))
+        return total_stats.copy()
+
+    def bulk_insert_raw_user_agents(self, user_agents, classifier: UserAgentClassifier=None, batch_size: int=100_000) -> dict:
+        '''
+        classify raw User-Agent strings (for example, from access logs) and insert them into the database using `COPY`
+
+        in:
+            user_agents, iterable of str - raw User-Agent strings, for example, an opened file with one User-Agent per line
+            classifier, UserAgentClassifier - classifier to derive software, version, os and hardware;
+                a new classifier with default cache size is used if None
+            batch_size, int - number of rows sent to the database with one `COPY`
+
+        out:
+            total_stats {
+                'lines'     : 0, # total number of User-Agent strings
+                'successes' : 0, # total number of successful inserts into the database
+                'passes'    : 0, # total number of passes - if we already have the same User-Agent in the database
+                'errors'    : 0, # total number of empty or not classified User-Agent strings
+            }, dict
+        '''
+        self.logger.info(self.log_msg('Started bulk import of raw User-Agent strings into the database'))
+
+        if classifier is None:
+            classifier = UserAgentClassifier()
+
+        total_stats = {
+            'lines'     : 0,
+            'successes' : 0,
+            'passes'    : 0,
+            'errors'    : 0,
+        }
+
+        try:
+            with PgConnector(self._config) as db:
+                self._create_stage_table(db)
+
+                line_no = 0
+                rows = []
+                for title, software, version, os_type, hardware in classifier.classify_many(user_agents):
+                    total_stats['lines'] += 1
+                    if not title or software is classifier.UNKNOWN:
+                        total_stats['errors'] += 1
+                        continue
+
+                    # there is no information about popularity in the raw User-Agent strings
+                    rows.append((software, title, version, os_type, hardware, None))
+                    if len(rows) >= batch_size:
+                        line_no = self._copy_to_stage_table(db, rows, line_no)
+                        rows = []
+                line_no = self._copy_to_stage_table(db, rows, line_no)
+
+                total_stats['successes'] = self._merge_stage_table(db)
+                db.commit()
+
+            total_stats['passes'] = line_no - total_stats['successes']
+        except Exception as ex:
+            self.logger.exception(self.log_msg(ex))
+            raise UserAgentError('Error') from ex
+
+        self.logger.info(self.log_msg(f'Total stats for raw User-Agent strings: {total_stats=}, {classifier.cache_info()=}'))
+        return total_stats.copy()
+
+    def _create_stage_table(self, db: PgConnector):
+        '''
+        create temporary staging table for bulk imports; the table is dropped at the end of the transaction
+        '''
+        # `line_no` keeps the order of lines in all files, so that the first copy of the User-Agent is inserted
+        # and new `user_agent_id` values are generated in the same order as in `insert_user_agents_from_files()`
+        db.execute(
+            'CREATE TEMP TABLE user_agent_stage ('
+            '  line_no BIGINT, software TEXT, title TEXT, version TEXT, os TEXT, hardware TEXT, popularity TEXT'
+            ') ON COMMIT DROP;'
+        )
+
+    def _copy_to_stage_table(self, db: PgConnector, rows: list, line_no: int) -> int:
+        '''
+        stream rows (software, title, version, os, hardware, popularity) into the staging table with `COPY`
+
+        in:
+            db, PgConnector - opened connection
+            rows, list - rows to copy
+            line_no, int - number of the last line copied before
+
+        out: number of the last copied line, int
+        '''
+        db.copy_in(
+            'user_agent_stage'
+            , ('line_no', 'software', 'title', 'version', 'os', 'hardware', 'popularity')
+            , ((line_no + idx, *row) for idx, row in enumerate(rows, start=1))
+        )
+        line_no += len(rows)
+
+        return line_no
+
+    def _merge_stage_table(self, db: PgConnector) -> int:
+        '''
+        insert all new User-Agents from the staging table into the `user_agent` table with one query
+
+        out: number of inserted User-Agents, int
+        '''
+        result = db.execute(
+            'WITH cte AS ('
+            '  INSERT INTO user_agent (software, title, version, os, hardware, popularity)'
+            '  SELECT software, title, version, os, hardware, popularity'
+            '  FROM (SELECT DISTINCT ON (title) * FROM user_agent_stage ORDER BY title, line_no) AS stage'
+            '  ORDER BY line_no'
+            '  ON CONFLICT (title) DO NOTHING'
+            '  RETURNING user_agent_id'
+            ') SELECT COUNT(*) FROM cte;'
+        )
+        if result is None:
+            raise UserAgentError('Error merging User-Agents from the staging table')
+
+        return result[0][0]
@@ -1,4 +1,7 @@
+import math
 import re
+import unicodedata
+from dataclasses import dataclass
 
 
 class Utils:
@@ -6,6 +9,11 @@ class Utils:
     some utilities for cleaning and transforming text data
     '''
 
+    SPACES_RE = re.compile(r'\s+')
+    INT_RE = re.compile(r'[0-9]{1,3}(?:\s[0-9]{3})*')
+    # normalizers of `normalize_many()`, 'int' changes the type, so it can be only the last one
+    NORMALIZERS = ('strip', 'spaces', 'lower', 'nfc', 'nfkc', 'int')
+
     @classmethod
     def clear_string_from_spaces(self, line: str) -> str:
         '''
@@ -16,7 +24,7 @@ class Utils:
         :return: processed string
         :rtype: str
         '''
-        return re.sub(r'\s+', ' ', line.strip())
+        return self.SPACES_RE.sub(' ', line.strip())
 
     @classmethod
     def str_to_int(cls, line: str) -> int:
@@ -35,8 +43,261 @@ class Utils:
         str_to_int('1  230') -> None
         '''
         try:
-            if not isinstance(line, (str,)) or not re.match(r'^[0-9]{1,3}(\s[0-9]{3})*$', line.strip()):
+            if not isinstance(line, (str,)) or not cls.INT_RE.fullmatch(line.strip()):
                 raise ValueError()
-            return int(re.sub(r'\s+', '', line))
+            return int(cls.SPACES_RE.sub('', line))
         except:
             return None
+
+    @classmethod
+    def normalize_many(cls, values, normalizers: tuple=('spaces',)) -> tuple:
+        '''
+        apply the chain of normalizers to all values of a column in one call
+
+        in:
+            values - list, tuple or other iterable of str, numpy.ndarray or pandas.Series
+            normalizers, tuple - names of normalizers, applied in the given order:
+                'strip' - delete leading and trailing spaces
+                'spaces' - the same as `clear_string_from_spaces()`
+                'lower' - convert into lower case
+                'nfc', 'nfkc' - unicode normalization
+                'int' - the same as `str_to_int()`, only the last one
+        out: (results, mask)
+            for lists: results are a list with None for invalid values, mask is a list of bools
+            for NumPy and pandas: results are an array or a Series (int64 with 0 for invalid values after 'int',
+            otherwise None for invalid values), mask is a NumPy bool array
+            values which aren't str or can't be converted by 'int' are invalid, for NumPy and pandas
+            also numbers above the int64 range
+
+        :Example:
+
+        >>> Utils.normalize_many([' 1  234 ', 'abc', None], ('spaces', 'int'))
+        ([1234, None, None], [True, False, False])
+        '''
+        unknown = [name for name in normalizers if name not in cls.NORMALIZERS]
+        if unknown:
+            raise ValueError(f'Unknown normalizers : {unknown}, use {cls.NORMALIZERS}')
+        if 'int' in normalizers[:-1]:
+            raise ValueError("The 'int' normalizer can be only the last one")
+
+        if hasattr(values, 'str') and hasattr(values, 'index'):
+            return cls._normalize_series(values, normalizers)
+        if hasattr(values, 'dtype') and hasattr(values, 'tolist'):
+            return cls._normalize_numpy(values, normalizers)
+        return cls._normalize_list(list(values), normalizers)
+
+    @classmethod
+    def _normalize_list(cls, values: list, normalizers: tuple) -> tuple:
+        mask = [isinstance(value, str) for value in values]
+        valid = all(mask)
+        column = values if valid else [value if ok else '' for value, ok in zip(values, mask)]
+
+        for name in normalizers:
+            column = cls._normalize_column(column, name)
+
+        if normalizers and normalizers[-1] == 'int':
+            mask = [ok and value is not None for value, ok in zip(column, mask)]
+            valid = all(mask)
+        if valid:
+            return column, mask
+        return [value if ok else None for value, ok in zip(column, mask)], mask
+
+    @classmethod
+    def _normalize_column(cls, column: list, name: str) -> list:
+        '''
+        one normalizer over the list of str, loops are in C where it is possible
+        '''
+        if name == 'strip':
+            return list(map(str.strip, column))
+        if name == 'spaces':
+            # `str.split()` splits by the same spaces as `\s+`, but is much faster than `re.sub()`
+            return [' '.join(value.split()) for value in column]
+        if name == 'lower':
+            return list(map(str.lower, column))
+        if name in ('nfc', 'nfkc'):
+            form = name.upper()
+            normalize = unicodedata.normalize
+            return [value if value.isascii() else normalize(form, value) for value in column]
+        if name == 'int':
+            match = cls.INT_RE.fullmatch
+            return [
+                (int(value) if value.isdigit() else int(''.join(value.split()))) if match(value) else None
+                for value in map(str.strip, column)
+            ]
+        raise ValueError(f'Unknown normalizer : {name}')
+
+    @classmethod
+    def _normalize_numpy(cls, values, normalizers: tuple) -> tuple:
+        import numpy # optional dependency, only for NumPy input
+
+        # vectorized leading 'strip' for arrays of fixed-width strings
+        index = 0
+        if values.dtype.kind == 'U':
+            strings = getattr(numpy, 'strings', numpy.char) # `numpy.strings` since NumPy 2.0
+            while index < len(normalizers) and normalizers[index] == 'strip':
+                values = strings.strip(values)
+                index += 1
+
+        results, mask = cls._normalize_list(values.tolist(), normalizers[index:])
+        if normalizers and normalizers[-1] == 'int':
+            limit = int(numpy.iinfo(numpy.int64).max)
+            mask = [ok and value <= limit for value, ok in zip(results, mask)]
+            return numpy.array([value if ok else 0 for value, ok in zip(results, mask)], dtype=numpy.int64), numpy.array(mask, dtype=bool)
+        return numpy.array(results, dtype=object), numpy.array(mask, dtype=bool)
+
+    @classmethod
+    def _normalize_series(cls, values, normalizers: tuple) -> tuple:
+        # pandas is not imported, the Series is used through its methods
+        mask = values.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+        column = values.where(mask, '').astype(object)
+
+        for name in normalizers:
+            if name == 'strip':
+                column = column.str.strip()
+            elif name == 'spaces':
+                column = column.str.split().str.join(' ')
+            elif name == 'lower':
+                column = column.str.lower()
+            elif name in ('nfc', 'nfkc'):
+                column = column.str.normalize(name.upper())
+            elif name == 'int':
+                column = column.str.strip()
+                mask = mask & column.str.fullmatch(cls.INT_RE.pattern).to_numpy(dtype=bool)
+                digits = column.str.replace(cls.SPACES_RE.pattern, '', regex=True).where(mask, '0')
+                # numbers above the int64 range are invalid, strings of digits of the same length are compared as numbers
+                significant = digits.str.lstrip('0')
+                length = significant.str.len().to_numpy()
+                limit = '9223372036854775807'
+                mask = mask & ((length < len(limit)) | ((length == len(limit)) & (significant <= limit).to_numpy(dtype=bool)))
+                return digits.where(mask, '0').astype('int64'), mask
+
+        return column.where(mask, None), mask
+
+
+@dataclass(frozen=True)
+class NumberLocale:
+    '''
+    number format: decimal separator and separators of thousands groups
+    '''
+    decimal: str = '.'
+    thousands: tuple = (',',)
+
+
+class PriceParser:
+    '''
+    parser of numbers and prices with currencies, for example '1 234,56 \u20b4', '$1,234.50' or '1.234,5 EUR'
+
+    the grammar is compiled once for the locale: an optional sign, an optional currency before or after
+    the number, digits grouped by the thousands separators (or not grouped at all) and an optional fraction
+
+    :Example:
+
+    >>> PriceParser('uk').parse('1\u00a0234,56 \u20b4')
+    (1234.56, 'UAH')
+    >>> PriceParser('en').parse('-$1,234.50')
+    (-1234.5, 'USD')
+    '''
+    LOCALES = {
+        'en'    : NumberLocale('.', (',',)),
+        'uk'    : NumberLocale(',', (' ', '\u00a0', '\u202f')),
+        'ru'    : NumberLocale(',', (' ', '\u00a0', '\u202f')),
+        'fr'    : NumberLocale(',', (' ', '\u00a0', '\u202f')),
+        'de'    : NumberLocale(',', ('.',)),
+        'ch'    : NumberLocale('.', ("'", '\u2019')),
+    }
+    # currency symbols and names, also any three capital letters are treated as an ISO 4217 code
+    CURRENCIES = {
+        '$'     : 'USD',
+        'US$'   : 'USD',
+        '\u20ac': 'EUR',
+        '\u00a3': 'GBP',
+        '\u00a5': 'JPY',
+        '\u20b4': 'UAH',
+        '\u0433\u0440\u043d': 'UAH',
+        '\u0433\u0440\u043d.': 'UAH',
+        '\u20bd': 'RUB',
+        '\u0440\u0443\u0431.': 'RUB',
+        'z\u0142': 'PLN',
+        '\u20b9': 'INR',
+        'Fr.'   : 'CHF',
+    }
+
+    def __init__(self, locale='en', currencies: dict=None):
+        '''
+        in:
+            locale, str or NumberLocale - name from `LOCALES` or a custom format
+            currencies, dict - additional currency symbols and their codes
+        '''
+        if isinstance(locale, str):
+            if locale not in self.LOCALES:
+                raise ValueError(f'Unknown locale : {locale}, use {tuple(self.LOCALES)} or NumberLocale')
+            locale = self.LOCALES[locale]
+        if locale.decimal in locale.thousands:
+            raise ValueError(f'The same decimal and thousands separator : {locale}')
+
+        self.locale = locale
+        self.currencies = {**self.CURRENCIES, **(currencies or {})}
+
+        symbols = '|'.join(re.escape(symbol) for symbol in sorted(self.currencies, key=len, reverse=True))
+        currency = rf'{symbols}|[A-Z]{{3}}'
+        thousands = '[' + ''.join(re.escape(separator) for separator in locale.thousands) + ']'
+        decimal = re.escape(locale.decimal)
+        number = rf'(?:[0-9]{{1,3}}(?:{thousands}[0-9]{{3}})+|[0-9]+)(?:{decimal}[0-9]+)?|{decimal}[0-9]+'
+        self.grammar = re.compile(
+            rf'(?P<sign>[-+\u2212])?\s*(?:(?P<before>{currency})\s*(?P<sign_after>[-+\u2212])?\s*)?'
+            rf'(?P<number>{number})(?:\s*(?P<after>{currency}))?'
+        )
+
+    def parse(self, text: str) -> tuple:
+        '''
+        in: text, str
+        out: (amount, currency) - float and currency code or None; None if the text isn't a number
+        '''
+        if not isinstance(text, str):
+            return None
+        match = self.grammar.fullmatch(text.strip())
+        if match is None:
+            return None
+
+        sign, before, sign_after, number, after = match.groups()
+        if before and after or sign and sign_after:
+            return None
+        if not number.isdigit():
+            # thousands separators are deleted, the decimal separator becomes '.', `str.replace()` is faster than `str.translate()`
+            for separator in self.locale.thousands:
+                if separator in number:
+                    number = number.replace(separator, '')
+            number = number.replace(self.locale.decimal, '.')
+        amount = float(number)
+        if (sign or sign_after) in ('-', '\u2212'):
+            amount = -amount
+        currency = before or after
+        return amount, self.currencies.get(currency, currency)
+
+    def parse_many(self, values) -> tuple:
+        '''
+        parse a column of values, every distinct value is parsed once
+
+        in: values - list, tuple or other iterable of str
+        out: (amounts, currencies, errors)
+            amounts - numpy.ndarray of float64, NaN for errors
+            currencies - numpy.ndarray of objects, codes or None
+            errors - list of positions of values which aren't numbers
+
+        :Example:
+
+        >>> amounts, currencies, errors = PriceParser('de').parse_many(['1.234,5 EUR', 'n/a', '7'])
+        >>> amounts.tolist(), currencies.tolist(), errors
+        ([1234.5, nan, 7.0], ['EUR', None, None], [1])
+        '''
+        import numpy # optional dependency, only for the batch mode
+
+        values = values.tolist() if hasattr(values, 'tolist') else list(values)
+        parsed = {value: self.parse(value) for value in set(values)}
+        results = list(map(parsed.__getitem__, values))
+
+        errors = [index for index, result in enumerate(results) if result is None]
+        if errors:
+            results = [result or (math.nan, None) for result in results]
+        amounts, currencies = zip(*results) if results else ((), ())
+        return numpy.array(amounts, dtype=numpy.float64), numpy.array(currencies, dtype=object), errors
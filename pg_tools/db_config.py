@@ -8,6 +8,22 @@ class DBConfig:
     database: str
     user: str
     password: str = field(repr=False) # exclude this field from autogenerated __repr__()
+    # read-only replicas of this database (DBConfig objects), see `PgConnector(read_only=True)`
+    replicas: list = field(default_factory=list, repr=False)
+    # maximum replication lag (in seconds) of a replica used for reads, None for no limit
+    max_replica_lag: float = field(default=None, repr=False)
 
     def __str__(self):
         return f'{self.user}@{self.host}:{self.port}/{self.database}'
+
+    def connect_params(self) -> dict:
+        '''
+        arguments of `psycopg2.connect()` for this server
+        '''
+        return {
+            'host'      : self.host,
+            'port'      : self.port,
+            'database'  : self.database,
+            'user'      : self.user,
+            'password'  : self.password,
+        }
@@ -0,0 +1,257 @@
+# asynchronous class to connect to PostgreSQL, based on psycopg 3 (https://pypi.org/project/psycopg/)
+
+import contextlib
+import os
+
+import psycopg
+import psycopg_pool
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+
+
+class AsyncPgConnectorError(Exception):
+    pass
+
+
+class AsyncPgConnector(Logger):
+    '''
+    asynchronous analogue of `PgConnector` with the same context manager, commit and rollback semantics
+
+        async with AsyncPgConnector(config) as db:
+            rows = await db.execute('SELECT title FROM user_agent WHERE hardware=%s;', ('Computer',))
+
+    connections are borrowed from the registered async pool if there is one for the configuration,
+    see `AsyncPgConnector.create_pool()`; many small statements can be sent in pipeline mode
+    without waiting for a round trip for each of them, see `pipeline()` and `execute_pipeline()`
+    '''
+    # registered async pools : {config key: psycopg_pool.AsyncConnectionPool}
+    _pools = {}
+
+    def __init__(self, config: DBConfig):
+        '''
+        in: config, DBConfig(hostname='localhost', port='5432', database='db_name', user='role_name', password='password')
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if isinstance(config, DBConfig):
+            self.db_config = config
+        else:
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise AsyncPgConnectorError(msg)
+
+        # this attribute is for logging purposes only
+        self.conn_string = str(config)
+
+        self._conn = None
+        self._pool = None
+        self._pipeline = None # active pipeline, see `pipeline()`
+
+    @classmethod
+    def config_key(cls, config: DBConfig) -> tuple:
+        '''
+        hashable key of the database configuration
+        '''
+        return (config.host, config.port, config.database, config.user, config.password)
+
+    @classmethod
+    def conninfo(cls, config: DBConfig) -> str:
+        '''
+        libpq connection string for the configuration
+        '''
+        return psycopg.conninfo.make_conninfo(
+            host=config.host, port=config.port, dbname=config.database, user=config.user, password=config.password
+        )
+
+    @classmethod
+    async def create_pool(cls, config: DBConfig, min_size: int=1, max_size: int=10, max_lifetime: float=3600.0,
+                          max_idle: float=600.0, timeout: float=30.0) -> psycopg_pool.AsyncConnectionPool:
+        '''
+        create, open and register an async pool of connections for the configuration;
+        an already registered pool is closed
+
+        in:
+            config, DBConfig - database configuration
+            min_size, int - minimum number of connections kept open in the pool
+            max_size, int - maximum number of connections
+            max_lifetime, float (in seconds) - connections older than this value are closed
+            max_idle, float (in seconds) - idle connections above `min_size` are closed after this time
+            timeout, float (in seconds) - how long to wait for a free connection
+
+        out: psycopg_pool.AsyncConnectionPool
+        '''
+        pool = psycopg_pool.AsyncConnectionPool(
+            cls.conninfo(config)
+            , min_size=min_size
+            , max_size=max_size
+            , max_lifetime=max_lifetime
+            , max_idle=max_idle
+            , timeout=timeout
+            , check=psycopg_pool.AsyncConnectionPool.check_connection
+            , open=False
+        )
+        await pool.open(wait=True)
+
+        old_pool = cls._pools.pop(cls.config_key(config), None)
+        cls._pools[cls.config_key(config)] = pool
+        if old_pool is not None:
+            await old_pool.close()
+
+        return pool
+
+    @classmethod
+    async def close_pools(cls):
+        '''
+        close and unregister all async pools
+        '''
+        pools = list(cls._pools.values())
+        cls._pools.clear()
+        for pool in pools:
+            await pool.close()
+
+    async def __aenter__(self):
+        try:
+            self._pool = self.__class__._pools.get(self.config_key(self.db_config))
+            if self._pool:
+                self._conn = await self._pool.getconn()
+            else:
+                self._conn = await psycopg.AsyncConnection.connect(self.conninfo(self.db_config))
+        except Exception as ex:
+            self._conn = None
+            self._pool = None
+
+            self.logger.exception(self.log_msg(f'Connection error : {self.conn_string}, {ex=}'))
+
+            raise AsyncPgConnectorError(f'Error while connecting to the database : {self.conn_string}') from ex
+        else:
+            self.logger.info(self.log_msg(f'Connection opened : {self.conn_string}, pooled={self._pool is not None}'))
+            return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # if we have active connection and in transaction status
+            if self._conn and not self._conn.closed and self._conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                if exc_type: # if error, then rollback
+                    await self._conn.rollback()
+                    self.logger.warning(self.log_msg(f'The last transaction was canceled, {exc_type=}, {exc_val=}'))
+                else:
+                    try:
+                        await self._conn.commit()
+                    except Exception as ex:
+                        await self._conn.rollback()
+                        self.logger.exception(self.log_msg(f'The last transaction was canceled, {ex=}'))
+        finally:
+            if self._pool:
+                await self._pool.putconn(self._conn)
+            elif self._conn:
+                await self._conn.close()
+            self.logger.info(self.log_msg(f'Connection closed : {self.conn_string}, pooled={self._pool is not None}'))
+
+            self._conn = None
+            self._pool = None
+
+    async def execute(self, query: str, args: tuple=None):
+        '''
+        in:
+            query, str
+            args, tuple
+
+        out: list of rows for queries with results or None; always None in pipeline mode,
+            because results are not received until the end of the pipeline
+        '''
+        result = None
+        try:
+            async with self._conn.cursor() as cur:
+                await cur.execute(query, args)
+
+                # try to fetch results from query
+                if self._pipeline is None and cur.description is not None:
+                    result = await cur.fetchall() # will work for 'SELECT...' and 'INSERT... RETURNING...'
+
+            self.logger.info(self.log_msg(f'Successfully executed {query=}, {args=}'))
+        except Exception as ex:
+            self.logger.exception(self.log_msg(f'Error executing {query=}, {args=}; {ex=}'))
+            result = None
+
+        return result
+
+    @contextlib.asynccontextmanager
+    async def pipeline(self):
+        '''
+        pipeline mode: statements executed inside this context are sent to the server without waiting
+        for the results of the previous statements; the results are synchronized at the end of the context
+
+            async with db.pipeline():
+                for title in titles:
+                    await db.execute('UPDATE user_agent SET successes=successes+1 WHERE title=%s;', (title,))
+        '''
+        if self._pipeline is not None:
+            yield self
+            return
+
+        try:
+            async with self._conn.pipeline() as pipeline:
+                self._pipeline = pipeline
+                yield self
+        except Exception as ex:
+            self.logger.exception(self.log_msg(f'Error in pipeline, {ex=}'))
+            raise AsyncPgConnectorError('Error in pipeline') from ex
+        finally:
+            self._pipeline = None
+
+    async def execute_pipeline(self, query: str, args_list: list) -> int:
+        '''
+        execute query for each element of `args_list` in pipeline mode
+
+        in:
+            query, str - for example, 'UPDATE user_agent SET errors=errors+1 WHERE title=%s;'
+            args_list, list - list of args tuples
+
+        out: number of processed args tuples, int or None if error
+        '''
+        result = None
+        try:
+            args_list = list(args_list)
+            async with self.pipeline():
+                async with self._conn.cursor() as cur:
+                    await cur.executemany(query, args_list)
+            result = len(args_list)
+
+            # args are not logged here, there can be millions of them
+            self.logger.info(self.log_msg(f'Successfully executed {query=} for {result} args in pipeline mode'))
+        except Exception as ex:
+            self.logger.exception(self.log_msg(f'Error executing {query=} for many args in pipeline mode; {ex=}'))
+            result = None
+
+        return result
+
+    async def commit(self):
+        '''
+        commit open transaction
+        '''
+        if self._conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+            self.logger.info(self.log_msg('Nothing to commit'))
+        else:
+            try:
+                await self._conn.commit()
+            except Exception as ex:
+                await self._conn.rollback()
+                self.logger.exception(self.log_msg(f'Error during commit, {ex=}. The transaction was canceled'))
+            else:
+                self.logger.info(self.log_msg('Successfully committed'))
+
+    async def rollback(self):
+        '''
+        rollback open transaction
+        '''
+        if self._conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+            self.logger.info(self.log_msg('Nothing to rollback'))
+        else:
+            try:
+                await self._conn.rollback()
+            except Exception as ex:
+                self.logger.exception(self.log_msg(f'Error during rollback, {ex=}'))
+                raise AsyncPgConnectorError(f'Error during rollback') from ex
+            else:
+                self.logger.warning(self.log_msg('Successfully rolled back'))
@@ -0,0 +1,271 @@
+# read-through cache of query results, invalidated by `LISTEN/NOTIFY` on table changes
+
+import collections
+import os
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+
+
+class PgResultCacheError(Exception):
+    pass
+
+
+class PgResultCache(Logger):
+    '''
+    cache of results of read-only queries for `PgConnector.execute_cached()`, keyed by query and args
+
+    entries are removed by LRU when there are more than `maxsize` of them, after `ttl` seconds, and when one of the tables
+    of the query is changed: a trigger (see `install_trigger()`) sends `NOTIFY` after every changing statement,
+    and a background thread with its own connection `LISTEN`s to the notifications; while the listener is not connected,
+    nothing is cached, so the cache never returns data which was changed before the last notification was received
+
+    cached results are shared between threads, they must not be changed by the caller; only reads outside
+    of an open transaction use the cache, so not committed changes are never cached
+
+    :Example:
+
+    >>> cache = PgResultCache(config, maxsize=1024, ttl=600)
+    >>> cache.install_trigger('user_agent') # once
+    >>> cache.start()
+    >>> with PgConnector(config, result_cache=cache) as db:
+    ...     db.execute_cached('SELECT title FROM user_agent WHERE hardware=%s;', ('Computer',), tables=('user_agent',))
+    >>> cache.stop()
+    '''
+    CHANNEL = 'etltools_cache_invalidate'
+    NOTIFY_FUNCTION = 'etltools_cache_notify'
+    NOTIFY_TRIGGER = 'etltools_cache_notify_trigger'
+
+    def __init__(self, config: DBConfig, maxsize: int=1024, ttl: float=None, reconnect_delay: float=5.0):
+        '''
+        in:
+            config, DBConfig - database configuration for the listener connection
+            maxsize, int - maximum number of cached results
+            ttl, float (in seconds) - maximum age of cached results, None for no limit
+            reconnect_delay, float (in seconds) - pause before reconnecting of the listener after a connection error
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgResultCacheError(msg)
+
+        self.config = config
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.reconnect_delay = reconnect_delay
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # {(query, args): (result, tables, expires)}, the most recently used on the right
+        self._table_keys = collections.defaultdict(set) # {table: keys of the entries}
+        self._generations = collections.Counter() # {table: number of invalidations}, see `generation()`
+        self._generation = 0 # number of invalidations of all tables
+
+        self._listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    @classmethod
+    def table_name(cls, table: str) -> str:
+        '''
+        name of the table as in notifications : `schema.table`, tables without schema are in `public`
+        '''
+        return table if '.' in table else f'public.{table}'
+
+    def install_trigger(self, table: str):
+        '''
+        create the notify function (if not exists) and the statement-level trigger on the table,
+        which sends `NOTIFY` after every `INSERT`, `UPDATE`, `DELETE` or `TRUNCATE`
+        '''
+        sql = psycopg2.sql
+        queries = [
+            sql.SQL(
+                'CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ '
+                'BEGIN '
+                '  PERFORM pg_notify({channel}, TG_TABLE_SCHEMA || {dot} || TG_TABLE_NAME); '
+                '  RETURN NULL; '
+                'END; '
+                '$$ LANGUAGE plpgsql;'
+            ).format(function=sql.Identifier(self.NOTIFY_FUNCTION), channel=sql.Literal(self.CHANNEL), dot=sql.Literal('.')),
+            sql.SQL(
+                'CREATE OR REPLACE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} '
+                'FOR EACH STATEMENT EXECUTE FUNCTION {function}();'
+            ).format(
+                trigger=sql.Identifier(self.NOTIFY_TRIGGER),
+                table=sql.Identifier(*table.split('.')),
+                function=sql.Identifier(self.NOTIFY_FUNCTION),
+            ),
+        ]
+
+        try:
+            with psycopg2.connect(**self.config.connect_params()) as conn: # commits on exit
+                with conn.cursor() as cur:
+                    for query in queries:
+                        cur.execute(query)
+            conn.close()
+        except Exception as ex:
+            self.logger.exception(self.log_msg(f'Error installing notify trigger on {table=}, {ex=}'))
+            raise PgResultCacheError(f'Error installing notify trigger on {table=}') from ex
+
+        self.logger.info(self.log_msg(f'Notify trigger installed on {table=}'))
+
+    def start(self, timeout: float=10.0):
+        '''
+        start the listener thread and wait until it is listening
+        '''
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+        if not self._listening.wait(timeout):
+            self.logger.warning(self.log_msg(f'The listener is not connected after {timeout=} s, nothing is cached'))
+
+    def stop(self):
+        '''
+        stop the listener thread and clear the cache
+        '''
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.clear()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config.connect_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(psycopg2.sql.SQL('LISTEN {channel};').format(channel=psycopg2.sql.Identifier(self.CHANNEL)))
+                self._listening.set()
+                self.logger.info(self.log_msg(f'Listening to {self.CHANNEL}'))
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 0.5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    tables = set()
+                    while conn.notifies:
+                        tables.add(conn.notifies.pop(0).payload)
+                    for table in tables:
+                        self.invalidate(table)
+            except Exception as ex:
+                self.logger.exception(self.log_msg(f'Listener error, the cache is cleared, {ex=}'))
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                # notifications can be lost while the listener is not connected
+                self._listening.clear()
+                self.clear()
+                if conn is not None:
+                    conn.close()
+
+    @property
+    def listening(self) -> bool:
+        return self._listening.is_set()
+
+    def get(self, key: tuple):
+        '''
+        cached result for the key or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, tables, expires = entry
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def generation(self, tables: tuple) -> tuple:
+        '''
+        state of invalidations of the tables; a result read after this call may be put into the cache
+        only if the state is not changed, otherwise the result may be read before a change but cached after it
+        '''
+        with self._lock:
+            return (self._generation, tuple(self._generations[table] for table in tables))
+
+    def put(self, key: tuple, result, tables: tuple, generation: tuple):
+        '''
+        cache the result if the listener is connected and the tables were not changed since `generation()`
+        '''
+        if not self._listening.is_set():
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if generation != (self._generation, tuple(self._generations[table] for table in tables)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, tables, expires)
+            for table in tables:
+                self._table_keys[table].add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: tuple):
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._table_keys[table]
+            keys.discard(key)
+            if not keys:
+                del self._table_keys[table]
+
+    def invalidate(self, table: str):
+        '''
+        remove all results which depend on the table
+        '''
+        table = self.table_name(table)
+        with self._lock:
+            self._generations[table] += 1
+            keys = self._table_keys.pop(table, set())
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            self.invalidations += len(keys)
+        if keys:
+            self.logger.info(self.log_msg(f'{len(keys)} cached results of {table=} invalidated'))
+
+    def clear(self):
+        '''
+        remove all cached results
+        '''
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._table_keys.clear()
+
+    def stats(self) -> dict:
+        '''
+        statistics of the cache
+        '''
+        with self._lock:
+            return {
+                'cached'        : len(self._entries),
+                'hits'          : self.hits,
+                'misses'        : self.misses,
+                'invalidations' : self.invalidations,
+                'expirations'   : self.expirations,
+                'listening'     : self._listening.is_set(),
+            }
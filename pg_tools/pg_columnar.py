@@ -0,0 +1,295 @@
+'''
+decoder of the binary format of `COPY ... TO STDOUT` into columnar NumPy arrays and Arrow record batches
+'''
+
+import json
+import struct
+import uuid
+
+import numpy
+
+
+class PgColumnarError(Exception):
+    pass
+
+
+class PgColumnarBatch:
+    '''
+    batch of rows as columns: NumPy array of values and boolean mask of NULLs for every column
+
+    values of NULLs in the arrays are zeros (None for object arrays), use masks to distinguish them
+    '''
+    def __init__(self, names: list, arrays: list, masks: list):
+        self.names = list(names)
+        self.arrays = arrays
+        self.masks = masks
+        self.num_rows = len(arrays[0]) if arrays else 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, name: str) -> numpy.ndarray:
+        return self.arrays[self.names.index(name)]
+
+    def mask(self, name: str) -> numpy.ndarray:
+        return self.masks[self.names.index(name)]
+
+    def masked(self, name: str) -> numpy.ma.MaskedArray:
+        '''
+        column as masked array, NULLs are masked
+        '''
+        idx = self.names.index(name)
+        return numpy.ma.MaskedArray(self.arrays[idx], mask=self.masks[idx])
+
+    def to_arrow(self):
+        '''
+        convert into `pyarrow.RecordBatch`, NULLs are nulls of Arrow; requires `pyarrow`
+        '''
+        import pyarrow # optional dependency, only for Arrow output
+
+        arrays = [
+            pyarrow.array(array, mask=mask if mask.any() else None, from_pandas=False)
+            for array, mask in zip(self.arrays, self.masks)
+        ]
+        return pyarrow.RecordBatch.from_arrays(arrays, names=self.names)
+
+
+class PgColumnarDecoder:
+    '''
+    incremental decoder of binary COPY data into `PgColumnarBatch`
+
+    rows of fixed-width columns (bool, integers, floats, date, timestamp) are decoded with one `numpy.frombuffer()`
+    call for all rows between NULLs, so no Python objects are created for their values;
+    rows with NULLs and columns of variable width (text, json, bytea, ...) are decoded row by row
+
+    :Example:
+
+    >>> decoder = PgColumnarDecoder(['n', 'x'], ['int4', 'float8'], batch_size=1000)
+    >>> batches = decoder.feed(data) # any chunks of the COPY stream
+    >>> batches += decoder.finish()
+    '''
+    def __init__(self, names: list, type_names: list, batch_size: int=65536):
+        '''
+        in:
+            names, list - column names
+            type_names, list - names of PostgreSQL types of the columns from `pg_type.typname`
+            batch_size, int - number of rows in one batch
+        '''
+        for type_name in type_names:
+            if type_name not in FIXED_TYPES and type_name not in VARIABLE_TYPES:
+                raise PgColumnarError(f'Columnar fetch is not supported for {type_name=}, cast the column to float8 or text')
+
+        self.names = list(names)
+        self.type_names = list(type_names)
+        self.batch_size = batch_size
+        self.rows = 0 # number of decoded rows
+
+        self._fixed = all(type_name in FIXED_TYPES for type_name in type_names)
+        if self._fixed:
+            # layout of a row without NULLs: field count, then length and value of every field
+            fields = [('count', '>i2')]
+            for idx, type_name in enumerate(type_names):
+                fields.extend([(f'length{idx}', '>i4'), (f'value{idx}', FIXED_TYPES[type_name][0])])
+            self._row_dtype = numpy.dtype(fields)
+            self._widths = [numpy.dtype(FIXED_TYPES[type_name][0]).itemsize for type_name in type_names]
+
+        self._buffer = bytearray()
+        self._pos = 0
+        self._header = True # the header is not read yet
+        self._finished = False # the trailer is read
+
+        self._segments = [] # decoded parts of the current batch: (arrays, masks) with values in raw wire format
+        self._slow_values = [[] for _ in names] # values of the rows decoded row by row
+        self._slow_masks = []
+        self._batch_rows = 0
+
+    def feed(self, data: bytes) -> list:
+        '''
+        decode the next chunk of COPY data
+
+        out: list of completed batches, PgColumnarBatch
+        '''
+        self._buffer += data
+        batches = []
+        self._decode(batches)
+
+        # don't keep decoded data in the buffer
+        if self._pos > 1024 * 1024 or self._pos == len(self._buffer):
+            del self._buffer[:self._pos]
+            self._pos = 0
+        return batches
+
+    def finish(self) -> list:
+        '''
+        end of COPY data
+
+        out: list with the last batch if there are rows left
+        '''
+        if not self._finished or self._pos != len(self._buffer):
+            raise PgColumnarError('Unexpected end of COPY data')
+        batches = []
+        if self._batch_rows:
+            batches.append(self._flush())
+        return batches
+
+    def _decode(self, batches: list):
+        buffer = self._buffer
+        if self._header:
+            if len(buffer) < 19:
+                return
+            if bytes(buffer[:11]) != b'PGCOPY\n\xff\r\n\x00':
+                raise PgColumnarError('Incorrect header of binary COPY data')
+            extension_length = struct.unpack_from('>i', buffer, 15)[0]
+            if len(buffer) < 19 + extension_length:
+                return
+            self._pos = 19 + extension_length
+            self._header = False
+
+        columns = len(self.names)
+        while not self._finished:
+            if self._fixed:
+                self._decode_fixed_rows(batches)
+
+            # one row of variable size: with NULLs, with variable-width columns or the trailer
+            pos = self._pos
+            if len(buffer) - pos < 2:
+                return
+            count = struct.unpack_from('>h', buffer, pos)[0]
+            if count == -1:
+                self._pos = pos + 2
+                self._finished = True
+                return
+            if count != columns:
+                raise PgColumnarError(f'Expected {columns} columns in the row, got {count}')
+            pos += 2
+
+            values = []
+            mask = []
+            for idx in range(columns):
+                if len(buffer) - pos < 4:
+                    return
+                length = struct.unpack_from('>i', buffer, pos)[0]
+                pos += 4
+                if length == -1:
+                    values.append(None)
+                    mask.append(True)
+                    continue
+                if len(buffer) - pos < length:
+                    return
+                values.append(bytes(buffer[pos:pos + length]))
+                mask.append(False)
+                pos += length
+
+            self._pos = pos
+            for column_values, value in zip(self._slow_values, values):
+                column_values.append(value)
+            self._slow_masks.append(mask)
+            self._add_rows(1, batches)
+
+    def _decode_fixed_rows(self, batches: list):
+        '''
+        decode all complete rows without NULLs from the current position at once
+        '''
+        buffer = self._buffer
+        while True:
+            rows = min((len(buffer) - self._pos) // self._row_dtype.itemsize, self.batch_size - self._batch_rows)
+            if rows <= 0:
+                return
+
+            records = numpy.frombuffer(buffer, dtype=self._row_dtype, count=rows, offset=self._pos)
+            valid = records['count'] == len(self.names)
+            for idx, width in enumerate(self._widths):
+                valid &= records[f'length{idx}'] == width
+            if not valid.all():
+                rows = int(numpy.argmin(valid)) # the first row with NULLs or the trailer
+                if rows == 0:
+                    return
+                records = records[:rows]
+
+            self._flush_slow()
+            self._segments.append((
+                [records[f'value{idx}'].copy() for idx in range(len(self.names))],
+                [numpy.zeros(rows, dtype=bool) for _ in self.names],
+            ))
+            self._pos += rows * self._row_dtype.itemsize
+            self._add_rows(rows, batches)
+
+    def _add_rows(self, rows: int, batches: list):
+        self._batch_rows += rows
+        self.rows += rows
+        if self._batch_rows >= self.batch_size:
+            batches.append(self._flush())
+
+    def _flush_slow(self):
+        '''
+        convert the rows decoded row by row into a segment
+        '''
+        if not self._slow_masks:
+            return
+
+        masks = numpy.array(self._slow_masks, dtype=bool).reshape(len(self._slow_masks), len(self.names))
+        arrays = []
+        for idx, (type_name, values) in enumerate(zip(self.type_names, self._slow_values)):
+            if type_name in FIXED_TYPES:
+                wire_dtype = numpy.dtype(FIXED_TYPES[type_name][0])
+                null = bytes(wire_dtype.itemsize)
+                arrays.append(numpy.frombuffer(b''.join(null if value is None else value for value in values), dtype=wire_dtype))
+            else:
+                decode = VARIABLE_TYPES[type_name]
+                arrays.append(numpy.fromiter((None if value is None else decode(value) for value in values), dtype=object, count=len(values)))
+        self._segments.append((arrays, list(masks.T)))
+
+        self._slow_values = [[] for _ in self.names]
+        self._slow_masks = []
+
+    def _flush(self) -> PgColumnarBatch:
+        self._flush_slow()
+        arrays = []
+        masks = []
+        for idx, type_name in enumerate(self.type_names):
+            array = numpy.concatenate([segment[0][idx] for segment in self._segments])
+            if type_name in FIXED_TYPES:
+                array = FIXED_TYPES[type_name][1](array)
+            arrays.append(array)
+            masks.append(numpy.concatenate([segment[1][idx] for segment in self._segments]))
+
+        self._segments = []
+        self._batch_rows = 0
+        return PgColumnarBatch(self.names, arrays, masks)
+
+
+# days and microseconds between 1970-01-01 and 2000-01-01, the epoch of PostgreSQL
+PG_EPOCH_DAYS = 10957
+PG_EPOCH_MICROSECONDS = PG_EPOCH_DAYS * 86400 * 1_000_000
+
+
+def _native(dtype: str):
+    return lambda array: array.astype(dtype)
+
+
+# PostgreSQL type name : (big-endian NumPy type of the binary format, function raw array -> result array)
+FIXED_TYPES = {
+    'bool'          : ('?', _native('bool')),
+    'int2'          : ('>i2', _native('int16')),
+    'int4'          : ('>i4', _native('int32')),
+    'int8'          : ('>i8', _native('int64')),
+    'oid'           : ('>u4', _native('uint32')),
+    'float4'        : ('>f4', _native('float32')),
+    'float8'        : ('>f8', _native('float64')),
+    'date'          : ('>i4', lambda array: (array.astype('int64') + PG_EPOCH_DAYS).astype('datetime64[D]')),
+    'timestamp'     : ('>i8', lambda array: (array.astype('int64') + PG_EPOCH_MICROSECONDS).astype('datetime64[us]')),
+    # timestamptz values are in UTC
+    'timestamptz'   : ('>i8', lambda array: (array.astype('int64') + PG_EPOCH_MICROSECONDS).astype('datetime64[us]')),
+}
+
+# PostgreSQL type name : function bytes -> Python value
+VARIABLE_TYPES = {
+    'text'          : lambda value: value.decode('utf-8'),
+    'varchar'       : lambda value: value.decode('utf-8'),
+    'bpchar'        : lambda value: value.decode('utf-8'),
+    'name'          : lambda value: value.decode('utf-8'),
+    'json'          : lambda value: json.loads(value),
+    'jsonb'         : lambda value: json.loads(value[1:]), # the first byte is the version of the format
+    'bytea'         : lambda value: value,
+    'uuid'          : lambda value: uuid.UUID(bytes=value),
+}
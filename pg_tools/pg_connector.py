@@ -1,14 +1,25 @@
 # base class to connect to PostgreSQL
 
+import itertools
 import logging
 import os
-from dataclasses import asdict
+import queue
+import threading
+import time
 
 import psycopg2
 import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.sql
 
 from etltools.additions.logger import Logger
 from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_cache import PgResultCache
+from etltools.pg_tools.pg_copy import PgCopyReader
+from etltools.pg_tools.pg_pool import PgPool
+from etltools.pg_tools.pg_prepared import PgStatementCache
+from etltools.pg_tools.pg_router import PgReplicaRouter
+from etltools.pg_tools.pg_stats import PgQueryStats
 
 
 class PgConnectorError(Exception):
@@ -16,14 +27,27 @@ class PgConnectorError(Exception):
 
 
 class PgConnector(Logger):
-    def __init__(self, config: DBConfig):
+    # counter for unique names of server-side cursors
+    _cursor_counter = itertools.count(1)
+
+    def __init__(self, config: DBConfig, prepare_threshold: int=None, prepared_cache_size: int=100, result_cache: PgResultCache=None,
+                 read_only: bool=False):
         '''
-        in: config, DBConfig(hostname='localhost', port='5432', database='db_name', user='role_name', password='password')
+        in:
+            config, DBConfig(hostname='localhost', port='5432', database='db_name', user='role_name', password='password')
+            prepare_threshold, int - queries executed by `execute()` this number of times on the same connection
+                are prepared on the server and then executed with `EXECUTE`, see `PgStatementCache`;
+                None to disable prepared statements
+            prepared_cache_size, int - maximum number of prepared statements per connection
+            result_cache, PgResultCache - cache of results for `execute_cached()`, None to disable caching
+            read_only, bool - the connection is used only for reading, so it can be opened to one of `config.replicas`,
+                see `PgReplicaRouter`; writes and read-write transactions must use the primary (False)
         '''
         super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
 
         if isinstance(config, DBConfig):
-            self.config = asdict(config)
+            self.db_config = config
+            self.config = config.connect_params()
         else:
             msg = f'Incorrect connection configuration : {type(config)=}'
             self.logger.error(self.log_msg(msg))
@@ -32,43 +56,124 @@ class PgConnector(Logger):
         # this attribute is for logging purposes only
         self.conn_string = str(config)
 
+        self.prepare_threshold = prepare_threshold
+        self.prepared_cache_size = prepared_cache_size
+        self.result_cache = result_cache
+        self.read_only = read_only
+        self.replica = None # configuration of the replica of the current connection, None for the primary
+
         self._conn = None
         self._cur = None
+        self._pool = None # the pool from which the connection was borrowed
+        self._statements = None # prepared statements cache of the connection
+        self._busy = None # query of the running `fetch_columns()`, the connection can't be used until it is finished
+
+    def _connect(self, config: DBConfig):
+        '''
+        borrow the connection if there is a registered pool for this configuration (see `PgPool.create()`) or open it
+
+        out: (connection, pool or None)
+        '''
+        pool = PgPool.get(config)
+        if pool:
+            return pool.getconn(), pool
+        return psycopg2.connect(**config.connect_params()), None
+
+    def _connect_replica(self):
+        '''
+        connect to the first available replica with acceptable replication lag, see `PgReplicaRouter`
+
+        out: (connection, pool or None, replica configuration) or None if there is no such replica
+        '''
+        for replica in PgReplicaRouter.replicas(self.db_config):
+            conn, pool = None, None
+            try:
+                conn, pool = self._connect(replica)
+                if PgReplicaRouter.check_lag(replica, conn, self.db_config.max_replica_lag):
+                    return conn, pool, replica
+            except Exception as ex:
+                PgReplicaRouter.mark_down(replica, ex)
+                if pool and conn:
+                    pool.putconn(conn, discard=True)
+                    conn, pool = None, None
+            if pool:
+                pool.putconn(conn)
+            elif conn:
+                conn.close()
+
+        self.logger.warning(self.log_msg(f'There are no available replicas, the primary is used : {self.db_config}'))
+        return None
 
     def __enter__(self):
         try:
-            self._conn = psycopg2.connect(**self.config)
+            connected = self._connect_replica() if self.read_only and self.db_config.replicas else None
+            if connected:
+                self._conn, self._pool, self.replica = connected
+                self.conn_string = f'{self.replica} (replica)'
+            else:
+                self._conn, self._pool = self._connect(self.db_config)
             self._cur = self._conn.cursor()
+            if self.prepare_threshold is not None:
+                # the cache belongs to the connection, so it is reused with connections from the pool
+                self._statements = PgStatementCache.get(self._conn, self.prepare_threshold, self.prepared_cache_size)
         except Exception as ex:
+            if self._pool and self._conn:
+                self._pool.putconn(self._conn, discard=True)
             self._conn = None
             self._cur = None
+            self._pool = None
 
             self.logger.exception(self.log_msg(f'Connection error : {self.conn_string}, {ex=}'))
 
             raise PgConnectorError(f'Error while connecting to the database : {self.conn_string}') from ex
         else:
-            self.logger.info(self.log_msg(f'Connection opened : {self.conn_string}'))
+            if self._pool:
+                self.logger.info(self.log_msg(f'Connection borrowed from the pool : {self.conn_string}'))
+            else:
+                self.logger.info(self.log_msg(f'Connection opened : {self.conn_string}'))
             return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # if we have active connection and in transaction status
-        if self._conn and self._conn.status != psycopg2.extensions.STATUS_READY:
-            if exc_type: # if error, then rollback
-                self._conn.rollback()
-                self.logger.warning(self.log_msg(f'The last transaction was canceled, {exc_type=}, {exc_val=}'))
-            else:
-                try:
-                    self._conn.commit()
-                except Exception as ex:
+        try:
+            # if we have active connection and in transaction status
+            if self._conn and self._conn.status != psycopg2.extensions.STATUS_READY:
+                if exc_type: # if error, then rollback
                     self._conn.rollback()
-                    self.logger.exception(self.log_msg(f'The last transaction was canceled, {ex=}'))
+                    self.logger.warning(self.log_msg(f'The last transaction was canceled, {exc_type=}, {exc_val=}'))
+                else:
+                    try:
+                        self._conn.commit()
+                    except Exception as ex:
+                        self._conn.rollback()
+                        self.logger.exception(self.log_msg(f'The last transaction was canceled, {ex=}'))
+        finally:
+            # the connection must be released even if it is broken and rollback failed
+            if self._cur:
+                self._cur.close()
+            if self._pool:
+                self._pool.putconn(self._conn)
+                self.logger.info(self.log_msg(f'Connection returned to the pool : {self.conn_string}'))
+            else:
+                if self._conn:
+                    self._conn.close()
+                self.logger.info(self.log_msg(f'Connection closed : {self.conn_string}'))
 
-        if self._cur:
-            self._cur.close()
-        if self._conn:
-            self._conn.close()
+            self._conn = None
+            self._cur = None
+            self._pool = None
+            self._statements = None
+            self._busy = None
+            self.replica = None
+            self.conn_string = str(self.db_config)
 
-        self.logger.info(self.log_msg(f'Connection closed : {self.conn_string}'))
+    def _check_busy(self):
+        '''
+        raise error if the connection is receiving COPY data of `fetch_columns()`: any other query would break the protocol
+        '''
+        if self._busy is not None:
+            msg = f'The connection is busy with the columnar fetch of query={self._busy}, exhaust or close its generator first'
+            self.logger.error(self.log_msg(msg))
+            raise PgConnectorError(msg)
 
     def execute(self, query: str, args: tuple=None):
         '''
@@ -76,9 +181,14 @@ class PgConnector(Logger):
             query, str
             args, tuple
         '''
+        self._check_busy()
         result = None
+        start = time.perf_counter()
         try:
-            self._cur.execute(query, args)
+            if self._statements is None:
+                self._cur.execute(query, args)
+            else:
+                self._execute_prepared(query, args)
 
             # try to fetch results from query
             try:
@@ -86,17 +196,403 @@ class PgConnector(Logger):
             except:
                 result = None
 
+            rows = len(result) if result is not None else max(self._cur.rowcount, 0)
+            PgQueryStats.record(query, time.perf_counter() - start, rows=rows, args=args)
             self.logger.info(self.log_msg(f'Successfully executed {query=}, {args=}'))
         except Exception as ex:
+            PgQueryStats.record(query, time.perf_counter() - start, error=True, args=args)
             self.logger.exception(self.log_msg(f'Error executing {query=}, {args=}; {ex=}'))
             result = None
 
         return result
 
-    def commit(self):
+    def execute_cached(self, query: str, args: tuple=None, tables: tuple=()):
+        '''
+        `execute()` through the result cache: repeated reads are returned from the cache without a query to the server
+        until one of the tables is changed, see `PgResultCache`
+
+        in:
+            query, str - read-only query
+            args, tuple - hashable arguments of the query
+            tables, tuple - names of the tables read by the query (`schema.table` or `table` in `public`),
+                the tables must have the notify trigger, see `PgResultCache.install_trigger()`
+        out: list of rows (new list for every call) or None on error
+
+        inside an open transaction the cache is bypassed: the transaction may see its own not committed changes,
+        which must be neither returned from the cache nor stored into it; otherwise the read runs
+        in its own transaction, which is committed
+
+        results read from a replica are not stored: the invalidation is notified by the primary, and a lagging replica
+        may return the old rows after the notification
+        '''
+        if self.result_cache is None or self._conn.status != psycopg2.extensions.STATUS_READY:
+            return self.execute(query, args)
+
+        key = (query, args)
+        try:
+            result = self.result_cache.get(key)
+        except TypeError: # unhashable args
+            return self.execute(query, args)
+        if result is not None:
+            self.logger.info(self.log_msg(f'Cached result for {query=}, {args=}'))
+            return list(result)
+
+        tables = tuple(PgResultCache.table_name(table) for table in tables)
+        generation = self.result_cache.generation(tables)
+        result = self.execute(query, args)
+        if self._conn.status != psycopg2.extensions.STATUS_READY:
+            if result is None:
+                self.rollback()
+            else:
+                self.commit()
+        if result is not None and self.replica is None:
+            self.result_cache.put(key, tuple(result), tables, generation)
+        return result
+
+    def _execute_prepared(self, query: str, args: tuple):
+        '''
+        execute query through the prepared statements cache
+        '''
+        own_transaction = self._conn.status == psycopg2.extensions.STATUS_READY
+        statement_query, statement_args = self._statements.statement(self._cur, query, args)
+        try:
+            self._cur.execute(statement_query, statement_args)
+        except psycopg2.Error as ex:
+            if not self._statements.is_prepared(query, args) or ex.pgcode not in PgStatementCache.INVALIDATION_ERRORS:
+                raise
+
+            # the prepared statement is invalid (for example, after schema change): forget it and, if the failed
+            # transaction was opened by this statement only, repeat the query without preparing
+            self._statements.invalidate(query)
+            self.logger.warning(self.log_msg(f'Prepared statement for {query=} is invalidated, {ex=}'))
+            if not own_transaction:
+                raise
+            self._conn.rollback()
+            self._cur.execute(query, args)
+
+    def prepared_stats(self) -> dict:
+        '''
+        statistics of the prepared statements cache of the current connection:
+        number of cached statements, hits, misses, prepares, evictions and invalidations; None if disabled
+        '''
+        if self._statements is None:
+            return None
+        return self._statements.stats()
+
+    def execute_many(self, query: str, args_list: list, page_size: int=100) -> int:
+        '''
+        execute query for each element of `args_list`, sending `page_size` statements to the server in one round trip
+
+        in:
+            query, str - for example, 'UPDATE user_agent SET errors=%s WHERE title=%s;'
+            args_list, list - list of args tuples
+            page_size, int - number of statements in one round trip
+
+        out: number of processed args tuples, int or None if error
+        '''
+        self._check_busy()
+        result = None
+        start = time.perf_counter()
+        try:
+            args_list = list(args_list)
+            psycopg2.extras.execute_batch(self._cur, query, args_list, page_size=page_size)
+            result = len(args_list)
+            PgQueryStats.record(query, time.perf_counter() - start, rows=result)
+
+            # args are not logged here, there can be millions of them
+            self.logger.info(self.log_msg(f'Successfully executed {query=} for {result} args, {page_size=}'))
+        except Exception as ex:
+            PgQueryStats.record(query, time.perf_counter() - start, error=True)
+            self.logger.exception(self.log_msg(f'Error executing {query=} for many args; {ex=}'))
+            result = None
+
+        return result
+
+    def execute_values(self, query: str, args_list: list, template: str=None, page_size: int=100, fetch: bool=False):
+        '''
+        execute query with multi-row `VALUES` list, `page_size` rows in one statement
+
+        in:
+            query, str - query with single `%s` placeholder for the `VALUES` list,
+                for example, 'INSERT INTO test (amount, title) VALUES %s RETURNING test_id;'
+            args_list, list - list of args tuples
+            template, str - template of one row, for example '(%s, %s::text)', defaults to '(%s, %s, ...)'
+            page_size, int - number of rows in one statement
+            fetch, bool - fetch and aggregate results of all statements, for example for `RETURNING` clause
+
+        out:
+            fetch is True : list of result rows from all statements, list
+            fetch is False : number of processed args tuples, int
+            None if error
         '''
-        commit open transaction
+        self._check_busy()
+        result = None
+        start = time.perf_counter()
+        try:
+            args_list = list(args_list)
+            rows = psycopg2.extras.execute_values(self._cur, query, args_list, template=template, page_size=page_size, fetch=fetch)
+            result = rows if fetch else len(args_list)
+            PgQueryStats.record(query, time.perf_counter() - start, rows=len(args_list))
+
+            # args are not logged here, there can be millions of them
+            self.logger.info(self.log_msg(f'Successfully executed {query=} for {len(args_list)} args, {page_size=}'))
+        except Exception as ex:
+            PgQueryStats.record(query, time.perf_counter() - start, error=True)
+            self.logger.exception(self.log_msg(f'Error executing {query=} for many args; {ex=}'))
+            result = None
+
+        return result
+
+    def iter_query(self, query: str, args: tuple=None, itersize: int=2000, batches: bool=False):
+        '''
+        execute query with a named server-side cursor and yield rows as they arrive from the server,
+        at most `itersize` rows are kept in memory
+
+        if this method opened the transaction (no transaction was open before), the transaction is committed
+        when the iteration is finished or stopped early by the consumer, and rolled back on error;
+        an already open transaction is left open, only the server-side cursor is closed
+
+        in:
+            query, str
+            args, tuple
+            itersize, int - number of rows fetched from the server per round trip
+            batches, bool - yield lists of up to `itersize` rows instead of single rows
+
+        out: generator of rows (tuples) or batches of rows (lists of tuples)
+        '''
+        self._check_busy()
+        own_transaction = self._conn.status == psycopg2.extensions.STATUS_READY
+        name = f'etltools_cursor_{next(self.__class__._cursor_counter)}'
+        error = None
+        cur = None
+        rows_total = 0
+        start = time.perf_counter()
+
+        try:
+            cur = self._conn.cursor(name=name)
+            cur.itersize = itersize
+            cur.execute(query, args)
+            self.logger.info(self.log_msg(f'Server-side cursor `{name}` opened for {query=}, {args=}'))
+
+            if batches:
+                while rows := cur.fetchmany(itersize):
+                    rows_total += len(rows)
+                    yield rows
+            else:
+                for row in cur:
+                    rows_total += 1
+                    yield row
+        except GeneratorExit:
+            self.logger.info(self.log_msg(f'Iteration over server-side cursor `{name}` stopped by the consumer'))
+            raise
+        except Exception as ex:
+            error = ex
+            self.logger.exception(self.log_msg(f'Error iterating {query=}, {args=}; {ex=}'))
+            raise PgConnectorError(f'Error iterating {query=}') from ex
+        finally:
+            # the time includes the time spent by the consumer between rows
+            PgQueryStats.record(query, time.perf_counter() - start, rows=rows_total, error=error is not None, args=args)
+            try:
+                if cur is not None:
+                    cur.close()
+            except Exception as ex:
+                self.logger.warning(self.log_msg(f'Error closing server-side cursor `{name}`, {ex=}'))
+
+            if own_transaction and self._conn.status != psycopg2.extensions.STATUS_READY:
+                if error is None:
+                    self.commit()
+                else:
+                    self.rollback()
+
+    def fetch_columns(self, query: str, args: tuple=None, batch_size: int=65536, arrow: bool=False, chunk_size: int=1024*1024):
+        '''
+        execute query with `COPY (query) TO STDOUT` in binary format and yield results as columns,
+        without Python objects for every value of fixed-width columns (bool, integers, floats, date, timestamp);
+        requires `numpy` (and `pyarrow` for Arrow output), see `PgColumnarDecoder`
+
+        the data is received by a background thread while the batches are consumed; the transaction is handled
+        as in `iter_query()`; until the generator is exhausted or closed the connection is busy with COPY,
+        other methods of the connector raise `PgConnectorError`
+
+        in:
+            query, str - SELECT query, for example 'SELECT n, x FROM t WHERE n > %s'
+            args, tuple
+            batch_size, int - number of rows in one batch
+            arrow, bool - yield `pyarrow.RecordBatch` instead of `PgColumnarBatch`
+            chunk_size, int - approximate size of COPY data passed to the decoder at once, in bytes
+
+        out: generator of PgColumnarBatch (NumPy arrays and NULL masks) or pyarrow.RecordBatch
+        '''
+        # numpy is imported only by this method, it isn't required for other methods
+        from etltools.pg_tools.pg_columnar import PgColumnarDecoder
+
+        self._check_busy()
+        own_transaction = self._conn.status == psycopg2.extensions.STATUS_READY
+        query = query.rstrip().rstrip(';')
+        if args:
+            query = self._cur.mogrify(query, args).decode(psycopg2.extensions.encodings[self._conn.encoding])
+
+        chunks = queue.Queue(maxsize=4)
+        stop = threading.Event()
+        done = object() # end of COPY data in the queue
+        error = None
+        decoder = None
+        thread = None
+        start = time.perf_counter()
+        self._busy = query
+
+        class Writer:
+            '''
+            file-like object for `copy_expert()`: psycopg2 writes COPY data row by row, the rows are joined into chunks
+            '''
+            def __init__(self):
+                self.buffer = bytearray()
+
+            def write(self, data):
+                if stop.is_set():
+                    raise PgConnectorError('Columnar fetch stopped by the consumer')
+                self.buffer += data
+                if len(self.buffer) >= chunk_size:
+                    chunks.put(bytes(self.buffer))
+                    self.buffer.clear()
+
+        def copy():
+            writer = Writer()
+            try:
+                self._cur.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT binary);', writer, chunk_size)
+                chunks.put(bytes(writer.buffer))
+                chunks.put(done)
+            except Exception as ex:
+                chunks.put(ex)
+
+        try:
+            # names and types of the result columns
+            self._cur.execute(f'SELECT * FROM ({query}) AS etltools_columnar LIMIT 0;')
+            names = [column.name for column in self._cur.description]
+            oids = [column.type_code for column in self._cur.description]
+            self._cur.execute('SELECT oid, typname FROM pg_type WHERE oid = ANY(%s);', (oids,))
+            type_names = dict(self._cur.fetchall())
+            decoder = PgColumnarDecoder(names, [type_names[oid] for oid in oids], batch_size=batch_size)
+
+            thread = threading.Thread(target=copy, daemon=True)
+            thread.start()
+            self.logger.info(self.log_msg(f'Columnar fetch started for {query=}, {batch_size=}, {arrow=}'))
+
+            while (chunk := chunks.get()) is not done:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                for batch in decoder.feed(chunk):
+                    yield batch.to_arrow() if arrow else batch
+            for batch in decoder.finish():
+                yield batch.to_arrow() if arrow else batch
+
+            self.logger.info(self.log_msg(f'Columnar fetch finished for {query=}, rows={decoder.rows}'))
+        except GeneratorExit:
+            self.logger.info(self.log_msg(f'Columnar fetch stopped by the consumer for {query=}'))
+            raise
+        except Exception as ex:
+            error = ex
+            self.logger.exception(self.log_msg(f'Error in columnar fetch {query=}; {ex=}'))
+            raise PgConnectorError(f'Error in columnar fetch {query=}') from ex
+        finally:
+            if thread is not None:
+                stop.set()
+                while thread.is_alive(): # the thread may wait for a free place in the queue
+                    try:
+                        chunks.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                thread.join()
+            self._busy = None
+
+            PgQueryStats.record(query, time.perf_counter() - start, rows=decoder.rows if decoder else 0, error=error is not None)
+            if own_transaction and self._conn.status != psycopg2.extensions.STATUS_READY:
+                if error is None:
+                    self.commit()
+                else:
+                    self.rollback()
+
+    def copy_expert(self, query: str, file, size: int=8192) -> int:
+        '''
+        execute `COPY ... FROM STDIN` or `COPY ... TO STDOUT` query with the given file-like object
+
+        in:
+            query, str - COPY query
+            file - file-like object with read() method for `FROM STDIN` or write() method for `TO STDOUT`
+            size, int - size of the buffer used to read from the file
+
+        out: number of rows processed by COPY, int
+        '''
+        self._check_busy()
+        start = time.perf_counter()
+        try:
+            self._cur.copy_expert(query, file, size)
+        except Exception as ex:
+            PgQueryStats.record(query, time.perf_counter() - start, error=True)
+            self.logger.exception(self.log_msg(f'Error executing COPY {query=}; {ex=}'))
+            raise PgConnectorError(f'Error executing COPY {query=}') from ex
+
+        PgQueryStats.record(query, time.perf_counter() - start, rows=max(self._cur.rowcount, 0))
+        self.logger.info(self.log_msg(f'Successfully executed COPY {query=}, rows={self._cur.rowcount}'))
+        return self._cur.rowcount
+
+    def copy_in(self, table: str, columns: list, rows, chunk_size: int=1024*1024, binary: bool=False) -> int:
+        '''
+        stream rows from any iterable (for example, a generator) into the table with `COPY ... FROM STDIN`;
+        rows are encoded and sent in chunks of about `chunk_size` bytes, so memory usage doesn't depend on the number of rows
+
+        in:
+            table, str - table name, can be qualified with schema name, for example 'public.user_agent'
+            columns, list - column names in the order of values in the rows
+            rows, iterable - rows of values (tuples or lists), None values are NULLs
+            chunk_size, int - approximate size of one chunk in bytes
+            binary, bool - use binary COPY format; faster for numeric and timestamp data, but values must exactly
+                match column types (for example, int for `INTEGER` and datetime for `TIMESTAMP`)
+
+        out: number of copied rows, int
+        '''
+        self._check_busy()
+        table_ident = psycopg2.sql.Identifier(*table.split('.'))
+        query = psycopg2.sql.SQL('COPY {table} ({columns}) FROM STDIN{options};').format(
+            table=table_ident,
+            columns=psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier(column) for column in columns),
+            options=psycopg2.sql.SQL(' WITH (FORMAT binary)' if binary else ''),
+        )
+
+        query_text = query.as_string(self._conn)
+        reader = None
+        start = time.perf_counter()
+        try:
+            encoders = None
+            if binary:
+                self._cur.execute(
+                    'SELECT a.attname, t.typname FROM pg_attribute AS a JOIN pg_type AS t ON t.oid=a.atttypid '
+                    'WHERE a.attrelid=%s::regclass AND a.attnum>0 AND NOT a.attisdropped;',
+                    (table_ident.as_string(self._conn),)
+                )
+                type_names = dict(self._cur.fetchall())
+                encoders = PgCopyReader.binary_encoders([type_names[column] for column in columns])
+
+            reader = PgCopyReader(rows, encoders=encoders, chunk_size=chunk_size)
+            self._cur.copy_expert(query, reader, chunk_size)
+        except Exception as ex:
+            PgQueryStats.record(query_text, time.perf_counter() - start, error=True)
+            if reader is not None and reader.error is not None:
+                ex = reader.error # the error of a row instead of `QueryCanceled` from psycopg2
+            self.logger.exception(self.log_msg(f'Error executing COPY into {table=}, {columns=}, {binary=}; {ex=}'))
+            raise PgConnectorError(f'Error executing COPY into {table=}') from ex
+
+        PgQueryStats.record(query_text, time.perf_counter() - start, rows=reader.rows)
+        self.logger.info(self.log_msg(f'Successfully copied {reader.rows} rows into {table=}, {columns=}, {binary=}'))
+        return reader.rows
+
+    def commit(self, raise_error: bool=False):
+        '''
+        commit open transaction; on error the transaction is rolled back
+
+        in: raise_error, bool - raise PgConnectorError on error instead of logging it only
         '''
+        self._check_busy()
         if self._conn.status == psycopg2.extensions.STATUS_READY:
             self.logger.info(self.log_msg('Nothing to commit'))
         else:
@@ -105,6 +601,8 @@ class PgConnector(Logger):
             except Exception as ex:
                 self._conn.rollback()
                 self.logger.exception(self.log_msg(f'Error during commit, {ex=}. The transaction was canceled'))
+                if raise_error:
+                    raise PgConnectorError('Error during commit') from ex
             else:
                 self.logger.info(self.log_msg('Successfully committed'))
 
@@ -112,6 +610,7 @@ class PgConnector(Logger):
         '''
         rollback open transaction
         '''
+        self._check_busy()
         if self._conn.status == psycopg2.extensions.STATUS_READY:
             self.logger.info(self.log_msg('Nothing to rollback'))
         else:
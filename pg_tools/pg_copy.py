@@ -0,0 +1,215 @@
+'''
+encoders of Python rows into text and binary formats of `COPY ... FROM STDIN`
+'''
+
+import datetime
+import json
+import struct
+import uuid
+
+from etltools.pg_tools.pg_tools import PgTools, PgToolsError
+
+
+class PgCopyError(Exception):
+    pass
+
+
+class PgCopyReader:
+    '''
+    file-like object for `cursor.copy_expert()`: reads rows from any iterable (for example, a generator)
+    and returns them encoded for `COPY ... FROM STDIN` in chunks of about `chunk_size` bytes,
+    so only one chunk is kept in memory
+
+    :Example:
+
+    >>> reader = PgCopyReader(((n, f'name {n}') for n in range(3)))
+    >>> reader.read()
+    '0\\tname 0\\n1\\tname 1\\n2\\tname 2\\n'
+    '''
+    def __init__(self, rows, encoders: list=None, chunk_size: int=1024*1024):
+        '''
+        in:
+            rows, iterable - rows of values (tuples or lists)
+            encoders, list - binary encoders of columns, see `PgCopyReader.binary_encoders()`;
+                text format is used if None
+            chunk_size, int - approximate size of one chunk in bytes
+        '''
+        self._rows = iter(rows)
+        self._encoders = encoders
+        self.chunk_size = chunk_size
+        self.rows = 0 # number of rows read from the iterable
+        self.error = None # exception of encoding, psycopg2 reports it only as `error in .read() call`
+
+        self._binary = encoders is not None
+        self._header = self._binary # the header is not sent yet
+        self._trailer = self._binary # the trailer is not sent yet
+
+    def read(self, size: int=-1):
+        '''
+        read next chunk; `str` for text format and `bytes` for binary format, empty chunk at the end of rows
+
+        in: size, int - requested chunk size, `chunk_size` is used if `size` is smaller
+        '''
+        size = max(size, self.chunk_size)
+        pieces = []
+        length = 0
+
+        if self._header:
+            self._header = False
+            pieces.append(BINARY_HEADER)
+            length += len(BINARY_HEADER)
+
+        encode = self._encode_binary_row if self._binary else self.text_row
+        for row in self._rows:
+            self.rows += 1
+            try:
+                piece = encode(row)
+            except Exception as ex:
+                self.error = ex
+                raise
+            pieces.append(piece)
+            length += len(piece)
+            if length >= size:
+                break
+        else:
+            if self._trailer:
+                self._trailer = False
+                pieces.append(BINARY_TRAILER)
+
+        if self._binary:
+            return b''.join(pieces)
+        return ''.join(pieces)
+
+    @classmethod
+    def text_value(cls, value) -> str:
+        '''
+        encode one value for the text format of COPY
+
+        supported values: None (NULL), str, bool, int, float, decimal.Decimal, date/time objects, uuid.UUID,
+        bytes (bytea), dict (json), list, tuple and NumPy array (ARRAY by `PgTools.encode_array()`)
+        '''
+        if value is None:
+            return '\\N'
+        if isinstance(value, str):
+            return cls.text_escape(value)
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (int, uuid.UUID)):
+            return str(value)
+        if isinstance(value, float):
+            if value != value:
+                return 'NaN'
+            if value in (float('inf'), float('-inf')):
+                return 'Infinity' if value > 0 else '-Infinity'
+            return repr(value)
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return '\\\\x' + bytes(value).hex()
+        if isinstance(value, dict):
+            return cls.text_escape(json.dumps(value))
+        if PgTools.is_array(value):
+            try:
+                return cls.text_escape(PgTools.encode_array(value))
+            except PgToolsError as ex:
+                raise PgCopyError(f'Cannot encode {value=} for COPY') from ex
+        return cls.text_escape(str(value))
+
+    @classmethod
+    def text_escape(cls, value: str) -> str:
+        '''
+        escape backslashes, tabs and line breaks in a string for the text format of COPY
+        '''
+        if '\\' in value:
+            value = value.replace('\\', '\\\\')
+        if '\t' in value or '\n' in value or '\r' in value:
+            value = value.replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        return value
+
+    @classmethod
+    def text_row(cls, row) -> str:
+        '''
+        encode one row for the text format of COPY
+        '''
+        text_value = cls.text_value
+        return '\t'.join([text_value(value) for value in row]) + '\n'
+
+    @classmethod
+    def binary_encoders(cls, type_names: list) -> list:
+        '''
+        binary encoders for columns of the given PostgreSQL types
+
+        in: type_names, list - names of PostgreSQL types from `pg_type.typname`, for example ['int4', 'text']
+
+        out: list of functions value -> bytes
+        '''
+        encoders = []
+        for type_name in type_names:
+            if type_name not in BINARY_ENCODERS:
+                raise PgCopyError(f'Binary COPY is not supported for {type_name=}, use text format')
+            encoders.append(BINARY_ENCODERS[type_name])
+        return encoders
+
+    def _encode_binary_row(self, row) -> bytes:
+        if len(row) != len(self._encoders):
+            raise PgCopyError(f'Expected {len(self._encoders)} values in the row, got {len(row)}')
+
+        pieces = [struct.pack('>h', len(row))]
+        for value, encode in zip(row, self._encoders):
+            if value is None:
+                pieces.append(NULL_LENGTH)
+            else:
+                data = encode(value)
+                pieces.append(struct.pack('>i', len(data)))
+                pieces.append(data)
+        return b''.join(pieces)
+
+
+def _encode_timestamp(value: datetime.datetime) -> bytes:
+    # as in the text format, the time zone of aware values is ignored by `timestamp`
+    delta = value.replace(tzinfo=None) - PG_EPOCH
+    return struct.pack('>q', (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def _encode_timestamptz(value: datetime.datetime) -> bytes:
+    # aware values are converted to UTC, see `timestamptz` binary format; naive values are stored as is
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return _encode_timestamp(value)
+
+
+def _encode_date(value: datetime.date) -> bytes:
+    if isinstance(value, datetime.datetime):
+        value = value.date() # as in the text format, the time is ignored
+    return struct.pack('>i', (value - PG_EPOCH.date()).days)
+
+
+def _encode_text(value) -> bytes:
+    return (value if isinstance(value, str) else str(value)).encode('utf-8')
+
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+NULL_LENGTH = struct.pack('>i', -1)
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+
+# PostgreSQL type name : function value -> bytes
+BINARY_ENCODERS = {
+    'bool'          : lambda value: b'\x01' if value else b'\x00',
+    'int2'          : struct.Struct('>h').pack,
+    'int4'          : struct.Struct('>i').pack,
+    'int8'          : struct.Struct('>q').pack,
+    'float4'        : struct.Struct('>f').pack,
+    'float8'        : struct.Struct('>d').pack,
+    'text'          : _encode_text,
+    'varchar'       : _encode_text,
+    'bpchar'        : _encode_text,
+    'name'          : _encode_text,
+    'json'          : lambda value: _encode_text(value if isinstance(value, str) else json.dumps(value)),
+    'jsonb'         : lambda value: b'\x01' + _encode_text(value if isinstance(value, str) else json.dumps(value)),
+    'bytea'         : bytes,
+    'uuid'          : lambda value: (value if isinstance(value, uuid.UUID) else uuid.UUID(value)).bytes,
+    'date'          : _encode_date,
+    'timestamp'     : _encode_timestamp,
+    'timestamptz'   : _encode_timestamptz,
+}
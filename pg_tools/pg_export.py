@@ -0,0 +1,385 @@
+# parallel export of a table or a query into compressed sharded files with `COPY ... TO STDOUT`
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import psycopg2.extensions
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_extract import PgParallelExtractor
+
+
+class PgExporterError(Exception):
+    pass
+
+
+class PgExporter(Logger):
+    '''
+    export a table (split into key or `ctid` ranges, see `PgParallelExtractor`) or a query into files
+
+    every range is exported by one of the worker connections with `COPY (query) TO STDOUT` into rolling shards:
+    a new file is started when the uncompressed size of the current file reaches `shard_size`;
+    all workers use the same exported snapshot; a JSON manifest with the files, their row counts, sizes and sha256
+    checksums is written after all files are finished, so a downstream system can wait for the manifest
+
+    formats: 'csv' (with header in every file), 'tsv' (text format of COPY) with 'gzip', 'zstd' (requires `zstandard`)
+    or no compression, and 'parquet' (requires `numpy` and `pyarrow`) with any compression supported by `pyarrow`
+
+    :Example:
+
+    >>> exporter = PgExporter(config, 'user_agent', '/data/export', key_column='user_agent_id', compression='zstd')
+    >>> manifest = exporter.export()
+    >>> manifest['rows'], len(manifest['files'])
+    (1000000, 4)
+    '''
+    FORMATS = ('csv', 'tsv', 'parquet')
+    TEXT_COMPRESSIONS = (None, 'gzip', 'zstd')
+    EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, config: DBConfig, table: str, out_dir: str, name: str=None, query: str=None, columns: list=None,
+                 key_column: str=None, where: str=None, args: tuple=None, workers: int=4, partitions: int=None,
+                 format: str='csv', compression: str='gzip', shard_size: int=256*1024*1024, batch_size: int=65536):
+        '''
+        in:
+            config, DBConfig - database configuration
+            table, str - table to export, can be qualified with schema name; None if `query` is exported
+            out_dir, str - directory for the files and the manifest, it is created if not exists
+            name, str - prefix of file names, defaults to the table name
+            query, str - export the result of this query with one connection instead of the table, `args` are used for it
+            columns, key_column, where, args, workers, partitions - see `PgParallelExtractor`
+            format, str - 'csv', 'tsv' or 'parquet'
+            compression, str - 'gzip', 'zstd' or None; for 'parquet' any codec of `pyarrow`, for example 'snappy'
+            shard_size, int - approximate maximum size of uncompressed data in one file, in bytes
+            batch_size, int - number of rows in one row group for 'parquet'
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgExporterError(msg)
+        if (table is None) == (query is None) or (name or table) is None:
+            msg = f'Either table or query (with name) must be exported : {table=}, {query=}, {name=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgExporterError(msg)
+        if format not in self.FORMATS or (format != 'parquet' and compression not in self.TEXT_COMPRESSIONS):
+            msg = f'Unsupported format : {format=}, {compression=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgExporterError(msg)
+
+        self.config = config
+        self.table = table
+        self.query = query
+        self.args = args
+        self.out_dir = out_dir
+        self.name = name or table
+        self.format = format
+        self.compression = compression
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.workers = workers
+
+        if table is not None:
+            self._extractor = PgParallelExtractor(
+                config, table, columns=columns, key_column=key_column, where=where, args=args, workers=workers, partitions=partitions
+            )
+
+        self._files = [] # all files of the export : dicts of the manifest
+        self._files_lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.out_dir, f'{self.name}.manifest.json')
+
+    def export(self) -> dict:
+        '''
+        export the data and write the manifest; after an error all files of the export are removed
+
+        out: manifest, dict {
+            'name', 'table', 'query', 'format', 'compression', 'snapshot', 'created',
+            'rows' : total number of rows,
+            'files' : [{'file': file name, 'partition': 0, 'rows': 0, 'bytes': file size, 'sha256': checksum}, ...]
+        }
+        '''
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._files = []
+        errors = []
+        stop = threading.Event()
+
+        try:
+            with PgConnector(self.config) as coordinator:
+                coordinator.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;')
+                result = coordinator.execute('SELECT pg_export_snapshot();')
+                if result is None:
+                    raise PgExporterError('Error exporting snapshot')
+                snapshot = result[0][0]
+
+                if self.query is not None:
+                    queries = [self._query_text(coordinator)]
+                else:
+                    queries = [self._extractor.range_query(coordinator, start, end, ordered=False) for start, end in self._extractor.ranges(coordinator)]
+                tasks = iter(enumerate(queries))
+                tasks_lock = threading.Lock()
+
+                def worker(worker_idx):
+                    try:
+                        with PgConnector(self.config) as db:
+                            db._cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;')
+                            db._cur.execute('SET TRANSACTION SNAPSHOT %s;', (snapshot,))
+                            while not stop.is_set():
+                                with tasks_lock:
+                                    partition, query = next(tasks, (None, None))
+                                if partition is None:
+                                    break
+                                if self.format == 'parquet':
+                                    self._export_parquet(db, partition, query.rstrip(';'), stop)
+                                else:
+                                    self._export_text(db, partition, query.rstrip(';'), stop)
+                    except Exception as ex:
+                        self.logger.exception(self.log_msg(f'Error in export worker {worker_idx}, {ex=}'))
+                        errors.append(ex)
+                        stop.set()
+
+                threads = [threading.Thread(target=worker, args=(idx,), daemon=True) for idx in range(min(self.workers, len(queries)))]
+                self.logger.info(self.log_msg(
+                    f'Export of {self.name} started : {len(queries)} partitions, {len(threads)} workers, {self.format=}, {self.compression=}'
+                ))
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                if errors:
+                    raise PgExporterError(f'Error during export of {self.name} : {errors=}')
+        except Exception as ex:
+            self._remove_files()
+            if isinstance(ex, PgExporterError):
+                raise
+            raise PgExporterError(f'Error during export of {self.name}') from ex
+
+        files = sorted(self._files, key=lambda file: file['file'])
+        manifest = {
+            'name'          : self.name,
+            'table'         : self.table,
+            'query'         : self.query,
+            'format'        : self.format,
+            'compression'   : self.compression,
+            'snapshot'      : snapshot,
+            'created'       : datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'rows'          : sum(file['rows'] for file in files),
+            'files'         : files,
+        }
+
+        # the manifest appears only when it is completely written
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+        self.logger.info(self.log_msg(f'Export of {self.name} finished : {manifest["rows"]} rows, {len(files)} files'))
+        return manifest
+
+    def _query_text(self, db: PgConnector) -> str:
+        query = self.query.rstrip().rstrip(';')
+        if self.args:
+            query = db._cur.mogrify(query, self.args).decode(psycopg2.extensions.encodings[db._conn.encoding])
+        return query
+
+    def _file_name(self, partition: int, shard: int) -> str:
+        if self.format == 'parquet':
+            return f'{self.name}-{partition:04d}-{shard:04d}.parquet'
+        return f'{self.name}-{partition:04d}-{shard:04d}.{self.format}{self.EXTENSIONS[self.compression]}'
+
+    def _add_file(self, file: dict):
+        with self._files_lock:
+            self._files.append(file)
+
+    def _remove_files(self):
+        for file in self._files:
+            try:
+                os.remove(os.path.join(self.out_dir, file['file']))
+            except FileNotFoundError:
+                pass
+        self._files = []
+
+    def _export_text(self, db: PgConnector, partition: int, query: str, stop: threading.Event):
+        options = 'FORMAT csv, HEADER true' if self.format == 'csv' else 'FORMAT text'
+        writer = _ShardWriter(self, partition, header=self.format == 'csv', stop=stop)
+        try:
+            db.copy_expert(f'COPY ({query}) TO STDOUT WITH ({options});', writer)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+
+    def _export_parquet(self, db: PgConnector, partition: int, query: str, stop: threading.Event):
+        import pyarrow.parquet # optional dependency, only for Parquet files
+
+        shard = 0
+        parquet_writer = None
+        path = None
+        rows = 0
+        size = 0
+
+        def close():
+            parquet_writer.close()
+            self._add_file(_file_info(path, partition, rows))
+
+        try:
+            for batch in db.fetch_columns(query, batch_size=self.batch_size, arrow=True):
+                if stop.is_set():
+                    raise PgExporterError('Export is stopped')
+                if parquet_writer is None:
+                    path = os.path.join(self.out_dir, self._file_name(partition, shard))
+                    parquet_writer = pyarrow.parquet.ParquetWriter(path, batch.schema, compression=self.compression or 'none')
+                parquet_writer.write_batch(batch)
+                rows += batch.num_rows
+                size += batch.nbytes
+                if size >= self.shard_size:
+                    close()
+                    parquet_writer = None
+                    shard += 1
+                    rows = size = 0
+        except Exception:
+            if parquet_writer is not None:
+                parquet_writer.close()
+                os.remove(path)
+            raise
+
+        # there is no file for an empty partition
+        if parquet_writer is not None:
+            close()
+
+
+class _HashingFile:
+    '''
+    binary file which calculates sha256 and size of the written data
+    '''
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ShardWriter:
+    '''
+    file-like object for `copy_expert()`: psycopg2 writes COPY data row by row, rows are buffered,
+    compressed and written into rolling files of about `shard_size` bytes of uncompressed data
+    '''
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, exporter: PgExporter, partition: int, header: bool, stop: threading.Event):
+        self.exporter = exporter
+        self.partition = partition
+        self.stop = stop
+
+        self.header = None if header else b'' # the first row of the data if header is expected
+        self.shard = 0
+        self.path = None
+        self.raw = None # _HashingFile of the current shard
+        self.file = None # compressed stream of the current shard
+        self.buffer = []
+        self.buffer_size = 0
+        self.size = 0 # uncompressed size of the current shard
+        self.rows = 0 # number of rows in the current shard
+
+    def write(self, data):
+        if self.stop.is_set():
+            raise PgExporterError('Export is stopped')
+        if isinstance(data, str):
+            data = data.encode()
+        if self.header is None:
+            self.header = data
+            return
+
+        if self.file is None:
+            self._open()
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        self.size += len(data)
+        self.rows += 1
+
+        if self.buffer_size >= self.BUFFER_SIZE:
+            self._flush()
+        if self.size >= self.exporter.shard_size:
+            self._close()
+
+    def _open(self):
+        self.path = os.path.join(self.exporter.out_dir, self.exporter._file_name(self.partition, self.shard))
+        self.raw = _HashingFile(self.path)
+        if self.exporter.compression == 'gzip':
+            self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6, mtime=0) # the level of `gzip` utility
+        elif self.exporter.compression == 'zstd':
+            import zstandard # optional dependency, only for zstd compression
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.file = self.raw
+        self.buffer = [self.header]
+        self.buffer_size = self.size = len(self.header)
+        self.rows = 0
+
+    def _flush(self):
+        self.file.write(b''.join(self.buffer))
+        self.buffer = []
+        self.buffer_size = 0
+
+    def _close(self):
+        self._flush()
+        if self.file is not self.raw:
+            self.file.close()
+        self.raw.close()
+        self.exporter._add_file({
+            'file'      : os.path.basename(self.path),
+            'partition' : self.partition,
+            'rows'      : self.rows,
+            'bytes'     : self.raw.bytes,
+            'sha256'    : self.raw.sha256.hexdigest(),
+        })
+        self.file = None
+        self.raw = None
+        self.shard += 1
+
+    def close(self):
+        '''
+        finish the last shard; there is no file for an empty partition
+        '''
+        if self.file is not None:
+            self._close()
+
+    def abort(self):
+        '''
+        remove the unfinished shard after an error
+        '''
+        if self.file is not None:
+            self.raw.close()
+            os.remove(self.path)
+            self.file = None
+
+
+def _file_info(path: str, partition: int, rows: int) -> dict:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return {
+        'file'      : os.path.basename(path),
+        'partition' : partition,
+        'rows'      : rows,
+        'bytes'     : os.path.getsize(path),
+        'sha256'    : sha256.hexdigest(),
+    }
@@ -0,0 +1,245 @@
+# parallel extraction of a table by key or `ctid` ranges over several connections
+
+import os
+import queue
+import threading
+
+import psycopg2.extensions
+import psycopg2.sql
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+
+
+class PgParallelExtractorError(Exception):
+    pass
+
+
+class PgParallelExtractor(Logger):
+    '''
+    read a large table with several connections in parallel
+
+    the table is split into ranges of an integer key column or, without a key column, into ranges of pages (`ctid`),
+    the ranges are read concurrently by worker threads with server-side cursors and the batches of rows are merged
+    into one stream; all workers import the snapshot exported by the coordinator connection,
+    so they see the same consistent state of the table
+
+    ordered stream: batches of the ranges in order of the key (or physical order for `ctid` ranges),
+    ordered by the key inside the range; unordered stream: batches as soon as they are read by any worker
+
+    :Example:
+
+    >>> extractor = PgParallelExtractor(config, 'user_agent', columns=('user_agent_id', 'title'), key_column='user_agent_id')
+    >>> for rows in extractor.extract():
+    ...     print(len(rows))
+    '''
+    def __init__(self, config: DBConfig, table: str, columns: list=None, key_column: str=None, where: str=None,
+                 args: tuple=None, workers: int=4, partitions: int=None, batch_size: int=2000, queue_size: int=8):
+        '''
+        in:
+            config, DBConfig - database configuration
+            table, str - table name, can be qualified with schema name
+            columns, list - columns to extract, all columns if None
+            key_column, str - integer column to split the table by (for example, primary key);
+                if None, the table is split by ranges of pages with `ctid` (PostgreSQL 14+ for fast TID range scans)
+            where, str - additional filter for rows, for example 'successes > %s'
+            args, tuple - args for `where`
+            workers, int - number of connections
+            partitions, int - number of ranges, defaults to `4 * workers`; smaller ranges balance the load better
+            batch_size, int - number of rows in one batch
+            queue_size, int - maximum number of batches waiting to be consumed (per range for ordered stream)
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgParallelExtractorError(msg)
+
+        self.config = config
+        self.table = table
+        self.columns = tuple(columns) if columns else None
+        self.key_column = key_column
+        self.where = where
+        self.args = tuple(args) if args else ()
+        self.workers = workers
+        self.partitions = partitions or 4 * workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def ranges(self, db: PgConnector) -> list:
+        '''
+        split the table into ranges
+
+        in: db, PgConnector - connection with the snapshot of the extraction
+
+        out: list of (start, end) tuples, `start` is inclusive and `end` is exclusive, None means no limit;
+            key values for `key_column` or page numbers for `ctid`
+        '''
+        sql = psycopg2.sql
+        table = sql.Identifier(*self.table.split('.'))
+
+        if self.key_column:
+            result = db.execute(
+                sql.SQL('SELECT MIN({key}), MAX({key}) FROM {table};').format(key=sql.Identifier(self.key_column), table=table).as_string(db._conn)
+            )
+            if result is None:
+                raise PgParallelExtractorError(f'Error reading key range of {self.table}')
+            start, end = result[0]
+            if start is None:
+                return [(None, None)]
+            end += 1
+        else:
+            result = db.execute(
+                "SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::int;", (table.as_string(db._conn),)
+            )
+            if result is None:
+                raise PgParallelExtractorError(f'Error reading size of {self.table}')
+            start, end = 0, max(result[0][0], 1)
+
+        partitions = max(1, min(self.partitions, end - start))
+        bounds = [start + (end - start) * idx // partitions for idx in range(partitions + 1)]
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+        # the first and the last ranges are open: NULL keys are in the last range, and pages added
+        # after the size was measured have no rows visible in the snapshot, but it costs nothing to read them
+        ranges[0] = (None, ranges[0][1])
+        ranges[-1] = (ranges[-1][0], None)
+        return ranges
+
+    def range_query(self, db: PgConnector, start, end, ordered: bool) -> str:
+        '''
+        query to read one range, with all args
+        '''
+        sql = psycopg2.sql
+        columns = sql.SQL(', ').join(sql.Identifier(column) for column in self.columns) if self.columns else sql.SQL('*')
+
+        conditions = []
+        args = []
+        if self.key_column:
+            key = sql.Identifier(self.key_column)
+            if start is not None:
+                conditions.append(sql.SQL('{key} >= %s').format(key=key))
+                args.append(start)
+            if end is not None:
+                conditions.append(sql.SQL('{key} < %s').format(key=key))
+                args.append(end)
+            elif start is not None:
+                conditions[-1] = sql.SQL('({key} >= %s OR {key} IS NULL)').format(key=key)
+            order = key
+        else:
+            if start is not None:
+                conditions.append(sql.SQL('ctid >= %s::tid'))
+                args.append(f'({start},0)')
+            if end is not None:
+                conditions.append(sql.SQL('ctid < %s::tid'))
+                args.append(f'({end},0)')
+            order = sql.SQL('ctid')
+
+        if self.where:
+            conditions.append(sql.SQL('(') + sql.SQL(self.where) + sql.SQL(')'))
+            args.extend(self.args)
+
+        query = sql.SQL('SELECT {columns} FROM {table}').format(columns=columns, table=sql.Identifier(*self.table.split('.')))
+        if conditions:
+            query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions)
+        if ordered:
+            query += sql.SQL(' ORDER BY {order}').format(order=order)
+        query = query.as_string(db._conn) + ';'
+        if not args:
+            return query % () # psycopg2 doesn't process `%%` in queries without args
+        return db._cur.mogrify(query, args).decode(psycopg2.extensions.encodings[db._conn.encoding])
+
+    def extract(self, ordered: bool=False):
+        '''
+        read the table in parallel
+
+        in: ordered, bool - yield batches in order of the ranges (and rows in order of the key inside the ranges)
+
+        out: generator of batches of rows (lists of tuples)
+        '''
+        stop = threading.Event()
+        errors = []
+        done = object() # end of the range in the queue
+
+        try:
+            with PgConnector(self.config) as coordinator:
+                # the snapshot exists while the transaction of the coordinator is open
+                coordinator.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;')
+                result = coordinator.execute('SELECT pg_export_snapshot();')
+                if result is None:
+                    raise PgParallelExtractorError('Error exporting snapshot')
+                snapshot = result[0][0]
+
+                ranges = self.ranges(coordinator)
+                queries = [self.range_query(coordinator, start, end, ordered) for start, end in ranges]
+                tasks = iter(enumerate(queries))
+                tasks_lock = threading.Lock() # ranges are taken by the workers strictly in order
+                if ordered:
+                    queues = [queue.Queue(maxsize=self.queue_size) for _ in queries]
+                else:
+                    queues = [queue.Queue(maxsize=self.queue_size)] * len(queries)
+
+                def put(q, item) -> bool:
+                    while not stop.is_set():
+                        try:
+                            q.put(item, timeout=0.1)
+                            return True
+                        except queue.Full:
+                            pass
+                    return False
+
+                def worker(worker_idx):
+                    try:
+                        with PgConnector(self.config) as db:
+                            # errors are raised here, the worker can't read anything without the snapshot
+                            db._cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;')
+                            db._cur.execute('SET TRANSACTION SNAPSHOT %s;', (snapshot,))
+
+                            while not stop.is_set():
+                                with tasks_lock:
+                                    range_idx, query = next(tasks, (None, None))
+                                if range_idx is None:
+                                    break
+                                for rows in db.iter_query(query, itersize=self.batch_size, batches=True):
+                                    if not put(queues[range_idx], rows):
+                                        return
+                                put(queues[range_idx], done)
+                    except Exception as ex:
+                        self.logger.exception(self.log_msg(f'Error in extract worker {worker_idx}, {ex=}'))
+                        errors.append(ex)
+                        stop.set()
+
+                threads = [threading.Thread(target=worker, args=(idx,), daemon=True) for idx in range(min(self.workers, len(queries)))]
+                for thread in threads:
+                    thread.start()
+                self.logger.info(self.log_msg(
+                    f'Extraction of {self.table} started : {len(queries)} ranges, {len(threads)} workers, {ordered=}, {snapshot=}'
+                ))
+
+                try:
+                    rows_total = 0
+                    for q in (queues if ordered else queues[:1]):
+                        ranges_left = 1 if ordered else len(queries)
+                        while ranges_left:
+                            try:
+                                item = q.get(timeout=0.1)
+                            except queue.Empty:
+                                if errors:
+                                    break
+                                continue
+                            if item is done:
+                                ranges_left -= 1
+                            else:
+                                rows_total += len(item)
+                                yield item
+                        if errors:
+                            raise PgParallelExtractorError(f'Error during extraction of {self.table} : {errors=}')
+                finally:
+                    stop.set()
+                    for thread in threads:
+                        thread.join()
+        except PgConnectorError as ex:
+            raise PgParallelExtractorError(f'Error during extraction of {self.table}') from ex
+
+        self.logger.info(self.log_msg(f'Extraction of {self.table} finished : {rows_total} rows'))
@@ -0,0 +1,251 @@
+# incremental extraction of new and changed rows by a high-watermark column
+
+import os
+
+import psycopg2.extensions
+import psycopg2.sql
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+
+
+class PgIncrementalExtractorError(Exception):
+    pass
+
+
+class PgIncrementalExtractor(Logger):
+    '''
+    extract only rows which are newer than the high-watermark of the previous run
+
+    the watermark is the maximum value of a monotonic column (timestamp like `update_tz` or serial id)
+    of the extracted rows; it is saved per source in a small state table and only after the downstream load succeeded,
+    so after a failed load the same rows are extracted again
+
+    rows are selected with `column > watermark - overlap AND column <= new watermark`; with an index on the column
+    the run time depends on the number of new rows, not on the size of the table; `overlap` re-reads rows near the watermark
+    to catch late arrivals (for example, rows from long transactions committed with an older `update_tz`),
+    so the downstream load must be idempotent (for example, `PgUpsert`)
+
+    :Example:
+
+    >>> extractor = PgIncrementalExtractor(config, 'user_agent_daily', 'user_agent', 'update_tz', overlap=datetime.timedelta(minutes=5))
+    >>> for rows in extractor.extract():
+    ...     load(rows)
+    >>> extractor.commit()
+    '''
+    STATE_TABLE = 'etltools_watermark'
+
+    def __init__(self, config: DBConfig, source: str, table: str, watermark_column, columns: list=None,
+                 overlap=None, where: str=None, args: tuple=None, batch_size: int=2000, state_table: str=None):
+        '''
+        in:
+            config, DBConfig - database configuration, the state table is in the same database
+            source, str - unique name of the extraction, the key in the state table
+            table, str - table name, can be qualified with schema name
+            watermark_column, str or list - monotonic column; for several columns `COALESCE(column1, column2, ...)`
+                is used, for example ('update_tz', 'insert_tz') if `update_tz` is NULL for new rows
+            columns, list - columns to extract, all columns if None
+            overlap - value subtracted from the saved watermark, for example datetime.timedelta(minutes=5) or 1000 for ids
+            where, str - additional filter for rows, for example 'hardware = %s'
+            args, tuple - args for `where`
+            batch_size, int - number of rows in one batch
+            state_table, str - table with watermarks, `etltools_watermark` by default; it is created by the first
+                `commit()` or `reset()` if not exists, reads don't create it
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgIncrementalExtractorError(msg)
+
+        self.config = config
+        self.source = source
+        self.table = table
+        self.watermark_columns = (watermark_column,) if isinstance(watermark_column, str) else tuple(watermark_column)
+        self.columns = tuple(columns) if columns else None
+        self.overlap = overlap
+        self.where = where
+        self.args = tuple(args) if args else ()
+        self.batch_size = batch_size
+        self.state_table = state_table or self.STATE_TABLE
+
+        self.new_watermark = None # watermark of the last extraction, it is saved by `commit()`
+        self.rows = 0 # number of rows of the last extraction
+        self._state_table_ready = False # the state table is known to exist
+
+    def _watermark_expression(self):
+        sql = psycopg2.sql
+        if len(self.watermark_columns) == 1:
+            return sql.Identifier(self.watermark_columns[0])
+        return sql.SQL('COALESCE({columns})').format(columns=sql.SQL(', ').join(sql.Identifier(column) for column in self.watermark_columns))
+
+    def _query(self, db: PgConnector, query, args: list) -> str:
+        '''
+        query text with all args, so `%%` in `where` is processed even if there are no args
+        '''
+        query = query.as_string(db._conn)
+        if not args:
+            return query % ()
+        return db._cur.mogrify(query, tuple(args)).decode(psycopg2.extensions.encodings[db._conn.encoding])
+
+    def _create_state_table(self, db: PgConnector):
+        if self._state_table_ready:
+            return
+        query = psycopg2.sql.SQL(
+            'CREATE TABLE IF NOT EXISTS {state_table} ('
+            '  source TEXT PRIMARY KEY, '
+            '  watermark TEXT, '
+            '  update_tz TIMESTAMPTZ NOT NULL DEFAULT NOW() '
+            ');'
+        ).format(state_table=psycopg2.sql.Identifier(*self.state_table.split('.')))
+        db.execute(query.as_string(db._conn))
+        self._state_table_ready = True
+
+    def _state_table_exists(self, db: PgConnector) -> bool:
+        '''
+        the existence of the state table is checked until it is found, then reads are plain `SELECT` queries
+        '''
+        if not self._state_table_ready:
+            state_table = psycopg2.sql.Identifier(*self.state_table.split('.')).as_string(db._conn)
+            result = db.execute('SELECT to_regclass(%s) IS NOT NULL;', (state_table,))
+            if result is None:
+                raise PgIncrementalExtractorError(f'Error checking the state table {self.state_table}')
+            self._state_table_ready = result[0][0]
+        return self._state_table_ready
+
+    def watermark(self, db: PgConnector=None) -> str:
+        '''
+        saved watermark of the source as text, None if there is no saved watermark
+        '''
+        if db is None:
+            with PgConnector(self.config) as db:
+                return self.watermark(db)
+
+        if not self._state_table_exists(db):
+            return None
+        query = psycopg2.sql.SQL('SELECT watermark FROM {state_table} WHERE source=%s;').format(
+            state_table=psycopg2.sql.Identifier(*self.state_table.split('.'))
+        )
+        result = db.execute(query.as_string(db._conn), (self.source,))
+        if result is None:
+            raise PgIncrementalExtractorError(f'Error reading watermark of {self.source=}')
+        return result[0][0] if result else None
+
+    def extract(self):
+        '''
+        extract rows which are newer than the saved watermark; the new watermark is kept in `new_watermark`
+        and saved only by `commit()`
+
+        out: generator of batches of rows (lists of tuples)
+        '''
+        sql = psycopg2.sql
+        table = sql.Identifier(*self.table.split('.'))
+        expression = self._watermark_expression()
+        columns = sql.SQL(', ').join(sql.Identifier(column) for column in self.columns) if self.columns else sql.SQL('*')
+        self.new_watermark = None
+        self.rows = 0
+
+        try:
+            watermark = self.watermark()
+            with PgConnector(self.config) as db:
+                # the new watermark and the rows are read from the same snapshot
+                db.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;')
+
+                # the saved watermark is cast to the type of the expression, for example `timestamptz` or `int4`
+                result = db.execute(
+                    sql.SQL('SELECT pg_typeof({expression})::text FROM {table} LIMIT 1;').format(expression=expression, table=table).as_string(db._conn)
+                )
+                if result is None:
+                    raise PgIncrementalExtractorError(f'Error reading {self.table}')
+                if not result:
+                    self.logger.info(self.log_msg(f'Nothing to extract from empty table {self.table}, {self.source=}'))
+                    return
+                watermark_type = sql.SQL(result[0][0])
+
+                conditions = [sql.SQL('{expression} IS NOT NULL').format(expression=expression)]
+                args = []
+                if watermark is not None:
+                    if self.overlap is None:
+                        conditions.append(sql.SQL('{expression} > %s::{type}').format(expression=expression, type=watermark_type))
+                        args.append(watermark)
+                    else:
+                        conditions.append(sql.SQL('{expression} > %s::{type} - %s').format(expression=expression, type=watermark_type))
+                        args.extend((watermark, self.overlap))
+                if self.where:
+                    conditions.append(sql.SQL('(') + sql.SQL(self.where) + sql.SQL(')'))
+                    args.extend(self.args)
+                where = sql.SQL(' AND ').join(conditions)
+
+                result = db.execute(self._query(
+                    db
+                    , sql.SQL('SELECT MAX({expression})::text FROM {table} WHERE {where};').format(expression=expression, table=table, where=where)
+                    , args
+                ))
+                if result is None:
+                    raise PgIncrementalExtractorError(f'Error reading new watermark from {self.table}')
+                new_watermark = result[0][0]
+                if new_watermark is None:
+                    self.logger.info(self.log_msg(f'No new rows in {self.table}, {self.source=}, {watermark=}'))
+                    return
+
+                # rows above the new watermark are committed after the snapshot, they are extracted next time
+                query = sql.SQL('SELECT {columns} FROM {table} WHERE {where} AND {expression} <= %s::{type};').format(
+                    columns=columns, table=table, where=where, expression=expression, type=watermark_type
+                )
+                self.logger.info(self.log_msg(f'Extraction from {self.table} started : {self.source=}, {watermark=}, {new_watermark=}'))
+                for rows in db.iter_query(self._query(db, query, args + [new_watermark]), itersize=self.batch_size, batches=True):
+                    self.rows += len(rows)
+                    yield rows
+
+                self.new_watermark = new_watermark
+                self.logger.info(self.log_msg(f'Extraction from {self.table} finished : {self.source=}, {self.rows} rows, {new_watermark=}'))
+        except PgConnectorError as ex:
+            raise PgIncrementalExtractorError(f'Error during extraction from {self.table}, {self.source=}') from ex
+
+    def commit(self):
+        '''
+        save the watermark of the last finished extraction; call it after the downstream load succeeded
+        '''
+        if self.new_watermark is None:
+            self.logger.info(self.log_msg(f'Nothing to commit, {self.source=}'))
+            return
+
+        query = psycopg2.sql.SQL(
+            'INSERT INTO {state_table} (source, watermark) VALUES (%s, %s) '
+            'ON CONFLICT (source) DO UPDATE SET watermark=EXCLUDED.watermark, update_tz=NOW() '
+            'RETURNING source;'
+        ).format(state_table=psycopg2.sql.Identifier(*self.state_table.split('.')))
+
+        with PgConnector(self.config) as db:
+            self._create_state_table(db)
+            if db.execute(query.as_string(db._conn), (self.source, self.new_watermark)) is None:
+                raise PgIncrementalExtractorError(f'Error saving watermark of {self.source=}')
+
+        self.logger.info(self.log_msg(f'Watermark saved : {self.source=}, watermark={self.new_watermark}'))
+        self.new_watermark = None
+
+    def run(self, load) -> int:
+        '''
+        extract new rows, call `load(rows)` for every batch and save the new watermark if all batches were loaded;
+        after an exception in `load` the watermark is not changed
+
+        out: number of extracted rows, int
+        '''
+        for rows in self.extract():
+            load(rows)
+        self.commit()
+        return self.rows
+
+    def reset(self):
+        '''
+        remove the saved watermark, the next extraction reads all rows
+        '''
+        query = psycopg2.sql.SQL('DELETE FROM {state_table} WHERE source=%s;').format(
+            state_table=psycopg2.sql.Identifier(*self.state_table.split('.'))
+        )
+        with PgConnector(self.config) as db:
+            self._create_state_table(db)
+            db.execute(query.as_string(db._conn), (self.source,))
+        self.logger.info(self.log_msg(f'Watermark removed : {self.source=}'))
@@ -0,0 +1,271 @@
+# thread-safe pool of PostgreSQL connections
+
+import collections
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+
+
+class PgPoolError(Exception):
+    pass
+
+
+class PgPool(Logger):
+    '''
+    thread-safe pool of PostgreSQL connections for one database configuration
+
+    pools are registered by `DBConfig`, and `PgConnector` with the same configuration transparently borrows
+    a connection from the registered pool in `__enter__()` and returns it back in `__exit__()`:
+
+        PgPool.create(config, minconn=1, maxconn=10)
+        with PgConnector(config) as db: # connection from the pool
+            ...
+        PgPool.close_all()
+    '''
+    # registered pools : {config key: PgPool}
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, config: DBConfig, minconn: int=1, maxconn: int=10, max_lifetime: float=3600.0,
+                 idle_timeout: float=600.0, health_check_interval: float=30.0, timeout: float=30.0):
+        '''
+        in:
+            config, DBConfig - database configuration
+            minconn, int - minimum number of connections kept open in the pool
+            maxconn, int - maximum number of connections, both idle and borrowed
+            max_lifetime, float (in seconds) - connections older than this value are closed instead of reuse
+            idle_timeout, float (in seconds) - idle connections above `minconn` are closed after this time
+            health_check_interval, float (in seconds) - connections idle longer than this value are checked
+                with `SELECT 1` before they are borrowed; 0 to check every time
+            timeout, float (in seconds) - how long to wait for a free connection if all `maxconn` connections are borrowed
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgPoolError(msg)
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            msg = f'Incorrect pool size : {minconn=}, {maxconn=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgPoolError(msg)
+
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        # this attribute is for logging purposes only
+        self.conn_string = str(config)
+
+        self._cond = threading.Condition()
+        self._idle = collections.deque() # (connection, last usage time), the most recently used connection is on the right
+        self._created = {} # {connection: creation time} for all open connections, both idle and borrowed
+        self._connecting = 0 # number of connections which are being opened right now
+        self._closed = False
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    @classmethod
+    def config_key(cls, config: DBConfig) -> tuple:
+        '''
+        hashable key of the database configuration
+        '''
+        return (config.host, config.port, config.database, config.user, config.password)
+
+    @classmethod
+    def create(cls, config: DBConfig, **kwargs) -> 'PgPool':
+        '''
+        create a new pool and register it for the given configuration; an already registered pool is closed
+
+        in:
+            config, DBConfig - database configuration
+            kwargs - other arguments of `PgPool.__init__()`
+
+        out: new pool, PgPool
+        '''
+        pool = cls(config, **kwargs)
+        with cls._pools_lock:
+            old_pool = cls._pools.get(cls.config_key(config))
+            cls._pools[cls.config_key(config)] = pool
+        if old_pool is not None:
+            old_pool.close()
+
+        return pool
+
+    @classmethod
+    def get(cls, config: DBConfig) -> 'PgPool':
+        '''
+        registered pool for the given configuration or None
+        '''
+        return cls._pools.get(cls.config_key(config))
+
+    @classmethod
+    def close_all(cls):
+        '''
+        close and unregister all pools
+        '''
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.config.connect_params())
+        with self._cond:
+            self._created[conn] = time.monotonic()
+        self.logger.info(self.log_msg(f'Connection opened : {self.conn_string}, total={len(self._created)}'))
+        return conn
+
+    def _disconnect(self, conn, reason: str):
+        self._created.pop(conn, None)
+        try:
+            conn.close()
+        except Exception as ex:
+            self.logger.warning(self.log_msg(f'Error while closing connection, {ex=}'))
+        self.logger.info(self.log_msg(f'Connection closed ({reason}) : {self.conn_string}, total={len(self._created)}'))
+
+    def _is_expired(self, conn, now: float) -> bool:
+        return now - self._created.get(conn, now) >= self.max_lifetime
+
+    def _is_healthy(self, conn, last_used: float, now: float) -> bool:
+        '''
+        check the connection before it is borrowed
+        '''
+        if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+        except Exception as ex:
+            self.logger.warning(self.log_msg(f'Health check failed, {ex=}'))
+            return False
+        return True
+
+    def _close_idle_expired(self, now: float):
+        '''
+        close the least recently used idle connections above `minconn` after `idle_timeout`
+        '''
+        while self._idle and len(self._created) > self.minconn and now - self._idle[0][1] >= self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._disconnect(conn, 'idle timeout')
+
+    def getconn(self):
+        '''
+        borrow a connection from the pool; wait up to `timeout` seconds if all connections are borrowed
+
+        out: psycopg2 connection
+        '''
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while conn is None:
+                    if self._closed:
+                        raise PgPoolError(f'The pool is closed : {self.conn_string}')
+
+                    now = time.monotonic()
+                    self._close_idle_expired(now)
+
+                    while self._idle:
+                        conn, last_used = self._idle.pop()
+                        if not self._is_expired(conn, now):
+                            break
+                        self._disconnect(conn, 'max lifetime')
+                        conn = None
+
+                    if conn is None:
+                        # reserve a place for a new connection; the connection is opened outside the lock
+                        if len(self._created) + self._connecting < self.maxconn:
+                            self._connecting += 1
+                            break
+                        if now >= deadline:
+                            msg = f'Timeout waiting for a free connection : {self.conn_string}, {self.maxconn=}'
+                            self.logger.error(self.log_msg(msg))
+                            raise PgPoolError(msg)
+                        self._cond.wait(timeout=deadline - now)
+
+            if conn is None:
+                try:
+                    return self._connect()
+                finally:
+                    with self._cond:
+                        self._connecting -= 1
+                        self._cond.notify()
+
+            # the health check is executed outside the lock too, it can take a round trip to the server
+            if self._is_healthy(conn, last_used, now):
+                return conn
+            with self._cond:
+                self._disconnect(conn, 'health check')
+                self._cond.notify()
+
+    def putconn(self, conn, discard: bool=False):
+        '''
+        return the borrowed connection back to the pool
+
+        in:
+            conn - psycopg2 connection received from `getconn()`
+            discard, bool - close the connection instead of returning it to the pool, for example after an error
+        '''
+        with self._cond:
+            if conn not in self._created:
+                msg = 'The connection does not belong to the pool'
+                self.logger.error(self.log_msg(msg))
+                raise PgPoolError(msg)
+
+            now = time.monotonic()
+            if discard or self._closed or conn.closed:
+                self._disconnect(conn, 'discarded')
+            elif self._is_expired(conn, now):
+                self._disconnect(conn, 'max lifetime')
+            else:
+                # the connection must be returned without an open transaction
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except Exception as ex:
+                        self.logger.warning(self.log_msg(f'Error during rollback of the returned connection, {ex=}'))
+                if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    self._disconnect(conn, 'broken')
+                else:
+                    self._idle.append((conn, now))
+
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        '''
+        numbers of open, idle and borrowed connections
+        '''
+        with self._cond:
+            return {
+                'open'      : len(self._created),
+                'idle'      : len(self._idle),
+                'borrowed'  : len(self._created) - len(self._idle),
+            }
+
+    def close(self):
+        '''
+        close all idle connections; borrowed connections are closed when they are returned
+        '''
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._disconnect(conn, 'pool closed')
+            self._cond.notify_all()
@@ -0,0 +1,266 @@
+'''
+per-connection cache of prepared statements for hot queries
+'''
+
+import collections
+import datetime
+import decimal
+import itertools
+import math
+import re
+import weakref
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PgStatementCache:
+    '''
+    cache of server-side prepared statements for one connection, keyed by query text
+
+    a query is prepared with `PREPARE` after `threshold` executions and then executed with `EXECUTE`,
+    so the server doesn't parse and plan it again; the least recently used statements are deallocated
+    when there are more than `maxsize` of them
+
+    only single `SELECT`, `INSERT`, `UPDATE`, `DELETE`, `WITH` or `VALUES` statements with positional `%s`
+    placeholders (or without placeholders) are prepared, all other queries are executed as is
+
+    parameters are declared with the types of the literals which psycopg2 sends for the args, so results don't
+    change after preparing; the same query with args of other types is another statement
+    '''
+    # caches of all connections : {connection: PgStatementCache}, the cache is removed with its connection
+    _caches = weakref.WeakKeyDictionary()
+
+    # SQLSTATE of errors after which the prepared statement can't be used anymore:
+    # `cached plan must not change result type` (after schema change) and `prepared statement does not exist`
+    INVALIDATION_ERRORS = ('0A000', '26000')
+
+    PREPARABLE_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b', re.IGNORECASE)
+    RESET_RE = re.compile(r'^\s*(DISCARD|DEALLOCATE)\b', re.IGNORECASE)
+    PLACEHOLDER_RE = re.compile(r'%(%|s|\(\w+\)s)')
+
+    _name_counter = itertools.count(1)
+
+    def __init__(self, threshold: int=5, maxsize: int=100):
+        '''
+        in:
+            threshold, int - number of executions of the query before it is prepared
+            maxsize, int - maximum number of prepared statements
+        '''
+        self.threshold = threshold
+        self.maxsize = maxsize
+
+        # keys are (query, parameter types)
+        self._prepared = collections.OrderedDict() # {key: statement name}, the most recently used on the right
+        self._usages = collections.OrderedDict() # {key: number of executions} for not prepared queries
+        self._not_preparable = set()
+
+        self.hits = 0 # executions of prepared statements
+        self.misses = 0 # executions of not prepared queries
+        self.prepares = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def get(cls, conn, threshold: int=5, maxsize: int=100) -> 'PgStatementCache':
+        '''
+        cache for the connection; a new cache is created for a new connection
+        '''
+        cache = cls._caches.get(conn)
+        if cache is None:
+            cache = cls(threshold=threshold, maxsize=maxsize)
+            cls._caches[conn] = cache
+        return cache
+
+    @classmethod
+    def parameter_type(cls, arg) -> str:
+        '''
+        SQL type of the literal which psycopg2 sends for the arg; `unknown` is inferred by the server from the context,
+        as for quoted strings and NULL
+
+        out: type name or None if the arg has no known type
+        '''
+        if arg is None or isinstance(arg, str):
+            return 'unknown'
+        if isinstance(arg, bool):
+            return 'boolean'
+        if isinstance(arg, int):
+            # integer constants are `integer`, `bigint` or `numeric` depending on the value
+            if -2**31 <= arg < 2**31:
+                return 'integer'
+            return 'bigint' if -2**63 <= arg < 2**63 else 'numeric'
+        if isinstance(arg, float):
+            # finite floats are sent as numeric constants, `2.5`, others as `'Infinity'::float`
+            return 'numeric' if math.isfinite(arg) else 'double precision'
+        if isinstance(arg, decimal.Decimal):
+            return 'numeric'
+        if isinstance(arg, datetime.datetime):
+            return 'timestamp' if arg.tzinfo is None else 'timestamptz'
+        if isinstance(arg, datetime.date):
+            return 'date'
+        if isinstance(arg, datetime.time):
+            return 'time' if arg.tzinfo is None else 'timetz'
+        if isinstance(arg, datetime.timedelta):
+            return 'interval'
+        if isinstance(arg, (bytes, bytearray, memoryview)):
+            return 'bytea'
+        return None
+
+    @classmethod
+    def parameter_types(cls, args) -> tuple:
+        '''
+        out: tuple of SQL types of the args or None if the query with the args can't be prepared
+        '''
+        if not args:
+            return ()
+        if not isinstance(args, (tuple, list)):
+            return None # named placeholders
+        types = tuple(cls.parameter_type(arg) for arg in args)
+        return None if None in types else types
+
+    @classmethod
+    def to_prepared_query(cls, query: str, args) -> str:
+        '''
+        convert psycopg2 query with `%s` placeholders into `PREPARE` body with `$1, $2, ...` parameters
+
+        out: query text or None if the query can't be prepared
+        '''
+        if not cls.PREPARABLE_RE.match(query) or ';' in query.rstrip().rstrip(';'):
+            return None
+        if not args:
+            # without args psycopg2 doesn't process placeholders, the query is sent as is
+            return query.rstrip().rstrip(';')
+        types = cls.parameter_types(args)
+        if types is None:
+            return None # named placeholders, `IN %s` tuples and other args of unknown types
+
+        counter = itertools.count(1)
+        placeholders = 0
+
+        def replace(match):
+            nonlocal placeholders
+            if match.group(1) == '%':
+                return '%'
+            if match.group(1) != 's':
+                raise ValueError('named placeholder')
+            placeholders += 1
+            return f'${next(counter)}'
+
+        try:
+            prepared_query = cls.PLACEHOLDER_RE.sub(replace, query)
+        except ValueError:
+            return None
+        if placeholders != len(args):
+            return None
+        return prepared_query.rstrip().rstrip(';')
+
+    def statement(self, cur, query: str, args) -> tuple:
+        '''
+        query and args to execute instead of the given query and args; prepares the query if needed
+
+        in:
+            cur - psycopg2 cursor of the connection
+            query, str
+            args, tuple
+
+        out: (query, args), tuple
+        '''
+        if self.RESET_RE.match(query):
+            # all prepared statements of the session are removed by this query
+            self.clear()
+            return query, args
+
+        key = (query, self.parameter_types(args))
+        name = self._prepared.get(key)
+        if name is not None:
+            self._prepared.move_to_end(key)
+            self.hits += 1
+            return self._execute_query(name, args), args
+
+        self.misses += 1
+        if key in self._not_preparable:
+            return query, args
+
+        usages = self._usages.pop(key, 0) + 1
+        if usages < self.threshold:
+            self._usages[key] = usages
+            while len(self._usages) > 10 * self.maxsize: # don't count usages of all queries forever
+                self._usages.popitem(last=False)
+            return query, args
+
+        prepared_query = self.to_prepared_query(query, args)
+        if prepared_query is None or not self._prepare(cur, key, prepared_query):
+            self._not_preparable.add(key)
+            return query, args
+
+        return self._execute_query(self._prepared[key], args), args
+
+    def _execute_query(self, name: str, args) -> str:
+        if not args:
+            return f'EXECUTE {name};'
+        return f'EXECUTE {name} (' + ', '.join(['%s'] * len(args)) + ');'
+
+    def _prepare(self, cur, key: tuple, prepared_query: str) -> bool:
+        '''
+        execute `PREPARE`; inside a transaction it is protected by a savepoint, so an error doesn't abort the transaction
+        '''
+        name = f'etltools_ps_{next(self.__class__._name_counter)}'
+        parameters = f' ({", ".join(key[1])})' if key[1] else ''
+        in_transaction = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        try:
+            if in_transaction:
+                cur.execute('SAVEPOINT etltools_prepare;')
+            cur.execute(f'PREPARE {name}{parameters} AS {prepared_query}')
+            if in_transaction:
+                cur.execute('RELEASE SAVEPOINT etltools_prepare;')
+        except psycopg2.Error:
+            if in_transaction:
+                cur.execute('ROLLBACK TO SAVEPOINT etltools_prepare;')
+            else:
+                cur.connection.rollback()
+            return False
+
+        self._prepared[key] = name
+        self.prepares += 1
+
+        while len(self._prepared) > self.maxsize:
+            _, old_name = self._prepared.popitem(last=False)
+            self.evictions += 1
+            try:
+                cur.execute(f'DEALLOCATE {old_name};')
+            except psycopg2.Error:
+                pass # the transaction is aborted, the statement stays on the server until the end of the session
+        return True
+
+    def is_prepared(self, query: str, args=None) -> bool:
+        return (query, self.parameter_types(args)) in self._prepared
+
+    def invalidate(self, query: str):
+        '''
+        forget the prepared statements for the query (with args of all types) after an invalidation error;
+        the query will be prepared again after `threshold` executions
+        '''
+        for key in [key for key in self._prepared if key[0] == query]:
+            del self._prepared[key]
+            self.invalidations += 1
+
+    def clear(self):
+        '''
+        forget all prepared statements, for example after `DISCARD ALL`
+        '''
+        self.invalidations += len(self._prepared)
+        self._prepared.clear()
+        self._usages.clear()
+
+    def stats(self) -> dict:
+        '''
+        statistics of the cache
+        '''
+        return {
+            'cached'        : len(self._prepared),
+            'hits'          : self.hits,
+            'misses'        : self.misses,
+            'prepares'      : self.prepares,
+            'evictions'     : self.evictions,
+            'invalidations' : self.invalidations,
+        }
@@ -0,0 +1,344 @@
+# job queue in a PostgreSQL table: batch claims with `FOR UPDATE SKIP LOCKED`, visibility timeouts, `LISTEN/NOTIFY` wakeups
+
+import json
+import os
+import select
+import time
+import uuid
+from dataclasses import dataclass
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector
+
+
+class PgJobQueueError(Exception):
+    pass
+
+
+@dataclass
+class PgJob:
+    '''
+    claimed job; `lease` identifies the claim, so a job which was claimed again after its visibility timeout
+    can't be acknowledged by the previous worker
+    '''
+    id: int
+    payload: dict
+    attempts: int
+    lease: str
+
+
+class PgJobQueue(Logger):
+    '''
+    queue of jobs (JSON payloads) shared by workers on any number of nodes
+
+    a worker claims a batch of jobs with one query; claimed jobs are invisible to other workers for `visibility_timeout`
+    seconds, then they are claimed again (the worker is considered crashed), after `max_attempts` claims the job fails;
+    rows are locked with `SKIP LOCKED`, so concurrent workers never wait for each other,
+    and there are no shared counters to update; `enqueue()` sends `NOTIFY`, so idle workers wake up
+    without polling (see `wait()`)
+
+    register a pool for the configuration (`PgPool.create()`) for high rates of claims, otherwise every call
+    opens a new connection
+
+    :Example:
+
+    >>> with PgJobQueue(config, 'catalog') as job_queue:
+    ...     job_queue.enqueue([{'url': url} for url in urls])
+    ...     while jobs := job_queue.claim(100, wait=5):
+    ...         ...
+    ...         job_queue.ack(jobs)
+    '''
+    TABLE = 'etltools_job'
+    CHANNEL = 'etltools_job_queue'
+    POLL_INTERVAL = 5.0 # maximum wait for a notification in `claim()`, for delayed and returned jobs
+
+    def __init__(self, config: DBConfig, queue: str='default', table: str=None, visibility_timeout: float=300.0,
+                 max_attempts: int=5, retry_delay: float=60.0):
+        '''
+        in:
+            config, DBConfig - database configuration
+            queue, str - name of the queue, one table can keep many queues
+            table, str - table of the jobs, can be qualified with schema name, `etltools_job` by default
+            visibility_timeout, float (in seconds) - time for a worker to finish a claimed job
+            max_attempts, int - maximum number of claims of a job
+            retry_delay, float (in seconds) - pause before the next claim of a failed job
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgJobQueueError(msg)
+
+        self.config = config
+        self.queue = queue
+        self.table = table or self.TABLE
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._table_created = False
+        self._listener = None # connection which listens to notifications of new jobs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        '''
+        close the listener connection
+        '''
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _format(self, db: PgConnector, query: str) -> str:
+        return psycopg2.sql.SQL(query).format(
+            table=psycopg2.sql.Identifier(*self.table.split('.')),
+            index=psycopg2.sql.Identifier(self.table.split('.')[-1] + '_ready_idx'),
+        ).as_string(db._conn)
+
+    def _execute(self, db: PgConnector, query: str, args: tuple=None) -> list:
+        result = db.execute(self._format(db, query), args)
+        if result is None:
+            raise PgJobQueueError(f'Error executing query on the job queue {self.table}, {self.queue=}')
+        return result
+
+    def create_table(self):
+        '''
+        create the table of the jobs if not exists; the partial index contains only not finished jobs,
+        so it stays small however many jobs are done
+        '''
+        if self._table_created:
+            return
+
+        queries = [
+            'CREATE TABLE IF NOT EXISTS {table} ('
+            '  id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY, '
+            '  queue TEXT NOT NULL, '
+            '  payload JSONB NOT NULL, '
+            "  status TEXT NOT NULL DEFAULT 'ready', " # ready, running, done, failed
+            '  attempts INT NOT NULL DEFAULT 0, '
+            '  visible_tz TIMESTAMPTZ NOT NULL DEFAULT NOW(), '
+            '  lease UUID, '
+            '  error TEXT, '
+            '  insert_tz TIMESTAMPTZ NOT NULL DEFAULT NOW(), '
+            '  update_tz TIMESTAMPTZ NOT NULL DEFAULT NOW() '
+            ');',
+            "CREATE INDEX IF NOT EXISTS {index} ON {table} (queue, visible_tz, id) WHERE status IN ('ready', 'running');",
+        ]
+        with PgConnector(self.config) as db:
+            # `CREATE INDEX IF NOT EXISTS` locks the table even if the index exists, so it is not executed
+            # for the existing table to not block claims of other workers
+            if self._execute(db, 'SELECT to_regclass(%s);', (self.table,))[0][0] is None:
+                for query in queries:
+                    db.execute(self._format(db, query))
+        self._table_created = True
+
+    def enqueue(self, payloads: list, delay: float=0.0) -> list:
+        '''
+        add jobs to the queue and wake up waiting workers
+
+        in:
+            payloads, list - JSON-serializable payloads of the jobs, for example `{'url': ...}`
+            delay, float (in seconds) - the jobs can be claimed after this delay
+        out: ids of the jobs, list
+        '''
+        payloads = [json.dumps(payload) for payload in payloads]
+        if not payloads:
+            return []
+
+        self.create_table()
+        with PgConnector(self.config) as db:
+            result = self._execute(
+                db
+                , 'INSERT INTO {table} (queue, payload, visible_tz) '
+                  "SELECT %s, payload::jsonb, NOW() + %s * INTERVAL '1 second' FROM unnest(%s::text[]) AS p(payload) "
+                  'RETURNING id;'
+                , (self.queue, delay, payloads)
+            )
+            # the notification is sent on commit, together with the jobs
+            self._execute(db, 'SELECT pg_notify(%s, %s);', (self.CHANNEL, self.queue))
+
+        self.logger.info(self.log_msg(f'{len(result)} jobs added to {self.queue=}'))
+        return [row[0] for row in result]
+
+    def claim(self, limit: int=1, wait: float=None) -> list:
+        '''
+        claim up to `limit` visible jobs; jobs which were claimed `max_attempts` times and not finished are failed
+
+        in:
+            limit, int - maximum number of jobs
+            wait, float (in seconds) - if there are no jobs, wait for new jobs up to this time, None - don't wait
+        out: list of PgJob, empty if there are no jobs
+        '''
+        deadline = time.monotonic() + wait if wait is not None else None
+        while True:
+            if deadline is not None:
+                # listen before claiming, so a notification between the claim and `wait()` is not lost
+                try:
+                    self._listen()
+                except psycopg2.Error as ex:
+                    self.logger.exception(self.log_msg(f'Listener error, {ex=}'))
+
+            self.create_table()
+            with PgConnector(self.config) as db:
+                lease = str(uuid.uuid4())
+                result = self._execute(
+                    db
+                    , 'WITH visible AS ( '
+                      '  SELECT id FROM {table} '
+                      "  WHERE queue = %(queue)s AND status IN ('ready', 'running') AND visible_tz <= NOW() "
+                      '  ORDER BY visible_tz, id LIMIT %(limit)s '
+                      '  FOR UPDATE SKIP LOCKED '
+                      '), claimed AS ( '
+                      '  UPDATE {table} AS j SET '
+                      "    status = CASE WHEN j.attempts >= %(max_attempts)s THEN 'failed' ELSE 'running' END, "
+                      '    attempts = LEAST(j.attempts + 1, %(max_attempts)s), '
+                      "    visible_tz = NOW() + %(timeout)s * INTERVAL '1 second', "
+                      '    lease = %(lease)s, '
+                      "    error = CASE WHEN j.attempts >= %(max_attempts)s THEN 'visibility timeout' ELSE j.error END, "
+                      '    update_tz = NOW() '
+                      '  FROM visible WHERE j.id = visible.id '
+                      '  RETURNING j.id, j.payload, j.attempts, j.status '
+                      ') '
+                      "SELECT id, payload, attempts FROM claimed WHERE status = 'running' ORDER BY id;"
+                    , {
+                        'queue'         : self.queue,
+                        'limit'         : limit,
+                        'max_attempts'  : self.max_attempts,
+                        'timeout'       : self.visibility_timeout,
+                        'lease'         : lease,
+                    }
+                )
+
+            if result or deadline is None:
+                break
+            remains = deadline - time.monotonic()
+            if remains <= 0:
+                break
+            self.wait(min(remains, self.POLL_INTERVAL))
+
+        if result:
+            self.logger.info(self.log_msg(f'{len(result)} jobs claimed from {self.queue=}'))
+        return [PgJob(id, payload, attempts, lease) for id, payload, attempts in result]
+
+    def _leases(self, jobs: list) -> tuple:
+        return ([job.id for job in jobs], [job.lease for job in jobs])
+
+    def ack(self, jobs: list) -> int:
+        '''
+        mark the jobs as done; jobs which were claimed again by other workers are skipped
+
+        out: number of finished jobs, int
+        '''
+        if not jobs:
+            return 0
+        with PgConnector(self.config) as db:
+            result = self._execute(
+                db
+                , "UPDATE {table} AS j SET status = 'done', visible_tz = NOW(), update_tz = NOW() "
+                  'FROM unnest(%s::bigint[], %s::uuid[]) AS l(id, lease) '
+                  "WHERE j.id = l.id AND j.lease = l.lease AND j.status = 'running' "
+                  'RETURNING j.id;'
+                , self._leases(jobs)
+            )
+        if len(result) != len(jobs):
+            self.logger.warning(self.log_msg(f'{len(jobs) - len(result)} jobs were not acknowledged, their claims are expired'))
+        return len(result)
+
+    def fail(self, jobs: list, error: str=None, retry_delay: float=None) -> int:
+        '''
+        return the jobs to the queue after `retry_delay` seconds (`self.retry_delay` if None)
+        or mark them as failed if they were claimed `max_attempts` times
+
+        out: number of returned or failed jobs, int
+        '''
+        if not jobs:
+            return 0
+        retry_delay = self.retry_delay if retry_delay is None else retry_delay
+        with PgConnector(self.config) as db:
+            result = self._execute(
+                db
+                , 'UPDATE {table} AS j SET '
+                  "  status = CASE WHEN j.attempts >= %s THEN 'failed' ELSE 'ready' END, "
+                  "  visible_tz = NOW() + %s * INTERVAL '1 second', error = %s, update_tz = NOW() "
+                  'FROM unnest(%s::bigint[], %s::uuid[]) AS l(id, lease) '
+                  "WHERE j.id = l.id AND j.lease = l.lease AND j.status = 'running' "
+                  'RETURNING j.id;'
+                , (self.max_attempts, retry_delay, error, *self._leases(jobs))
+            )
+        self.logger.warning(self.log_msg(f'{len(result)} jobs failed in {self.queue=}, {error=}'))
+        return len(result)
+
+    def extend(self, jobs: list, timeout: float=None) -> int:
+        '''
+        extend the visibility timeout of the claimed jobs (`self.visibility_timeout` if None) for long jobs
+
+        out: number of extended jobs, int
+        '''
+        if not jobs:
+            return 0
+        timeout = self.visibility_timeout if timeout is None else timeout
+        with PgConnector(self.config) as db:
+            result = self._execute(
+                db
+                , "UPDATE {table} AS j SET visible_tz = NOW() + %s * INTERVAL '1 second', update_tz = NOW() "
+                  'FROM unnest(%s::bigint[], %s::uuid[]) AS l(id, lease) '
+                  "WHERE j.id = l.id AND j.lease = l.lease AND j.status = 'running' "
+                  'RETURNING j.id;'
+                , (timeout, *self._leases(jobs))
+            )
+        return len(result)
+
+    def _listen(self):
+        if self._listener is not None:
+            return
+        conn = psycopg2.connect(**self.config.connect_params())
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(psycopg2.sql.SQL('LISTEN {channel};').format(channel=psycopg2.sql.Identifier(self.CHANNEL)))
+        self._listener = conn
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        wait for a notification about new jobs in the queue; delayed and returned jobs don't send notifications,
+        so the wait should be limited by the time of polling for them, as in `claim()`
+
+        out: bool - True if new jobs were added
+        '''
+        try:
+            self._listen()
+            deadline = time.monotonic() + timeout
+            while True:
+                notified = False
+                while self._listener.notifies:
+                    notified |= self._listener.notifies.pop(0).payload == self.queue
+                if notified:
+                    return True
+                remains = deadline - time.monotonic()
+                if remains <= 0:
+                    return False
+                if select.select([self._listener], [], [], remains) != ([], [], []):
+                    self._listener.poll()
+        except psycopg2.Error as ex:
+            self.logger.exception(self.log_msg(f'Listener error, {ex=}'))
+            self.close()
+            time.sleep(min(timeout, 1.0))
+            return False
+
+    def stats(self) -> dict:
+        '''
+        number of jobs in the queue by status
+        '''
+        self.create_table()
+        with PgConnector(self.config) as db:
+            result = self._execute(db, 'SELECT status, COUNT(*) FROM {table} WHERE queue = %s GROUP BY status;', (self.queue,))
+        return {'ready': 0, 'running': 0, 'done': 0, 'failed': 0} | dict(result)
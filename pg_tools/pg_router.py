@@ -0,0 +1,126 @@
+# routing of read-only connections to replicas: round robin, replication lag limit, failover to the primary
+
+import itertools
+import logging
+import os
+import threading
+import time
+
+
+class PgReplicaRouter:
+    '''
+    process-wide state of replicas for `PgConnector(read_only=True)`:
+    replicas of a configuration are tried in round-robin order, a replica which can't be connected to is skipped
+    for `retry_interval` seconds, a replica with replication lag above `DBConfig.max_replica_lag` is skipped until
+    the next lag check; if there are no suitable replicas, the primary is used
+
+    the lag of a replica is measured at most once per `lag_check_interval` seconds as the age of the last replayed
+    transaction; a replica which has replayed all received WAL is considered up to date
+
+    :Example:
+
+    >>> config = DBConfig(..., replicas=[DBConfig(host='replica1', ...), DBConfig(host='replica2', ...)], max_replica_lag=5)
+    >>> with PgConnector(config, read_only=True) as db:
+    ...     db.execute('SELECT ...')
+    '''
+    lag_check_interval = 1.0 # in seconds
+    retry_interval = 30.0 # in seconds
+
+    logger = logging.getLogger(os.path.basename(__file__))
+
+    _lock = threading.Lock()
+    _counters = {} # {primary key: itertools.count}, round robin over replicas
+    _lags = {} # {replica key: (lag in seconds, time of check)}
+    _down = {} # {replica key: time until which the replica is skipped}
+
+    # a replica without streaming WAL receiver (disconnected from the primary) has infinite lag: all received WAL
+    # is replayed, but it doesn't receive new WAL; `status` is NULL for users without `pg_read_all_stats`
+    LAG_QUERY = (
+        'SELECT CASE '
+        '  WHEN NOT pg_is_in_recovery() THEN 0 '
+        "  WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming') "
+        "    THEN 'Infinity' "
+        '  WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        '  ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0) '
+        'END::float8;'
+    )
+
+    @classmethod
+    def configure(cls, lag_check_interval: float=None, retry_interval: float=None):
+        '''
+        change settings; None values are not changed
+
+        in:
+            lag_check_interval, float (in seconds) - how often the replication lag of a replica is measured
+            retry_interval, float (in seconds) - how long a failed replica is not used
+        '''
+        if lag_check_interval is not None:
+            cls.lag_check_interval = lag_check_interval
+        if retry_interval is not None:
+            cls.retry_interval = retry_interval
+
+    @classmethod
+    def config_key(cls, config: 'DBConfig') -> tuple:
+        return (config.host, config.port, config.database, config.user)
+
+    @classmethod
+    def replicas(cls, config: 'DBConfig') -> list:
+        '''
+        replicas of the configuration in the order to try, without failed ones
+        '''
+        if not config.replicas:
+            return []
+        now = time.monotonic()
+        with cls._lock:
+            replicas = [replica for replica in config.replicas if cls._down.get(cls.config_key(replica), 0) <= now]
+            if not replicas:
+                return []
+            counter = cls._counters.setdefault(cls.config_key(config), itertools.count())
+            start = next(counter) % len(replicas)
+            return replicas[start:] + replicas[:start]
+
+    @classmethod
+    def mark_down(cls, replica: 'DBConfig', ex: Exception):
+        '''
+        skip the replica for `retry_interval` seconds
+        '''
+        with cls._lock:
+            cls._down[cls.config_key(replica)] = time.monotonic() + cls.retry_interval
+            cls._lags.pop(cls.config_key(replica), None)
+        cls.logger.warning(f'[{cls.__name__}] Replica {replica} is not used for {cls.retry_interval} s, {ex=}')
+
+    @classmethod
+    def check_lag(cls, replica: 'DBConfig', conn, max_lag: float) -> bool:
+        '''
+        True if the replication lag of the replica is not above `max_lag` (None for no limit);
+        the lag is measured with the given connection if the last measurement is too old
+        '''
+        if max_lag is None:
+            return True
+
+        key = cls.config_key(replica)
+        now = time.monotonic()
+        with cls._lock:
+            lag, checked = cls._lags.get(key, (None, None))
+        if checked is None or now - checked > cls.lag_check_interval:
+            with conn.cursor() as cur:
+                cur.execute(cls.LAG_QUERY)
+                lag = cur.fetchone()[0]
+            conn.rollback()
+            with cls._lock:
+                cls._lags[key] = (lag, now)
+
+        if lag > max_lag:
+            cls.logger.warning(f'[{cls.__name__}] Replica {replica} is skipped, replication lag {lag:.3f} s > {max_lag=} s')
+            return False
+        return True
+
+    @classmethod
+    def reset(cls):
+        '''
+        forget failed replicas and measured lags
+        '''
+        with cls._lock:
+            cls._counters.clear()
+            cls._lags.clear()
+            cls._down.clear()
@@ -0,0 +1,191 @@
+# client-side statistics of queries and slow query log, similar to `pg_stat_statements`
+
+import functools
+import logging
+import os
+import random
+import re
+import threading
+
+
+class PgQueryStats:
+    '''
+    process-wide statistics of queries executed by `PgConnector`, grouped by normalized query text:
+    number of calls, total/mean/p99 latency, number of rows and number of errors
+
+    queries slower than `slow_query_threshold` are written into the slow query log (the logger of this module,
+    level WARNING), only `slow_query_sample_rate` part of them to keep the log small
+
+    :Example:
+
+    >>> PgQueryStats.configure(slow_query_threshold=0.5, slow_query_sample_rate=0.1)
+    >>> PgQueryStats.top(5)
+    [{'query': 'SELECT title FROM user_agent WHERE hardware=? ...', 'calls': 120, 'total_time': 0.31, ...}, ...]
+    '''
+    enabled = True
+    slow_query_threshold = 1.0 # in seconds
+    slow_query_sample_rate = 1.0 # from 0.0 to 1.0
+    latencies_size = 1000 # number of the last latencies per query used for percentiles
+
+    logger = logging.getLogger(os.path.basename(__file__))
+
+    _lock = threading.Lock()
+    _stats = {} # {normalized query: _QueryStats}
+
+    STRING_RE = re.compile(r"'(?:[^']|'')*'")
+    NUMBER_RE = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+    PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s|\$\d+')
+    IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+    SPACES_RE = re.compile(r'\s+')
+
+    @classmethod
+    def configure(cls, enabled: bool=None, slow_query_threshold: float=None, slow_query_sample_rate: float=None, latencies_size: int=None):
+        '''
+        change settings; None values are not changed
+
+        in:
+            enabled, bool - collect statistics or not
+            slow_query_threshold, float (in seconds) - queries slower than this value are written into the slow query log
+            slow_query_sample_rate, float - part of slow queries written into the log, from 0.0 to 1.0
+            latencies_size, int - number of the last latencies per query used for percentiles
+        '''
+        if enabled is not None:
+            cls.enabled = enabled
+        if slow_query_threshold is not None:
+            cls.slow_query_threshold = slow_query_threshold
+        if slow_query_sample_rate is not None:
+            cls.slow_query_sample_rate = slow_query_sample_rate
+        if latencies_size is not None:
+            cls.latencies_size = latencies_size
+
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def normalize(cls, query: str) -> str:
+        '''
+        replace literals and placeholders with `?` and collapse spaces, so that the same queries with different values
+        are grouped together
+
+        :Example:
+
+        >>> PgQueryStats.normalize("SELECT * FROM t WHERE id IN (1, 2, 3) AND title = 'abc' AND n > %s;")
+        'SELECT * FROM t WHERE id IN (...) AND title = ? AND n > ?;'
+        '''
+        query = cls.STRING_RE.sub('?', query)
+        query = cls.PLACEHOLDER_RE.sub('?', query)
+        query = cls.NUMBER_RE.sub('?', query)
+        query = cls.IN_LIST_RE.sub('IN (...)', query)
+        return cls.SPACES_RE.sub(' ', query).strip()
+
+    @classmethod
+    def record(cls, query: str, duration: float, rows: int=0, error: bool=False, args=None):
+        '''
+        add one execution of the query to the statistics
+
+        in:
+            query, str - query text, it is normalized here
+            duration, float (in seconds)
+            rows, int - number of returned or affected rows
+            error, bool - the query failed
+            args - query arguments, only for the slow query log
+        '''
+        if not cls.enabled:
+            return
+
+        normalized = cls.normalize(query if isinstance(query, str) else str(query))
+        with cls._lock:
+            stats = cls._stats.get(normalized)
+            if stats is None:
+                stats = cls._stats[normalized] = _QueryStats(cls.latencies_size)
+            stats.add(duration, rows, error)
+
+        if duration >= cls.slow_query_threshold and random.random() < cls.slow_query_sample_rate:
+            args_repr = repr(args)
+            if len(args_repr) > 200:
+                args_repr = args_repr[:200] + '...'
+            cls.logger.warning(f'[{cls.__name__}] Slow query {duration=:.3f} s, {rows=}, {error=}, {query=}, args={args_repr}')
+
+    @classmethod
+    def top(cls, n: int=10, key: str='total_time') -> list:
+        '''
+        top-N queries by the given statistic
+
+        in:
+            n, int - number of queries
+            key, str - 'total_time', 'mean_time', 'p99_time', 'max_time', 'calls', 'rows' or 'errors'
+
+        out: list of dicts with `query` and all statistics, sorted by `key` in descending order
+        '''
+        with cls._lock:
+            rows = [{'query': query} | stats.as_dict() for query, stats in cls._stats.items()]
+        if rows and key not in rows[0]:
+            raise ValueError(f'Unknown statistic {key=}')
+        return sorted(rows, key=lambda row: row[key], reverse=True)[:n]
+
+    @classmethod
+    def log_top(cls, n: int=10, key: str='total_time') -> list:
+        '''
+        write top-N queries by the given statistic into the log, see `top()`
+        '''
+        top = cls.top(n, key)
+        for idx, row in enumerate(top, start=1):
+            cls.logger.info(
+                f"[{cls.__name__}] Top {idx} by {key} : calls={row['calls']}, total_time={row['total_time']:.3f} s, "
+                f"mean_time={row['mean_time']:.4f} s, p99_time={row['p99_time']:.4f} s, rows={row['rows']}, "
+                f"errors={row['errors']}, query={row['query']!r}"
+            )
+        return top
+
+    @classmethod
+    def reset(cls):
+        '''
+        remove all collected statistics
+        '''
+        with cls._lock:
+            cls._stats.clear()
+
+
+class _QueryStats:
+    '''
+    statistics of one normalized query
+    '''
+    __slots__ = ('calls', 'total_time', 'max_time', 'rows', 'errors', '_latencies', '_latencies_size', '_next')
+
+    def __init__(self, latencies_size: int):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.errors = 0
+        self._latencies = [] # ring buffer of the last latencies
+        self._latencies_size = latencies_size
+        self._next = 0
+
+    def add(self, duration: float, rows: int, error: bool):
+        self.calls += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.rows += rows or 0
+        self.errors += bool(error)
+
+        if len(self._latencies) < self._latencies_size:
+            self._latencies.append(duration)
+        else:
+            self._latencies[self._next] = duration
+            self._next = (self._next + 1) % self._latencies_size
+
+    def percentile(self, p: float) -> float:
+        if not self._latencies:
+            return 0.0
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    def as_dict(self) -> dict:
+        return {
+            'calls'         : self.calls,
+            'total_time'    : self.total_time,
+            'mean_time'     : self.total_time / self.calls if self.calls else 0.0,
+            'p99_time'      : self.percentile(0.99),
+            'max_time'      : self.max_time,
+            'rows'          : self.rows,
+            'errors'        : self.errors,
+        }
@@ -2,12 +2,21 @@
 set of various tools
 '''
 
+import re
+
+
 class PgToolsError(Exception):
     pass
 
 
 class PgTools:
 
+    # tokens of the text representation of arrays: braces, delimiters, quoted and unquoted elements
+    ARRAY_TOKEN_RE = re.compile(r'[{},]|"((?:[^"\\]|\\.)*)"|((?:[^{},"\\]|\\.)+)', re.DOTALL)
+    ARRAY_UNESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+    # dimensions decoration of arrays with non-default lower bounds, for example `[0:2]={1,2,3}`
+    ARRAY_DIMENSIONS_RE = re.compile(r'^\s*(?:\[-?\d+:-?\d+\])+\s*=\s*')
+
     @classmethod
     def list_to_array(cls, lst: list, dtype: str='str') -> str:
         '''
@@ -23,6 +32,9 @@ class PgTools:
         :return: a string of PostgreSQL ARRAY data type
         :rtype: str
 
+        elements are converted with `int()`, `float()` or `str().strip()`, None elements are NULLs;
+        see `encode_array()` for arrays of any values
+
         :Example:
 
         >>> PgTools.list_to_array(['alpha ', 'beta ', 'gamma '], 'str')
@@ -35,16 +47,274 @@ class PgTools:
                 raise TypeError(f'The object {lst} must be of type list or tuple.')
 
             if dtype == 'int':
-                line = ','.join([str(int(value)) for value in lst])
+                convert = int
             elif dtype == 'float':
-                line = ','.join([str(float(value)) for value in lst])
+                convert = float
             elif dtype == 'str':
-                line = ','.join([f'"{str(value).strip()}"' for value in lst])
+                convert = lambda value: str(value).strip()
             else:
                 raise TypeError(f"dtype must be 'int', 'float' or 'str'")
 
-            line = '{' + line + '}'
-
-            return line
+            return cls.encode_array([None if value is None else convert(value) for value in lst])
         except Exception as ex:
             raise PgToolsError(f'Cannot convert Python object "{lst}" into PostgreSQL array.') from ex
+
+    @classmethod
+    def is_array(cls, value) -> bool:
+        '''
+        True for values which `encode_array()` converts into ARRAY: lists, tuples and NumPy arrays (not scalars)
+        '''
+        return isinstance(value, (list, tuple)) or getattr(value, 'ndim', 0) > 0 and hasattr(value, 'tolist')
+
+    @classmethod
+    def encode_array(cls, value) -> str:
+        '''
+        convert a list, a tuple (nested for multi-dimensional arrays) or a NumPy array into the text representation
+        of PostgreSQL ARRAY; None elements are NULLs, strings are quoted and escaped, so the result can be used
+        as a query argument or, after `PgCopyReader.text_escape()`, in the text format of COPY
+
+        lists of only int or only float values and NumPy arrays of numbers are encoded without a loop over elements
+
+        :Example:
+
+        >>> PgTools.encode_array([[1, 2], [3, None]])
+        '{{1,2},{3,NULL}}'
+        >>> PgTools.encode_array(['a "b"', 'c\\\\d', None])
+        '{"a \\\\"b\\\\"","c\\\\\\\\d",NULL}'
+        '''
+        try:
+            if not cls.is_array(value):
+                raise TypeError(f'The object {value} must be of type list, tuple or numpy.ndarray.')
+            if isinstance(value, (list, tuple)):
+                return cls._encode_list(value)
+            return cls._encode_numpy(value) # numpy is not required, the array is used through its methods
+        except PgToolsError:
+            raise
+        except Exception as ex:
+            raise PgToolsError(f'Cannot convert Python object "{value}" into PostgreSQL array.') from ex
+
+    @classmethod
+    def _encode_numpy(cls, array) -> str:
+        kind = array.dtype.kind
+        if kind in 'iu':
+            text = str(array.tolist())
+        elif kind == 'f':
+            text = str(array.tolist())
+            if 'n' in text: # nan or inf
+                text = _NUMBERS_RE.sub(_number_literal, text)
+        elif kind == 'b':
+            text = str(array.tolist()).replace('True', 't').replace('False', 'f')
+        else:
+            return cls._encode_list(array.tolist())
+        return text.replace(' ', '').replace('[', '{').replace(']', '}')
+
+    @classmethod
+    def _encode_list(cls, value) -> str:
+        if not value:
+            return '{}'
+
+        types = set(map(type, value))
+        if types == {int} or types == {float} or types == {int, float}:
+            # `str()` of a list formats all numbers in C
+            text = str(value)[1:-1].replace(' ', '')
+            if 'n' in text: # nan or inf
+                text = _NUMBERS_RE.sub(_number_literal, text)
+            return '{' + text + '}'
+        if types == {str}:
+            joined = ''.join(value)
+            if '"' in joined or '\\' in joined:
+                value = [element.replace('\\', '\\\\').replace('"', '\\"') for element in value]
+            return '{"' + '","'.join(value) + '"}'
+
+        if any(cls.is_array(element) for element in value):
+            cls._array_shape(value)
+        return '{' + ','.join([cls._encode_element(element) for element in value]) + '}'
+
+    @classmethod
+    def _array_shape(cls, value) -> tuple:
+        '''
+        dimensions of nested lists; PostgreSQL arrays are rectangular, so empty sub-arrays, sub-arrays
+        of different sizes or sub-arrays mixed with scalars raise PgToolsError
+        '''
+        if not cls.is_array(value):
+            return ()
+        if not isinstance(value, (list, tuple)):
+            return tuple(value.shape) # numpy array
+        shapes = {cls._array_shape(element) for element in value}
+        if len(shapes) > 1 or 0 in next(iter(shapes), ()):
+            raise PgToolsError(f'Sub-arrays of multi-dimensional array must be non-empty and have the same dimensions : {value=}')
+        return (len(value),) + (shapes.pop() if shapes else ())
+
+    @classmethod
+    def _encode_element(cls, value) -> str:
+        if value is None:
+            return 'NULL'
+        if isinstance(value, (list, tuple)):
+            return cls._encode_list(value)
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, int):
+            return str(value)
+        if isinstance(value, float):
+            return _number_literal(repr(value))
+        if cls.is_array(value):
+            return cls._encode_numpy(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = '\\x' + bytes(value).hex()
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    @classmethod
+    def decode_array(cls, text: str, dtype=str) -> list:
+        '''
+        convert the text representation of PostgreSQL ARRAY into a list, nested for multi-dimensional arrays;
+        NULL elements are None, other elements are converted with `dtype`
+
+        in:
+            text, str - for example '{1,2,NULL}' or '{{"a","b"},{"c",NULL}}'
+            dtype, callable - function str -> value, for example int, float or str;
+                'bool' for PostgreSQL booleans ('t' and 'f')
+        out: list
+
+        :Example:
+
+        >>> PgTools.decode_array('{{1,2},{3,NULL}}', int)
+        [[1, 2], [3, None]]
+        '''
+        if dtype == 'bool':
+            dtype = _decode_bool
+
+        try:
+            text = text.strip()
+            if text.startswith('['):
+                text = cls.ARRAY_DIMENSIONS_RE.sub('', text, count=1)
+            if not text.startswith('{') or not text.endswith('}'):
+                raise ValueError('The array must be enclosed in braces')
+
+            inner = text[1:-1]
+            if not inner.strip():
+                return []
+
+            # fast paths for one-dimensional arrays without escaped characters
+            if '{' not in inner and '\\' not in inner:
+                if '"' not in inner and 'l' not in inner: # no quoted elements and no lowercase NULLs
+                    parts = inner.split(',')
+                    if dtype in (int, float) and 'L' not in inner:
+                        return list(map(dtype, parts))
+                    parts = [part.strip() for part in parts]
+                    if '' not in parts:
+                        return [None if part == 'NULL' else dtype(part) for part in parts]
+                elif '"' in inner:
+                    result = cls._decode_quoted(inner, dtype)
+                    if result is not None:
+                        return result
+
+            return cls._decode_tokens(text, dtype)
+        except Exception as ex:
+            raise PgToolsError(f'Cannot convert "{text[:100]}" into Python list.') from ex
+
+    @classmethod
+    def _decode_quoted(cls, inner: str, dtype) -> list:
+        '''
+        decode the content of a one-dimensional array with quoted elements and without backslashes,
+        so every `"` opens or closes a quoted element; None if the content is malformed
+        '''
+        parts = inner.split('"') # parts with odd indexes are quoted elements
+        if len(parts) % 2 == 0:
+            return None
+
+        # only delimiters between quoted elements, the usual text representation of text[]
+        if not parts[0].strip() and not parts[-1].strip() and {part.strip() for part in set(parts[2:-1:2])} <= {','}:
+            return list(map(dtype, parts[1::2]))
+
+        result = []
+        last = len(parts) - 1
+        for index in range(0, len(parts), 2):
+            # delimiters and unquoted elements between quoted elements
+            unquoted = [element.strip() for element in parts[index].split(',')]
+            if index > 0 and unquoted.pop(0):
+                return None # no delimiter after the quoted element
+            if index < last and (not unquoted or unquoted.pop()):
+                return None # no delimiter before the quoted element
+            for element in unquoted:
+                if not element:
+                    return None
+                result.append(None if element.upper() == 'NULL' else dtype(element))
+            if index < last:
+                result.append(dtype(parts[index + 1]))
+        return result
+
+    @classmethod
+    def _decode_tokens(cls, text: str, dtype) -> list:
+        unescape = cls.ARRAY_UNESCAPE_RE.sub
+        stack = []
+        current = None
+        result = None
+        expect_element = False # the last token is `{` or `,`
+        position = 0
+        for match in cls.ARRAY_TOKEN_RE.finditer(text):
+            if match.start() != position:
+                raise ValueError(f'Unexpected character at {position}')
+            position = match.end()
+
+            token = match.group()
+            if token == '{':
+                new = []
+                if current is not None:
+                    current.append(new)
+                    stack.append(current)
+                elif result is not None:
+                    raise ValueError('Extra data after the array')
+                else:
+                    result = new
+                current = new
+                expect_element = True
+            elif token == '}':
+                if current is None:
+                    raise ValueError('Unbalanced braces')
+                if expect_element and current:
+                    raise ValueError('Missing element before }')
+                current = stack.pop() if stack else None
+                expect_element = False
+            elif token == ',':
+                if current is None or expect_element:
+                    raise ValueError('Missing element before ,')
+                expect_element = True
+            else:
+                if current is None:
+                    raise ValueError('Element outside braces')
+                quoted, unquoted = match.groups()
+                if quoted is None:
+                    unquoted = unquoted.strip()
+                    if not unquoted:
+                        continue # spaces around braces and delimiters
+                if not expect_element:
+                    raise ValueError('Missing delimiter')
+                if quoted is not None:
+                    current.append(dtype(unescape(r'\1', quoted) if '\\' in quoted else quoted))
+                elif unquoted.upper() == 'NULL':
+                    current.append(None)
+                else:
+                    current.append(dtype(unescape(r'\1', unquoted) if '\\' in unquoted else unquoted))
+                expect_element = False
+
+        if position != len(text) or current is not None or result is None:
+            raise ValueError('Unbalanced braces')
+        return result
+
+
+def _decode_bool(value: str) -> bool:
+    return value in ('t', 'true', 'TRUE', 'True')
+
+
+def _number_literal(value) -> str:
+    # Python's spelling of special float values into PostgreSQL's one
+    text = value if isinstance(value, str) else value.group()
+    return _SPECIAL_NUMBERS.get(text, text)
+
+
+_SPECIAL_NUMBERS = {'nan': 'NaN', 'inf': 'Infinity', '-inf': '-Infinity'}
+_NUMBERS_RE = re.compile(r'-?inf|nan')
@@ -0,0 +1,242 @@
+# bulk upsert through a staging table: insert new rows, update changed rows, skip identical rows
+
+import os
+import queue
+import threading
+
+import psycopg2.sql
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+
+
+class PgUpsertError(Exception):
+    pass
+
+
+class PgUpsert(Logger):
+    '''
+    bulk upsert of rows into a table with a unique natural key
+
+    rows are streamed with `COPY` into a temporary staging table and then merged with one query
+    `INSERT ... ON CONFLICT (key) DO UPDATE ... WHERE <row changed>`
+
+    :Example:
+
+    >>> upsert = PgUpsert(config, 'user_agent', ('title', 'software', 'version'), key_columns=('title',))
+    >>> upsert.upsert(rows)
+    {'rows': 3, 'inserted': 1, 'updated': 1, 'unchanged': 1, 'duplicates': 0}
+    '''
+    STAGE_TABLE = 'etltools_upsert_stage'
+    STAGE_ORDER_COLUMN = 'etltools_upsert_order'
+
+    def __init__(self, config: DBConfig, table: str, columns: list, key_columns: list, update_columns: list=None):
+        '''
+        in:
+            config, DBConfig - database configuration
+            table, str - target table, can be qualified with schema name
+            columns, list - column names in the order of values in the rows
+            key_columns, list - columns of the unique key (or primary key) of the table, must be in `columns`
+            update_columns, list - columns to update for the changed rows, defaults to all `columns` except `key_columns`;
+                if empty, existing rows are never updated
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgUpsertError(msg)
+
+        self.config = config
+        self.table = table
+        self.columns = tuple(columns)
+        self.key_columns = tuple(key_columns)
+        if update_columns is None:
+            update_columns = [column for column in self.columns if column not in self.key_columns]
+        self.update_columns = tuple(update_columns)
+
+        if not self.key_columns or not set(self.key_columns) <= set(self.columns) or not set(self.update_columns) <= set(self.columns):
+            msg = f'Key and update columns must be in columns : {columns=}, {key_columns=}, {update_columns=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgUpsertError(msg)
+
+        self._key_indexes = [self.columns.index(column) for column in self.key_columns]
+
+    def _queries(self) -> tuple:
+        '''
+        queries to create the staging table and to merge it into the target table
+        '''
+        sql = psycopg2.sql
+        table = sql.Identifier(*self.table.split('.'))
+        stage = sql.Identifier(self.STAGE_TABLE)
+        order = sql.Identifier(self.STAGE_ORDER_COLUMN)
+        columns = sql.SQL(', ').join(sql.Identifier(column) for column in self.columns)
+        keys = sql.SQL(', ').join(sql.Identifier(column) for column in self.key_columns)
+
+        create_queries = [
+            sql.SQL('DROP TABLE IF EXISTS pg_temp.{stage};').format(stage=stage),
+            sql.SQL('CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA;').format(
+                stage=stage, columns=columns, table=table
+            ),
+            # the order of rows is used to take the last row if there are several rows with the same key
+            sql.SQL('ALTER TABLE {stage} ADD COLUMN {order} BIGSERIAL;').format(stage=stage, order=order),
+        ]
+
+        if self.update_columns:
+            conflict_action = sql.SQL('DO UPDATE SET {assignments} WHERE ({target_values}) IS DISTINCT FROM ({new_values})').format(
+                assignments=sql.SQL(', ').join(
+                    sql.SQL('{column}=EXCLUDED.{column}').format(column=sql.Identifier(column)) for column in self.update_columns
+                ),
+                target_values=sql.SQL(', ').join(
+                    sql.SQL('{table}.{column}').format(table=table, column=sql.Identifier(column)) for column in self.update_columns
+                ),
+                new_values=sql.SQL(', ').join(
+                    sql.SQL('EXCLUDED.{column}').format(column=sql.Identifier(column)) for column in self.update_columns
+                ),
+            )
+        else:
+            conflict_action = sql.SQL('DO NOTHING')
+
+        # `xmax = 0` only for the inserted rows, updated rows have `xmax` of the current transaction
+        merge_query = sql.SQL(
+            'WITH src AS ('
+            '  SELECT DISTINCT ON ({keys}) {columns} FROM {stage} ORDER BY {keys}, {order} DESC'
+            '), merged AS ('
+            '  INSERT INTO {table} ({columns}) SELECT {columns} FROM src'
+            '  ON CONFLICT ({keys}) {conflict_action}'
+            '  RETURNING (xmax = 0) AS inserted'
+            ') SELECT'
+            '  (SELECT COUNT(*) FROM {stage}),'
+            '  (SELECT COUNT(*) FROM src),'
+            '  COUNT(*) FILTER (WHERE inserted),'
+            '  COUNT(*) FILTER (WHERE NOT inserted)'
+            ' FROM merged;'
+        ).format(keys=keys, columns=columns, stage=stage, order=order, table=table, conflict_action=conflict_action)
+
+        return create_queries, merge_query
+
+    def upsert(self, rows, db: PgConnector=None, chunk_size: int=1024*1024) -> dict:
+        '''
+        upsert rows with one connection
+
+        in:
+            rows, iterable - rows of values in the order of `columns`
+            db, PgConnector - opened connection; the caller is responsible for commit;
+                if None, a new connection is opened and the transaction is committed
+            chunk_size, int - approximate size of one COPY chunk in bytes
+
+        out:
+            stats {
+                'rows'          : 0, # total number of rows
+                'inserted'      : 0, # number of new rows
+                'updated'       : 0, # number of changed rows
+                'unchanged'     : 0, # number of rows which are identical to the rows in the table
+                'duplicates'    : 0, # number of rows with the same key as a later row; only the last row is used
+            }, dict
+        '''
+        if db is None:
+            try:
+                with PgConnector(self.config) as db:
+                    stats = self.upsert(rows, db=db, chunk_size=chunk_size)
+                    db.commit()
+            except PgConnectorError as ex:
+                raise PgUpsertError(f'Error during upsert into {self.table}') from ex
+            return stats
+
+        create_queries, merge_query = self._queries()
+        for query in create_queries:
+            db.execute(query.as_string(db._conn))
+        try:
+            db.copy_in(self.STAGE_TABLE, self.columns, rows, chunk_size=chunk_size)
+        except PgConnectorError as ex:
+            raise PgUpsertError(f'Error copying rows into the staging table for {self.table}') from ex
+
+        result = db.execute(merge_query.as_string(db._conn))
+        if result is None:
+            msg = f'Error merging the staging table into {self.table}'
+            self.logger.error(self.log_msg(msg))
+            raise PgUpsertError(msg)
+
+        rows_total, distinct_total, inserted, updated = result[0]
+        stats = {
+            'rows'          : rows_total,
+            'inserted'      : inserted,
+            'updated'       : updated,
+            'unchanged'     : distinct_total - inserted - updated,
+            'duplicates'    : rows_total - distinct_total,
+        }
+        self.logger.info(self.log_msg(f'Upsert into {self.table} : {stats=}'))
+        return stats
+
+    def upsert_parallel(self, rows, workers: int=4, queue_size: int=10_000, chunk_size: int=1024*1024) -> dict:
+        '''
+        upsert rows with several connections in parallel
+
+        rows are split between workers by the hash of the key, so different workers never touch the same rows;
+        every worker commits its own transaction, so after an error the rows of the other workers stay in the table;
+        if `rows` raises an error, all workers roll back and the error is raised
+
+        in:
+            rows, iterable - rows of values in the order of `columns`
+            workers, int - number of connections
+            queue_size, int - maximum number of rows waiting in the queue of one worker
+            chunk_size, int - approximate size of one COPY chunk in bytes
+
+        out: total stats, see `upsert()`, dict
+        '''
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        results = [None] * workers
+        errors = []
+        done = object() # end of rows in the queue
+        aborted = object() # error in `rows`, workers must not commit
+
+        def worker(idx):
+            q = queues[idx]
+            finished = False # `done` or `aborted` is received from the queue
+
+            def worker_rows():
+                nonlocal finished
+                while (row := q.get()) is not done:
+                    if row is aborted:
+                        finished = True
+                        raise PgUpsertError(f'Rows are aborted in upsert worker {idx}')
+                    yield row
+                finished = True
+
+            try:
+                results[idx] = self.upsert(worker_rows(), chunk_size=chunk_size)
+            except Exception as ex:
+                self.logger.exception(self.log_msg(f'Error in upsert worker {idx}, {ex=}'))
+                errors.append(ex)
+            finally:
+                # after an error, read all remaining rows so that the producer is never blocked
+                while not finished:
+                    row = q.get()
+                    finished = row is done or row is aborted
+
+        threads = [threading.Thread(target=worker, args=(idx,), daemon=True) for idx in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        key_indexes = self._key_indexes
+        end = done
+        try:
+            for row in rows:
+                key = tuple(row[idx] for idx in key_indexes)
+                queues[hash(key) % workers].put(row)
+        except BaseException:
+            end = aborted
+            raise
+        finally:
+            for q in queues:
+                q.put(end)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise PgUpsertError(f'Error during parallel upsert into {self.table} : {errors=}')
+
+        stats = {key: sum(result[key] for result in results) for key in results[0]}
+        self.logger.info(self.log_msg(f'Parallel upsert into {self.table} with {workers=} : {stats=}'))
+        return stats
@@ -0,0 +1,275 @@
+# background writer: rows from a bounded queue are written by batches with `COPY`, one transaction per batch
+
+import os
+import queue
+import struct
+import threading
+import time
+
+import psycopg2
+
+from etltools.additions.logger import Logger
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+from etltools.pg_tools.pg_copy import PgCopyError
+from etltools.pg_tools.pg_upsert import PgUpsert, PgUpsertError
+
+
+class PgBatchWriterError(Exception):
+    pass
+
+
+class PgBatchWriter(Logger):
+    '''
+    writer of rows (for example, parsed items) in a background thread, so producers don't wait for the database
+
+    rows are collected into batches of `batch_size` rows or of the rows received during `flush_interval` seconds
+    after the first row of the batch; every batch is written with `COPY` (or `PgUpsert` if `key_columns` are given)
+    in one transaction; the queue is bounded, so `put()` blocks when the database falls behind (backpressure)
+
+    a batch is repeated only after errors of the connection; after errors of the data (values which can't be encoded
+    or violate constraints) the batch is split in halves until the bad rows are found, they are rejected and
+    the writer continues; other errors (for example, the table doesn't exist) stop the writer
+
+    :Example:
+
+    >>> with PgBatchWriter(config, 'item', ('url', 'title', 'price'), batch_size=1000) as writer:
+    ...     for url in urls:
+    ...         if parser.get_html(url):
+    ...             writer.put(parser.parse_item_page_html())
+    >>> # all rows are written here
+    '''
+    _STOP = object() # end of rows, see `close()`
+
+    # errors after which the same batch can be written successfully
+    TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+    # errors caused by the rows of the batch
+    DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, PgCopyError, ValueError, TypeError, struct.error)
+
+    def __init__(self, config: DBConfig, table: str, columns: list, batch_size: int=1000, flush_interval: float=1.0,
+                 queue_size: int=10_000, put_timeout: float=None, key_columns: list=None, binary: bool=False,
+                 retries: int=3, retry_delay: float=1.0, on_reject: callable=None):
+        '''
+        in:
+            config, DBConfig - database configuration
+            table, str - target table, can be qualified with schema name
+            columns, list - column names in the order of values in the rows; rows can be dicts with these keys
+            batch_size, int - maximum number of rows in one transaction
+            flush_interval, float (in seconds) - maximum time for a row to wait for the batch
+            queue_size, int - maximum number of rows in the queue, `put()` blocks when the queue is full
+            put_timeout, float (in seconds) - maximum time of blocking in `put()`, None for no limit
+            key_columns, list - upsert rows by this unique key with `PgUpsert` instead of `COPY`
+            binary, bool - use binary COPY format, see `PgConnector.copy_in()`
+            retries, int - number of repeats of a batch after errors of the connection
+            retry_delay, float (in seconds) - pause before the first repeat, doubled for every next one
+            on_reject, callable - function (row, exception) for the rows which can't be written, for example to save
+                them into a file; the rows are only logged if None
+        '''
+        super().__init__(name=os.path.basename(__file__), log_prefix=self.__class__.__name__)
+
+        if not isinstance(config, DBConfig):
+            msg = f'Incorrect connection configuration : {type(config)=}'
+            self.logger.error(self.log_msg(msg))
+            raise PgBatchWriterError(msg)
+
+        self.config = config
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.binary = binary
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_reject = on_reject
+        self.upsert = PgUpsert(config, table, columns, key_columns) if key_columns else None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._error = None # exception which stopped writing
+
+        self.rows = 0 # number of written rows
+        self.batches = 0 # number of written batches
+        self.dropped = 0 # number of rows which were not written after an error
+        self.rejected = 0 # number of bad rows, see `on_reject`
+        self.blocked_time = 0.0 # total time of `put()` waiting for the free place in the queue
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        '''
+        start the writer thread
+        '''
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.logger.info(self.log_msg(f'Writer into {self.table} started'))
+
+    def put(self, row):
+        '''
+        add the row to the queue; blocks while the queue is full
+
+        in: row, tuple or dict - values of `columns`
+        '''
+        if self._error is not None:
+            raise PgBatchWriterError(f'Writing into {self.table} is stopped after an error') from self._error
+        if self._thread is None:
+            raise PgBatchWriterError(f'Writer into {self.table} is not started')
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            start = time.perf_counter()
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                msg = f'The queue is full for {self.put_timeout} s, the database is too slow : {self.table}'
+                self.logger.error(self.log_msg(msg))
+                raise PgBatchWriterError(msg) from None
+            finally:
+                self.blocked_time += time.perf_counter() - start
+
+    def flush(self):
+        '''
+        write all rows added before this call and wait for it
+        '''
+        if self._thread is None:
+            return
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        while not flushed.wait(0.1):
+            if not self._thread.is_alive():
+                break
+        if self._error is not None:
+            raise PgBatchWriterError(f'Writing into {self.table} is stopped after an error') from self._error
+
+    def close(self):
+        '''
+        write all rows from the queue and stop the writer thread
+        '''
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        self.logger.info(self.log_msg(f'Writer into {self.table} stopped : {self.stats()}'))
+        if self._error is not None:
+            raise PgBatchWriterError(f'{self.dropped} rows were not written into {self.table}') from self._error
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, events, stop = self._next_batch()
+            if batch:
+                if self._error is None:
+                    try:
+                        self._write(batch)
+                    except PgBatchWriterError as ex:
+                        self._error = ex
+                if self._error is not None:
+                    # the queue is still emptied, so producers are not blocked forever
+                    self.dropped += len(batch)
+            for event in events:
+                event.set()
+
+    def _next_batch(self) -> tuple:
+        '''
+        out: (rows, flush events, stop flag)
+        '''
+        batch = []
+        events = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if row is self._STOP:
+                return batch, events, True
+            if isinstance(row, threading.Event):
+                events.append(row)
+                break
+            batch.append(tuple(row.get(column) for column in self.columns) if isinstance(row, dict) else row)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, events, False
+
+    def _write(self, batch: list):
+        '''
+        write the batch in one transaction, repeat on errors of the connection, split on errors of the data
+        '''
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                with PgConnector(self.config) as db:
+                    if self.upsert is None:
+                        db.copy_in(self.table, self.columns, batch, binary=self.binary)
+                    else:
+                        self.upsert.upsert(batch, db=db)
+                    db.commit(raise_error=True)
+            except (PgConnectorError, PgUpsertError, psycopg2.Error) as ex:
+                if self._caused_by(ex, self.DATA_ERRORS):
+                    self._split(batch, ex)
+                    return
+                if attempt == self.retries or not self._caused_by(ex, self.TRANSIENT_ERRORS):
+                    self.logger.exception(self.log_msg(f'Error writing {len(batch)} rows into {self.table}, {ex=}'))
+                    raise PgBatchWriterError(f'Error writing {len(batch)} rows into {self.table}') from ex
+                delay = self.retry_delay * 2 ** attempt
+                self.logger.warning(self.log_msg(f'Error writing {len(batch)} rows into {self.table}, repeat in {delay} s, {ex=}'))
+                time.sleep(delay)
+            else:
+                self.rows += len(batch)
+                self.batches += 1
+                self.logger.info(self.log_msg(f'{len(batch)} rows written into {self.table} in {time.perf_counter() - start:.3f} s'))
+                return
+
+    def _split(self, batch: list, ex: Exception):
+        '''
+        write the halves of the batch separately, so only the bad rows are rejected
+        '''
+        if len(batch) > 1:
+            self.logger.warning(self.log_msg(f'Error in the data of {len(batch)} rows, the batch is split : {self.table}, {ex=}'))
+            middle = len(batch) // 2
+            self._write(batch[:middle])
+            self._write(batch[middle:])
+            return
+
+        self.rejected += 1
+        self.logger.error(self.log_msg(f'The row is rejected : {self.table}, row={batch[0]}, {ex=}'))
+        if self.on_reject is not None:
+            try:
+                self.on_reject(batch[0], ex)
+            except Exception as reject_ex:
+                raise PgBatchWriterError(f'Error in on_reject for the row of {self.table}') from reject_ex
+
+    @classmethod
+    def _caused_by(cls, ex: Exception, types: tuple) -> bool:
+        # errors of the connector and the upsert are raised from the original errors
+        while ex is not None:
+            if isinstance(ex, types):
+                return True
+            ex = ex.__cause__
+        return False
+
+    def stats(self) -> dict:
+        '''
+        statistics of the writer
+        '''
+        return {
+            'queued'        : self._queue.qsize(),
+            'rows'          : self.rows,
+            'batches'       : self.batches,
+            'dropped'       : self.dropped,
+            'rejected'      : self.rejected,
+            'blocked_time'  : round(self.blocked_time, 3),
+        }
@@ -50,6 +50,16 @@ class TestDB:
 
         return res_stats
 
+    @classmethod
+    def user_agent_bulk_insert_test_data(cls) -> dict:
+        '''
+        insert test data from files using `COPY`
+        '''
+        ua = UserAgent(test_config)
+        res_stats = ua.bulk_insert_user_agents_from_files(os.path.join(cls.BASE_DIR, cls.USER_AGENT_TEST_DATA_DIR))
+
+        return res_stats
+
     @classmethod
     def user_agent_truncate_table(cls):
         '''
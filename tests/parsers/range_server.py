@@ -0,0 +1,73 @@
+# local HTTP server with range requests for tests in test_parsers_downloader.py
+
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeServer(ThreadingHTTPServer):
+    '''
+    serves `data` at any path; counts sent bytes, can break connections and can ignore range requests
+    '''
+    daemon_threads = True
+
+    def __init__(self, data: bytes, etag: str='"v1"'):
+        super().__init__(('127.0.0.1', 0), RangeRequestHandler)
+        self.data = data
+        self.etag = etag
+        self.last_modified = None # Last-Modified header
+        self.ranges = True # support range requests
+        self.break_after = None # number of bytes sent in one response before the connection is closed
+        self.bytes_sent = 0
+        self.range_requests = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def url(self, path: str='/file.bin') -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        # a weak ETag never matches `If-Range`
+        if_range_matched = if_range is None or if_range in (self.server.etag, self.server.last_modified) and not if_range.startswith('W/')
+        if self.server.ranges and match and if_range_matched:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            with self.server.lock:
+                self.server.range_requests += 1
+        else:
+            self.send_response(200)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.server.etag)
+        if self.server.last_modified:
+            self.send_header('Last-Modified', self.server.last_modified)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        body = data[start:end + 1]
+        if self.server.break_after is not None and len(body) > 1:
+            body = body[:self.server.break_after]
+            self.close_connection = True
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
@@ -0,0 +1,90 @@
+import logging
+import logging.config
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from etltools.additions.download_index import DownloadIndex, DownloadIndexError
+
+
+class DownloadIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dirs = [os.path.join(self.dir.name, name) for name in ('playlist1', 'playlist2')]
+        for directory in self.dirs:
+            os.mkdir(directory)
+        self.db_path = os.path.join(self.dir.name, 'index.sqlite')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, path: str, data: bytes) -> str:
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_scan(self):
+        video = self.write(os.path.join(self.dirs[0], 'video.mp4'), b'video 1')
+        self.write(os.path.join(self.dirs[1], 'video.mp4.part'), b'unfinished')
+        os.makedirs(os.path.join(self.dirs[1], 'sub'))
+        self.write(os.path.join(self.dirs[1], 'sub', 'other.mp4'), b'video 2')
+
+        with DownloadIndex(self.db_path, self.dirs) as index:
+            self.assertEqual(index.scan(), {'files': 2, 'hashed': 2, 'removed': 0})
+            self.assertEqual(index.scan(), {'files': 2, 'hashed': 0, 'removed': 0}) # nothing is changed
+
+            self.write(video, b'video 1, new version')
+            os.remove(os.path.join(self.dirs[1], 'sub', 'other.mp4'))
+            self.assertEqual(index.scan(), {'files': 1, 'hashed': 1, 'removed': 1})
+
+        with DownloadIndex(self.db_path, self.dirs) as index: # the index is persistent
+            self.assertEqual(index.scan()['hashed'], 0)
+            self.assertEqual(index.lookup(content_hash=index.hash_file(video)), video)
+
+    def test_reuse(self):
+        video = self.write(os.path.join(self.dirs[0], 'video.mp4'), b'video 1')
+        target = os.path.join(self.dirs[1], 'renamed video.mp4')
+
+        with DownloadIndex(self.db_path, self.dirs) as index:
+            self.assertFalse(index.reuse('youtube:1', target))
+            index.add(video, source='youtube:1', validator='"v1"')
+            self.assertEqual((index.validator('youtube:1'), index.validator('youtube:2')), ('"v1"', None))
+
+            self.assertTrue(index.reuse('youtube:1', target))
+            self.assertEqual(os.stat(target).st_ino, os.stat(video).st_ino) # hardlink
+            self.assertTrue(index.reuse('youtube:1', target)) # already exists
+
+            # the original file is deleted, the hardlink is still known
+            os.remove(video)
+            self.assertEqual(index.lookup('youtube:1'), target)
+
+            # the content of the last file is changed
+            self.write(target, b'another video')
+            self.assertIsNone(index.lookup('youtube:1'))
+            self.assertFalse(index.reuse('youtube:1', os.path.join(self.dirs[0], 'video.mp4')))
+
+        self.assertRaises(DownloadIndexError, DownloadIndex, self.db_path, hash_algorithm='unknown')
+
+    def test_old_index(self):
+        # the index of the previous version without validators
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('CREATE TABLE source (source TEXT PRIMARY KEY, hash TEXT NOT NULL);')
+            conn.execute("INSERT INTO source VALUES ('youtube:1', 'hash');")
+        conn.close()
+
+        with DownloadIndex(self.db_path, self.dirs) as index:
+            self.assertIsNone(index.validator('youtube:1'))
+            index.add(self.write(os.path.join(self.dirs[0], 'video.mp4'), b'video 1'), source='youtube:1', validator='"v1"')
+            self.assertEqual(index.validator('youtube:1'), '"v1"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from etltools.experiments.download_progress import BandwidthLimiter, DownloadProgress
+
+
+class BandwidthLimiterTest(unittest.TestCase):
+
+    def test_consume(self):
+        '''
+        the limit is shared by threads: 4 threads download 5 chunks of 10 KB each at 1 MB/s in about 0.2 s
+        '''
+        limiter = BandwidthLimiter(1_000_000)
+
+        def download():
+            for _ in range(5):
+                limiter.consume(10_000)
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=download) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start
+
+        self.assertGreaterEqual(duration, 0.19)
+        self.assertLess(duration, 1.0)
+
+    def test_idle_time_is_not_accumulated(self):
+        '''
+        the time without downloads doesn't allow a burst above the limit after it
+        '''
+        limiter = BandwidthLimiter(1_000_000)
+        time.sleep(0.2)
+        start = time.monotonic()
+        for _ in range(10):
+            limiter.consume(10_000)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class DownloadProgressTest(unittest.TestCase):
+
+    def test_counters_and_report(self):
+        progress = DownloadProgress(videos_total=4, interval=60)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            progress.add_video(3 * 2**20)
+            progress.add_video(2**20)
+            progress.add_chunk(2**20) # the first report, the next ones are not printed until the interval
+            progress.add_chunk(2**20)
+            lines_before_finish = output.getvalue().count('\r')
+            for status in ('downloaded', 'skipped', 'reused', 'failed'):
+                progress.finish_video(status)
+
+        self.assertEqual(lines_before_finish, 1)
+        self.assertEqual(
+            (progress.downloaded, progress.skipped, progress.reused, progress.failed, progress.bytes_done, progress.bytes_total),
+            (1, 1, 1, 1, 2 * 2**20, 4 * 2**20)
+        )
+        last_line = output.getvalue().split('\r')[-1]
+        self.assertIn('4/4 videos (skipped 1, reused 1, failed 1), 2.0/4.0 MB', last_line)
+
+    def test_concurrent_updates(self):
+        progress = DownloadProgress(videos_total=8, interval=60)
+
+        def download():
+            for _ in range(1000):
+                progress.add_chunk(1)
+            progress.finish_video('downloaded')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            threads = [threading.Thread(target=download) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual((progress.downloaded, progress.bytes_done), (8, 8000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+from etltools.additions.download_index import DownloadIndex
+
+
+class FakeStream:
+    '''
+    the best progressive mp4 stream of `FakeYouTube`, `download()` passes the data to the progress callback in chunks
+    '''
+    itag = 22
+    filesize = 1000
+
+    def __init__(self, yt: 'FakeYouTube'):
+        self.yt = yt
+
+    def get_file_path(self, output_path: str) -> str:
+        return os.path.join(output_path, f'{self.yt.video_id}.mp4')
+
+    def exists_at_path(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def download(self, output_path: str, filename_prefix: str=None, skip_existing: bool=True):
+        FakeYouTube.range_sizes.append(pytube.request.default_range_size)
+        if self.yt.video_id in FakeYouTube.broken:
+            raise FakeYouTube.broken[self.yt.video_id]
+        for _ in range(self.filesize // 250):
+            self.yt.on_progress_callback(self, b'x' * 250, 0)
+        with open(self.get_file_path(output_path), 'wb') as f:
+            f.write(b'x' * self.filesize)
+
+
+class FakeStreamQuery:
+
+    def __init__(self, stream: FakeStream):
+        self.stream = stream
+
+    def filter(self, **kwargs) -> 'FakeStreamQuery':
+        return self
+
+    def order_by(self, attribute: str) -> 'FakeStreamQuery':
+        return self
+
+    def desc(self) -> 'FakeStreamQuery':
+        return self
+
+    def first(self) -> FakeStream:
+        return self.stream
+
+
+class FakeYouTube:
+    '''
+    a video with the id from the end of the url; videos in `without_streams` have no mp4 streams,
+    videos in `broken` raise the exception on download
+    '''
+    without_streams = set()
+    broken = {}
+    range_sizes = [] # pytube's chunk size during every download
+
+    def __init__(self, url: str, on_progress_callback=None):
+        self.video_id = url.rsplit('=', 1)[-1]
+        self.on_progress_callback = on_progress_callback
+        self.streams = FakeStreamQuery(None if self.video_id in self.without_streams else FakeStream(self))
+
+
+# pytube isn't required for tests, its API used by yt_download is replaced with the stand-ins above
+pytube = types.ModuleType('pytube')
+pytube.Playlist = None
+pytube.YouTube = FakeYouTube
+pytube.request = types.SimpleNamespace(default_range_size=9 * 2**20)
+pytube.cli = types.ModuleType('pytube.cli')
+pytube.cli.on_progress = None
+
+
+class YtDownloadTest(unittest.TestCase):
+    MODULES = ('pytube', 'pytube.cli', 'etltools.experiments.yt_download')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.saved_modules = {name: sys.modules.pop(name) for name in cls.MODULES if name in sys.modules}
+        sys.modules['pytube'] = pytube
+        sys.modules['pytube.cli'] = pytube.cli
+        from etltools.experiments.yt_download import YtDownload
+        cls.YtDownload = YtDownload
+
+    @classmethod
+    def tearDownClass(cls):
+        for name in cls.MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(cls.saved_modules)
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        FakeYouTube.without_streams = {'nostream'}
+        FakeYouTube.broken = {'broken': OSError('connection reset')}
+        FakeYouTube.range_sizes = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def download(self, urls: list, **kwargs) -> dict:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.YtDownload.download_concurrently(self.dir.name, urls, **kwargs)
+
+    def test_download_concurrently(self):
+        open(os.path.join(self.dir.name, 'existing.mp4'), 'wb').close()
+        urls = [f'https://www.youtube.com/watch?v={video_id}' for video_id in ('new1', 'new2', 'existing', 'nostream', 'broken')]
+
+        result = self.download(urls, workers=2, metadata_workers=2, max_bandwidth=10**6)
+
+        self.assertEqual(
+            (result['downloaded'], result['skipped'], result['reused'], result['failed'], result['bytes']),
+            (2, 1, 0, 2, 2 * FakeStream.filesize)
+        )
+        self.assertEqual(set(result['errors']), {urls[3], urls[4]})
+        self.assertIsInstance(result['errors'][urls[3]], ValueError)
+        self.assertIsInstance(result['errors'][urls[4]], OSError)
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, 'new1.mp4')))
+
+        # the chunk size is decreased for the bandwidth limit only during the downloads
+        self.assertEqual(set(FakeYouTube.range_sizes), {10**6 // 4})
+        self.assertEqual(pytube.request.default_range_size, 9 * 2**20)
+
+    def test_index(self):
+        '''
+        a video known by the index is hardlinked from another directory, downloaded videos are indexed
+        '''
+        other_dir = os.path.join(self.dir.name, 'other')
+        os.mkdir(other_dir)
+        with open(os.path.join(other_dir, 'known.mp4'), 'wb') as f:
+            f.write(b'x' * FakeStream.filesize)
+        urls = [f'https://www.youtube.com/watch?v={video_id}' for video_id in ('known', 'new')]
+
+        with DownloadIndex(os.path.join(self.dir.name, 'index.sqlite')) as index:
+            index.add(os.path.join(other_dir, 'known.mp4'), source=f'youtube:known:{FakeStream.itag}')
+            result = self.download(urls, workers=2, index=index)
+            self.assertIsNotNone(index.lookup(source=f'youtube:new:{FakeStream.itag}'))
+
+        self.assertEqual((result['downloaded'], result['reused'], result['failed']), (1, 1, 0))
+        self.assertEqual(result['bytes'], FakeStream.filesize)
+        self.assertEqual(os.stat(os.path.join(self.dir.name, 'known.mp4')).st_ino, os.stat(os.path.join(other_dir, 'known.mp4')).st_ino)
+
+    def test_chunk_size_is_restored_after_exception(self):
+        FakeYouTube.broken = {'interrupted': KeyboardInterrupt()}
+        with self.assertRaises(KeyboardInterrupt):
+            self.download(['https://www.youtube.com/watch?v=interrupted'], workers=2, max_bandwidth=10**6)
+        self.assertEqual(FakeYouTube.range_sizes, [10**6 // 4])
+        self.assertEqual(pytube.request.default_range_size, 9 * 2**20)
+
+
+if __name__ == '__main__':
+    unittest.main()
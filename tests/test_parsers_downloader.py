@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import logging.config
+import os
+import tempfile
+import threading
+import unittest
+
+from etltools.additions.download_index import DownloadIndex
+from etltools.parsers.downloader import DownloaderError, SegmentedDownloader
+from etltools.tests.parsers.range_server import RangeServer
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+    DATA = os.urandom(3 * 1024 * 1024 + 123)
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+        cls.checksum = 'sha256:' + hashlib.sha256(cls.DATA).hexdigest()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'file.bin')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def downloader(self, **kwargs) -> SegmentedDownloader:
+        return SegmentedDownloader(**{'segments': 4, 'min_segment_size': 256 * 1024, 'chunk_size': 64 * 1024, 'pause_duration': 0.01} | kwargs)
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        with RangeServer(self.DATA) as server:
+            path = self.downloader().download(server.url(), self.path, expected_size=len(self.DATA), checksum=self.checksum)
+        self.assertEqual(path, self.path)
+        self.assertEqual(self.read(), self.DATA)
+        self.assertEqual(server.range_requests, 1 + 4) # probe and 4 segments
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['file.bin'])
+
+    def test_resume(self):
+        with RangeServer(self.DATA) as server:
+            server.break_after = 100 * 1024 # every response is broken
+            with self.assertRaises(DownloaderError):
+                self.downloader(attempts_total=2).download(server.url(), self.path)
+            with open(self.path + SegmentedDownloader.STATE_SUFFIX) as f:
+                done = sum(segment[2] for segment in json.load(f)['segments'])
+            self.assertGreater(done, 0)
+            self.assertFalse(os.path.exists(self.path))
+
+            server.break_after = None
+            server.bytes_sent = 0
+            self.downloader().download(server.url(), self.path, checksum=self.checksum)
+        self.assertEqual(self.read(), self.DATA)
+        self.assertEqual(server.bytes_sent, len(self.DATA) - done + 1) # only the rest and 1 byte of the probe
+        self.assertFalse(os.path.exists(self.path + SegmentedDownloader.STATE_SUFFIX))
+
+    def test_changed_remote_file(self):
+        with RangeServer(self.DATA) as server:
+            server.break_after = 100 * 1024
+            with self.assertRaises(DownloaderError):
+                self.downloader(attempts_total=1).download(server.url(), self.path)
+
+            server.break_after = None
+            server.etag = '"v2"'
+            server.data = self.DATA[::-1]
+            server.bytes_sent = 0
+            self.downloader().download(server.url(), self.path)
+        self.assertEqual(self.read(), self.DATA[::-1])
+        self.assertEqual(server.bytes_sent, len(self.DATA) + 1) # from the beginning
+
+    def test_weak_etag(self):
+        '''
+        a weak ETag isn't sent in `If-Range`, Last-Modified is used instead of it if the server sends it
+        '''
+        for last_modified in (None, 'Mon, 19 Oct 2026 10:00:00 GMT'):
+            with self.subTest(last_modified=last_modified):
+                with RangeServer(self.DATA, etag='W/"v1"') as server:
+                    server.last_modified = last_modified
+                    self.downloader(attempts_total=1).download(server.url(), self.path, checksum=self.checksum)
+                self.assertEqual(self.read(), self.DATA)
+                self.assertEqual(server.range_requests, 1 + 4)
+                os.remove(self.path)
+
+    def test_concurrent_downloads(self):
+        '''
+        one downloader is used by two threads for different files, each download keeps its own state
+        '''
+        downloader = self.downloader(attempts_total=1)
+        other_data = self.DATA[::-1]
+        other_path = os.path.join(self.dir.name, 'other.bin')
+        with RangeServer(self.DATA) as server, RangeServer(other_data, etag='"v2"') as other_server:
+            jobs = ((server.url(), self.path), (other_server.url('/other.bin'), other_path))
+
+            def download_all(errors: list):
+                def download(url: str, path: str):
+                    try:
+                        downloader.download(url, path)
+                    except DownloaderError as ex:
+                        errors.append(ex)
+                threads = [threading.Thread(target=download, args=job) for job in jobs]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            server.break_after = other_server.break_after = 100 * 1024
+            errors = []
+            download_all(errors)
+            self.assertEqual(len(errors), 2)
+            for url, path in jobs:
+                with open(path + SegmentedDownloader.STATE_SUFFIX) as f:
+                    self.assertEqual(json.load(f)['url'], url)
+
+            server.break_after = other_server.break_after = None
+            errors = []
+            download_all(errors)
+            self.assertEqual(errors, [])
+        self.assertEqual(self.read(), self.DATA)
+        with open(other_path, 'rb') as f:
+            self.assertEqual(f.read(), other_data)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['file.bin', 'other.bin'])
+
+    def test_without_ranges(self):
+        with RangeServer(self.DATA) as server:
+            server.ranges = False
+            self.downloader().download(server.url(), self.path, checksum=self.checksum)
+        self.assertEqual(self.read(), self.DATA)
+        self.assertEqual(server.range_requests, 0)
+
+    def test_index(self):
+        other_path = os.path.join(self.dir.name, 'copy.bin')
+        with RangeServer(self.DATA) as server, DownloadIndex(os.path.join(self.dir.name, 'index.sqlite')) as index:
+            self.downloader().download(server.url(), self.path, index=index)
+            server.bytes_sent = 0
+            self.downloader().download(server.url(), other_path, index=index, checksum=self.checksum)
+            self.assertEqual(server.bytes_sent, 1) # only the probe, the known file is hardlinked
+            self.assertEqual(os.stat(other_path).st_ino, os.stat(self.path).st_ino)
+
+            # the reused file doesn't match the checksum
+            os.remove(other_path)
+            server.bytes_sent = 0
+            with self.assertRaises(DownloaderError):
+                self.downloader().download(server.url(), other_path, index=index, checksum='sha256:0000')
+            self.assertEqual(server.bytes_sent, len(self.DATA) + 1) # downloaded and verified again
+            self.assertEqual(self.read(), self.DATA) # the original file isn't changed
+
+            # the remote file is changed
+            server.etag = '"v2"'
+            server.data = self.DATA[::-1]
+            server.bytes_sent = 0
+            self.downloader().download(server.url(), other_path, index=index)
+            self.assertEqual(server.bytes_sent, len(self.DATA) + 1)
+            self.assertEqual(index.validator(server.url()), '"v2"')
+        with open(other_path, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA[::-1])
+        self.assertEqual(self.read(), self.DATA)
+
+    def test_errors(self):
+        with RangeServer(self.DATA) as server:
+            for kwargs in ({'expected_size': 10}, {'checksum': 'sha256:0000'}, {'checksum': 'unknown:0000'}):
+                with self.subTest(kwargs=kwargs):
+                    self.assertRaises(DownloaderError, self.downloader().download, server.url(), self.path, **kwargs)
+                    self.assertFalse(os.path.exists(self.path))
+        self.assertRaises(DownloaderError, self.downloader(attempts_total=1).download, server.url(), self.path) # the server is stopped
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import logging
 import logging.config
 import os
 import subprocess
+import sys
 import time
 import unittest
 from collections import namedtuple
@@ -11,6 +12,7 @@ import requests
 from etltools.local_settings import test_config
 from etltools.parsers.parser import Parser, ParserError
 from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+from etltools.pg_tools.pg_queue import PgJobQueue
 from etltools.tests.parsers._test_db import TestDB
 from etltools.tests.parsers.server_data import server_config, server_data
 
@@ -294,3 +296,37 @@ class ParserTest(unittest.TestCase):
         self.assertEqual(len(before_update_tz), len(after_update_tz)) # total number of rows should be equal before and after the process
         compare = [after>before for before, after in zip(before_update_tz, after_update_tz) if before!=after]
         self.assertEqual(compare, [True]) # we should change only one row
+
+    def test_process_queue(self):
+        '''
+        urls from the job queue are downloaded and processed, failed urls are returned to the queue
+        '''
+        p = Parser(test_config)
+        job_queue = PgJobQueue(test_config, 'test_parser', table='etltools_job_parser_test', retry_delay=60)
+        job_queue.enqueue([
+            {'url': server_config.url() + server_data['ok']['url']},
+            {'url': server_config.url() + '/error_url'},
+            {'url': server_config.url() + server_data['ok']['url']},
+        ])
+
+        htmls = []
+        processed = p.process_queue(job_queue, handler=lambda job: htmls.append(p.html), batch_size=2, idle_timeout=0.5)
+
+        self.assertEqual(processed, 2)
+        self.assertEqual(htmls, [server_data['ok']['msg']] * 2)
+        self.assertEqual(job_queue.stats(), {'ready': 1, 'running': 0, 'done': 2, 'failed': 0})
+
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE etltools_job_parser_test;')
+
+    def test_lazy_imports(self):
+        '''
+        heavy dependencies and local settings are not imported with the parser module
+        '''
+        code = (
+            'import sys, etltools.parsers.parser; '
+            'print(*[m for m in ("requests", "psycopg2", "etltools.parsers.user_agent", "etltools.local_settings", "subprocess") if m in sys.modules])'
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
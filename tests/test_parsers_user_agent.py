@@ -10,7 +10,7 @@ import unittest
 
 from etltools.pg_tools.db_config import DBConfig
 from etltools.local_settings import test_config
-from etltools.parsers.user_agent import UserAgent, UserAgentError
+from etltools.parsers.user_agent import UserAgent, UserAgentClassifier, UserAgentError
 from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
 from etltools.tests.parsers._test_db import TestDB
 
@@ -77,6 +77,160 @@ class UserAgentTest(unittest.TestCase):
 
         self.assertEqual(test_stats, res_stats)
 
+    def test_bulk_insert_user_agents_from_file(self):
+        '''
+        bulk import of text files with User-Agents should give the same stats and rows as the line by line import
+        '''
+        test_stats = {
+            'lines'     : 62,
+            'successes' : 46,
+            'passes'    : 8,
+            'errors'    : 8,
+        }
+        query = 'SELECT user_agent_id, software, title, version, os, hardware, popularity FROM user_agent ORDER BY user_agent_id;'
+
+        res_stats = TestDB.user_agent_insert_test_data()
+        with PgConnector(test_config) as db:
+            rows = db.execute(query)
+
+        TestDB.user_agent_truncate_table()
+        bulk_res_stats = TestDB.user_agent_bulk_insert_test_data()
+        with PgConnector(test_config) as db:
+            bulk_rows = db.execute(query)
+
+        self.assertEqual(test_stats, bulk_res_stats)
+        self.assertEqual(res_stats, bulk_res_stats)
+        self.assertEqual(rows, bulk_rows)
+
+        # the second import should only pass all User-Agents which are already in the table
+        bulk_res_stats = TestDB.user_agent_bulk_insert_test_data()
+        self.assertEqual(test_stats | {'successes': 0, 'passes': 54}, bulk_res_stats)
+
+    def test_classifier_test_data(self):
+        '''
+        classify User-Agent strings from the test data files and compare with the classification in these files
+        '''
+        classifier = UserAgentClassifier()
+        data_dir = os.path.join(TestDB.BASE_DIR, TestDB.USER_AGENT_TEST_DATA_DIR)
+
+        for fname in ('Chrome.txt', 'Firefox.txt', 'Internet Explorer.txt'):
+            with open(os.path.join(data_dir, fname), 'r', encoding='utf-8') as f:
+                for line in f:
+                    user_agent_data = line.strip().split('\t')
+                    if len(user_agent_data) != 5:
+                        continue
+                    title, version, os_type, hardware, _ = user_agent_data
+
+                    software_, version_, os_type_, hardware_ = classifier.classify(title)
+                    with self.subTest(title=title):
+                        self.assertEqual((fname.removesuffix('.txt'), version, os_type), (software_, version_, os_type_))
+                        # the test data have both `Mobile` and `Mobile - Phone` values for the same kind of devices
+                        self.assertTrue(hardware_.startswith(hardware))
+
+    def test_classifier_other_software(self):
+        '''
+        classify User-Agent strings of software which is not in the test data files
+        '''
+        test_data = [
+            (
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59',
+                ('Edge', '91', 'Windows', 'Computer'),
+            ),
+            (
+                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36 OPR/76.0.4017.177',
+                ('Opera', '76', 'macOS', 'Computer'),
+            ),
+            (
+                'Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Mobile/15E148 Safari/604.1',
+                ('Safari', '14', 'iOS', 'Mobile - Phone'),
+            ),
+            (
+                'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/74.0.3729.155 Mobile/15E148 Safari/604.1',
+                ('Chrome', '74', 'iOS', 'Mobile - Tablet'),
+            ),
+            (
+                'Mozilla/5.0 (Linux; Android 9; SM-T510) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.181 Safari/537.36',
+                ('Chrome', '88', 'Android', 'Mobile - Tablet'),
+            ),
+            (
+                'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0',
+                ('Firefox', '89', 'Linux', 'Computer'),
+            ),
+            (
+                'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+                ('Crawler', '2', None, 'Computer'),
+            ),
+            (
+                'Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)',
+                ('Crawler', '3', None, 'Computer'),
+            ),
+            (
+                'AdsBot-Google (+http://www.google.com/adsbot.html)',
+                ('Crawler', None, None, 'Computer'),
+            ),
+            (
+                # phone brands ending with `bot`
+                'Mozilla/5.0 (Linux; Android 10; Cubot X30) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.120 Mobile Safari/537.36',
+                ('Chrome', '91', 'Android', 'Mobile - Phone'),
+            ),
+            (
+                'Mozilla/5.0 (Linux; Android 8.1.0; Abbot Phone) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Mobile Safari/537.36',
+                ('Safari', '4', 'Android', 'Mobile - Phone'),
+            ),
+            (
+                'Lorem ipsum dolor sit amet',
+                (UserAgentClassifier.UNKNOWN, None, None, 'Computer'),
+            ),
+        ]
+
+        classifier = UserAgentClassifier()
+        for title, result in test_data:
+            with self.subTest(title=title, result=result):
+                self.assertEqual(classifier.classify(title), result)
+
+    def test_classifier_cache(self):
+        '''
+        repeated User-Agent strings should be taken from the LRU cache
+        '''
+        classifier = UserAgentClassifier(cache_size=2)
+        titles = [
+            'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:50.0) Gecko/20100101 Firefox/50.0',
+            'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:42.0) Gecko/20100101 Firefox/42.0',
+        ]
+        results = list(classifier.classify_many(titles * 10))
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0], (titles[0], 'Firefox', '50', 'Windows', 'Computer'))
+        self.assertEqual((classifier.cache_info().hits, classifier.cache_info().misses), (18, 2))
+
+    def test_bulk_insert_raw_user_agents(self):
+        '''
+        classify raw User-Agent strings and insert them into the database
+        '''
+        titles = [
+            'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:50.0) Gecko/20100101 Firefox/50.0\n',
+            'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:50.0) Gecko/20100101 Firefox/50.0\n', # copy
+            'Mozilla/5.0 (Linux; Android 7.0; SM-G570M Build/NRD90M) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/69.0.3497.100 Mobile Safari/537.36\n',
+            '\n', # empty line
+            'Lorem ipsum dolor sit amet\n', # not classified
+        ]
+        test_stats = {
+            'lines'     : 5,
+            'successes' : 2,
+            'passes'    : 1,
+            'errors'    : 2,
+        }
+
+        ua = UserAgent(test_config)
+        self.assertEqual(test_stats, ua.bulk_insert_raw_user_agents(titles, batch_size=1))
+
+        with PgConnector(test_config) as db:
+            rows = db.execute('SELECT software, title, version, os, hardware, popularity FROM user_agent ORDER BY user_agent_id;')
+        self.assertEqual(rows, [
+            ('Firefox', titles[0].strip(), '50', 'Windows', 'Computer', None),
+            ('Chrome', titles[2].strip(), '69', 'Android', 'Mobile - Phone', None),
+        ])
+
     def test_get_next_user_agent_from_the_database(self):
         '''
         get next User-Agent from the database
@@ -1,6 +1,13 @@
 import unittest
 
-from etltools.parsers.utils import Utils
+import numpy
+
+from etltools.parsers.utils import NumberLocale, PriceParser, Utils
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
 
 
 class UtilsTest(unittest.TestCase):
@@ -33,3 +40,89 @@ class UtilsTest(unittest.TestCase):
         for idx, (line, result) in enumerate(test_data):
             with self.subTest(idx=idx, line=line, result=result):
                 self.assertEqual(Utils.str_to_int(line), result)
+
+    def test_normalize_many(self):
+        '''
+        the chain of normalizers over a column gives the same values as the per-call methods
+        '''
+        lines = ['Some\n\nmultiline\ntext\n\n', ' 12 345 678\n', '1  234', '\u212b  ', None, 12, '123']
+        spaces = [Utils.clear_string_from_spaces(line) if isinstance(line, str) else None for line in lines]
+        ints = [Utils.str_to_int(line) for line in lines]
+
+        self.assertEqual(Utils.normalize_many(lines), (spaces, [True, True, True, True, False, False, True]))
+        self.assertEqual(Utils.normalize_many(lines, ('int',)), (ints, [False, True, False, False, False, False, True]))
+        self.assertEqual(Utils.normalize_many(iter(lines), ('strip', 'nfc', 'lower'))[0][3], '\u00e5')
+        self.assertEqual(Utils.normalize_many([], ('int',)), ([], []))
+
+        results, mask = Utils.normalize_many(numpy.array(['  a  B ', ' 1 234 ', 'x']), ('strip', 'spaces', 'lower'))
+        self.assertEqual(results.tolist(), ['a b', '1 234', 'x'])
+        results, mask = Utils.normalize_many(numpy.array(lines, dtype=object), ('spaces', 'int'))
+        self.assertEqual(results.dtype, numpy.int64)
+        self.assertEqual(results[mask].tolist(), [12345678, 1234, 123]) # '1  234' is valid after 'spaces'
+
+        # numbers above int64 are Python ints in lists and invalid in arrays
+        big = ['999 999 999 999 999 999 999', '9 223 372 036 854 775 807', '9 223 372 036 854 775 808', '000 000 000 000 000 000 001']
+        self.assertEqual(Utils.normalize_many(big, ('int',))[0], [999999999999999999999, 2**63 - 1, 2**63, 1])
+        results, mask = Utils.normalize_many(numpy.array(big), ('int',))
+        self.assertEqual((results.tolist(), mask.tolist()), ([0, 2**63 - 1, 0, 1], [False, True, False, True]))
+
+        for normalizers in (('unknown',), ('int', 'strip')):
+            with self.subTest(normalizers=normalizers):
+                self.assertRaises(ValueError, Utils.normalize_many, lines, normalizers)
+
+    @unittest.skipIf(pandas is None, 'pandas is not installed')
+    def test_normalize_many_pandas(self):
+        series = pandas.Series(['  a  B ', None, ' 1 234 ', '1234'])
+        results, mask = Utils.normalize_many(series, ('spaces', 'lower'))
+        self.assertEqual(results.tolist(), ['a b', None, '1 234', '1234'])
+        self.assertEqual(mask.tolist(), [True, False, True, True])
+        results, mask = Utils.normalize_many(series, ('int',))
+        self.assertEqual(results[mask].tolist(), [1234])
+
+        big = pandas.Series(['999 999 999 999 999 999 999', '9 223 372 036 854 775 807', '9 223 372 036 854 775 808', '000 000 000 000 000 000 001'])
+        results, mask = Utils.normalize_many(big, ('int',))
+        self.assertEqual((results.tolist(), mask.tolist()), ([0, 2**63 - 1, 0, 1], [False, True, False, True]))
+
+
+class PriceParserTest(unittest.TestCase):
+
+    def test_parse(self):
+        test_data = [
+            ('uk', '1 234,56 \u20b4', (1234.56, 'UAH')),
+            ('uk', '1\u00a0234\u00a0567 \u0433\u0440\u043d.', (1234567.0, 'UAH')),
+            ('en', '$1,234.50', (1234.5, 'USD')),
+            ('en', ' -$1,234.50 ', (-1234.5, 'USD')),
+            ('en', 'USD 10', (10.0, 'USD')),
+            ('en', '\u22123', (-3.0, None)),
+            ('en', '.5', (0.5, None)),
+            ('de', '1.234,5 \u20ac', (1234.5, 'EUR')),
+            ('ch', "1'234.50 Fr.", (1234.5, 'CHF')),
+            (NumberLocale(',', ('.', ' ')), '1.234 567,8 PLN', (1234567.8, 'PLN')),
+            ('en', '1,23', None), # not a group of thousands
+            ('en', '1 234', None),
+            ('en', '$ 5 $', None),
+            ('en', '--5', None),
+            ('en', 'n/a', None),
+            ('en', '', None),
+            ('en', None, None),
+        ]
+        for idx, (locale, text, result) in enumerate(test_data):
+            with self.subTest(idx=idx, locale=locale, text=text, result=result):
+                self.assertEqual(PriceParser(locale).parse(text), result)
+
+        self.assertEqual(PriceParser('en', currencies={'btc': 'BTC'}).parse('0.5 btc'), (0.5, 'BTC'))
+        self.assertRaises(ValueError, PriceParser, 'xx')
+        self.assertRaises(ValueError, PriceParser, NumberLocale(',', (',',)))
+
+    def test_parse_many(self):
+        values = ['1.234,5 EUR', 'n/a', '7', None, '1.234,5 EUR']
+        amounts, currencies, errors = PriceParser('de').parse_many(values)
+        self.assertEqual(amounts.dtype, numpy.float64)
+        self.assertEqual(amounts[[0, 2, 4]].tolist(), [1234.5, 7.0, 1234.5])
+        self.assertTrue(numpy.isnan(amounts[errors]).all())
+        self.assertEqual(currencies.tolist(), ['EUR', None, None, None, 'EUR'])
+        self.assertEqual(errors, [1, 3])
+
+        amounts, currencies, errors = PriceParser().parse_many(numpy.array(['1', '2.5']))
+        self.assertEqual((amounts.tolist(), errors), ([1.0, 2.5], []))
+        self.assertEqual(len(PriceParser().parse_many([])[0]), 0)
@@ -45,3 +45,14 @@ class DBConfigTest(unittest.TestCase):
         for expected_value, received_value in test_data:
             with self.subTest(expected_value=expected_value, received_value=received_value):
                 self.assertEqual(expected_value, received_value)
+
+    def test_connect_params(self):
+        replica = DBConfig(host='replica-srv', port='5435', database='sensors', user='manager', password='*****')
+        config = DBConfig(host='localhost', port='5432', database='sensors', user='manager', password='*****', replicas=[replica], max_replica_lag=5.0)
+
+        self.assertEqual(
+            config.connect_params(),
+            {'host': 'localhost', 'port': '5432', 'database': 'sensors', 'user': 'manager', 'password': '*****'},
+        )
+        # replicas are not shown
+        self.assertEqual(repr(config), "DBConfig(host='localhost', port='5432', database='sensors', user='manager')")
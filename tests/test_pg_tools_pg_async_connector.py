@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import logging.config
+import os
+import unittest
+from dataclasses import asdict
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_async_connector import AsyncPgConnector, AsyncPgConnectorError
+
+
+class AsyncPgConnectorTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    async def asyncSetUp(self):
+        async with AsyncPgConnector(test_config) as db:
+            await db.execute('DROP TABLE IF EXISTS test_async;')
+            await db.execute('CREATE TABLE test_async (test_async_id SERIAL PRIMARY KEY, amount INTEGER NOT NULL);')
+
+    async def asyncTearDown(self):
+        await AsyncPgConnector.close_pools()
+        async with AsyncPgConnector(test_config) as db:
+            await db.execute('DROP TABLE IF EXISTS test_async;')
+
+    async def backend_pid(self) -> int:
+        async with AsyncPgConnector(test_config) as db:
+            return (await db.execute('SELECT pg_backend_pid();'))[0][0]
+
+    async def test_incorrect_connection_configuration(self):
+        with self.assertRaises(AsyncPgConnectorError):
+            AsyncPgConnector(asdict(test_config))
+
+        with self.assertRaises(AsyncPgConnectorError):
+            async with AsyncPgConnector(DBConfig(**(asdict(test_config) | {'database': 'fakedatabase'}))):
+                pass
+
+    async def test_commit_rollback(self):
+        '''
+        the same commit and rollback semantics as in `PgConnector`
+        '''
+        async with AsyncPgConnector(test_config) as db:
+            await db.execute('INSERT INTO test_async (amount) VALUES (1);')
+            await db.commit()
+            await db.execute('INSERT INTO test_async (amount) VALUES (10);')
+            await db.rollback()
+            await db.execute('INSERT INTO test_async (amount) VALUES (100);') # committed in __aexit__()
+
+        with self.assertRaises(ZeroDivisionError):
+            async with AsyncPgConnector(test_config) as db:
+                await db.execute('INSERT INTO test_async (amount) VALUES (1000);') # rolled back in __aexit__()
+                _ = 1 / 0
+
+        async with AsyncPgConnector(test_config) as db:
+            self.assertEqual(await db.execute('SELECT SUM(amount) FROM test_async;'), [(101,)])
+            self.assertIsNone(await db.execute('SELECT * FROM table_does_not_exist;'))
+
+    async def test_pipeline(self):
+        '''
+        many small statements in pipeline mode
+        '''
+        async with AsyncPgConnector(test_config) as db:
+            inserted = await db.execute_pipeline('INSERT INTO test_async (amount) VALUES (%s);', [(n,) for n in range(1, 1000+1)])
+
+            async with db.pipeline():
+                for n in range(1, 100+1):
+                    self.assertIsNone(await db.execute('UPDATE test_async SET amount=amount+1 WHERE test_async_id=%s;', (n,)))
+
+            self.assertEqual(await db.execute('SELECT SUM(amount) FROM test_async;'), [(sum(range(1, 1000+1)) + 100,)])
+
+            with self.assertRaises(AsyncPgConnectorError):
+                async with db.pipeline():
+                    await db.execute('UPDATE test_async SET amount=%s;', ('not a number',))
+            await db.rollback()
+
+        self.assertEqual(inserted, 1000)
+
+    async def test_pool(self):
+        '''
+        connections are borrowed from the registered async pool
+        '''
+        self.assertNotEqual(await self.backend_pid(), await self.backend_pid())
+
+        await AsyncPgConnector.create_pool(test_config, min_size=1, max_size=4)
+        self.assertEqual(await self.backend_pid(), await self.backend_pid())
+
+        # concurrent usage of the pool
+        pids = await asyncio.gather(*[self.backend_pid() for _ in range(50)])
+        self.assertLessEqual(len(set(pids)), 4)
@@ -0,0 +1,136 @@
+import logging
+import logging.config
+import os
+import time
+import unittest
+from dataclasses import replace
+
+import psycopg2.extensions
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_cache import PgResultCache, PgResultCacheError
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_router import PgReplicaRouter
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+class PgResultCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS etltools_cache_test;')
+            db.execute('CREATE TABLE etltools_cache_test (id INT PRIMARY KEY, title TEXT);')
+            db.execute_values('INSERT INTO etltools_cache_test (id, title) VALUES %s;', [(n, f'title {n}') for n in range(10)])
+
+        PgResultCache(test_config).install_trigger('etltools_cache_test')
+
+    @classmethod
+    def tearDownClass(cls):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS etltools_cache_test;')
+
+    def setUp(self):
+        PgQueryStats.reset()
+        self.cache = PgResultCache(test_config, maxsize=3)
+        self.cache.start()
+
+    def tearDown(self):
+        self.cache.stop()
+
+    def wait_invalidation(self, invalidations: int):
+        # notifications are delivered asynchronously after commit
+        deadline = time.monotonic() + 5
+        while self.cache.invalidations < invalidations and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_hits_and_invalidation(self):
+        query = 'SELECT title FROM etltools_cache_test WHERE id=%s;'
+        with PgConnector(test_config, result_cache=self.cache) as db:
+            for _ in range(5):
+                self.assertEqual(db.execute_cached(query, (1,), tables=('etltools_cache_test',)), [('title 1',)])
+
+        self.assertEqual(PgQueryStats.top(key='calls')[0]['calls'], 1) # only the first read went to the server
+        self.assertEqual((self.cache.hits, self.cache.misses), (4, 1))
+
+        with PgConnector(test_config) as db:
+            db.execute("UPDATE etltools_cache_test SET title='changed' WHERE id=2;")
+        self.wait_invalidation(1)
+
+        with PgConnector(test_config, result_cache=self.cache) as db:
+            self.assertEqual(db.execute_cached(query, (1,), tables=('public.etltools_cache_test',)), [('title 1',)])
+            db.execute("UPDATE etltools_cache_test SET title='changed' WHERE id=1;")
+            db.commit()
+            self.wait_invalidation(2)
+            self.assertEqual(db.execute_cached(query, (1,), tables=('etltools_cache_test',)), [('changed',)])
+
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_open_transaction(self):
+        query = 'SELECT title FROM etltools_cache_test WHERE id=%s;'
+        with self.assertRaises(ZeroDivisionError):
+            with PgConnector(test_config, result_cache=self.cache) as db:
+                db.execute("UPDATE etltools_cache_test SET title='uncommitted' WHERE id=3;")
+                self.assertEqual(db.execute_cached(query, (3,), tables=('etltools_cache_test',)), [('uncommitted',)])
+                1 / 0 # the transaction is rolled back, no notification is sent
+
+        self.assertEqual(self.cache.stats()['cached'], 0)
+        for _ in range(2):
+            with PgConnector(test_config, result_cache=self.cache) as db:
+                self.assertEqual(db.execute_cached(query, (3,), tables=('etltools_cache_test',)), [('title 3',)])
+                self.assertEqual(db._conn.status, psycopg2.extensions.STATUS_READY) # the read is committed
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_replica(self):
+        '''
+        the primary plays the role of its lagging replica: reads from the replica are not stored
+        '''
+        query = 'SELECT title FROM etltools_cache_test WHERE id=%s;'
+        config = replace(test_config, replicas=[replace(test_config, host='127.0.0.1')])
+        PgReplicaRouter.reset()
+
+        with PgConnector(config, read_only=True, result_cache=self.cache) as db:
+            self.assertIsNotNone(db.replica)
+            for _ in range(2):
+                self.assertEqual(db.execute_cached(query, (4,), tables=('etltools_cache_test',)), [('title 4',)])
+        self.assertEqual((self.cache.stats()['cached'], self.cache.misses), (0, 2))
+
+        # results read from the primary are returned to replica connections too
+        with PgConnector(test_config, result_cache=self.cache) as db:
+            db.execute_cached(query, (4,), tables=('etltools_cache_test',))
+        with PgConnector(config, read_only=True, result_cache=self.cache) as db:
+            self.assertEqual(db.execute_cached(query, (4,), tables=('etltools_cache_test',)), [('title 4',)])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_lru_and_ttl(self):
+        query = 'SELECT title FROM etltools_cache_test WHERE id=%s;'
+        with PgConnector(test_config, result_cache=self.cache) as db:
+            for n in (1, 2, 3, 1, 4): # 2 is the least recently used when 4 is added
+                db.execute_cached(query, (n,), tables=('etltools_cache_test',))
+            self.assertEqual(self.cache.stats()['cached'], 3)
+            self.assertIsNone(self.cache.get((query, (2,))))
+            self.assertIsNotNone(self.cache.get((query, (1,))))
+
+            self.cache.ttl = 0.05
+            db.execute_cached(query, (5,), tables=('etltools_cache_test',))
+            time.sleep(0.1)
+            self.assertIsNone(self.cache.get((query, (5,))))
+            self.assertEqual(self.cache.expirations, 1)
+
+            # not hashable args and disabled cache go to the server
+            self.assertEqual(db.execute_cached('SELECT %s::int[];', ([1, 2],)), [([1, 2],)])
+
+        self.cache.stop()
+        with PgConnector(test_config, result_cache=self.cache) as db:
+            db.execute_cached(query, (1,), tables=('etltools_cache_test',))
+        self.assertEqual(self.cache.stats()['cached'], 0) # nothing is cached without the listener
+
+        self.assertRaises(PgResultCacheError, PgResultCache, 'config')
+
+
+if __name__ == '__main__':
+    unittest.main()
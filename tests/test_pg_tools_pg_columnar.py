@@ -0,0 +1,136 @@
+import datetime
+import io
+import logging
+import logging.config
+import os
+import threading
+import unittest
+import uuid
+
+import numpy
+import pyarrow
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_columnar import PgColumnarDecoder, PgColumnarError
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+
+
+class PgColumnarTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def test_fixed_width(self):
+        '''
+        fixed-width columns with NULLs in different positions, batches and the transaction
+        '''
+        query = (
+            'SELECT n::int4 AS n, n::int8 * 1000000000 AS big, n / 4.0::float8 AS x, (n %% 2 = 0) AS even, '
+            "  NULLIF(n %% %s, 0)::int2 AS small, DATE '2000-01-01' + n AS day, "
+            "  TIMESTAMP '1999-12-31 23:59:59.5' + n * INTERVAL '1 second' AS ts "
+            'FROM generate_series(1, 1000) AS s(n)'
+        )
+        with PgConnector(test_config) as db:
+            batches = list(db.fetch_columns(query, (7,), batch_size=300))
+            self.assertEqual(db._conn.status, 1) # the transaction of the method is committed
+
+        self.assertEqual([len(batch) for batch in batches], [300, 300, 300, 100])
+        n = numpy.concatenate([batch['n'] for batch in batches])
+        small = numpy.ma.concatenate([batch.masked('small') for batch in batches])
+        self.assertEqual(batches[0]['n'].dtype, numpy.int32)
+        self.assertTrue((n == numpy.arange(1, 1001)).all())
+        self.assertTrue((numpy.concatenate([batch['big'] for batch in batches]) == numpy.arange(1, 1001) * 1_000_000_000).all())
+        self.assertTrue((numpy.concatenate([batch['x'] for batch in batches]) == numpy.arange(1, 1001) / 4).all())
+        self.assertTrue((numpy.concatenate([batch['even'] for batch in batches]) == (n % 2 == 0)).all())
+        self.assertTrue((small.mask == (n % 7 == 0)).all())
+        self.assertTrue((small.filled(0) == n % 7).all())
+        self.assertEqual(batches[0]['day'][0], numpy.datetime64('2000-01-02'))
+        self.assertEqual(batches[0]['ts'][0], numpy.datetime64('2000-01-01T00:00:00.500000'))
+
+    def test_variable_width_and_arrow(self):
+        query = (
+            "SELECT n, CASE WHEN n %% 3 = 0 THEN NULL ELSE 'title ' || n END AS title, "
+            "  jsonb_build_object('n', n) AS data, md5(n::text)::uuid AS id, "
+            "  NOW() AT TIME ZONE 'UTC' AS ts "
+            'FROM generate_series(1, %s) AS s(n)'
+        )
+        with PgConnector(test_config) as db:
+            batches = list(db.fetch_columns(query, (10,), arrow=True))
+
+        self.assertEqual(len(batches), 1)
+        batch = batches[0]
+        self.assertIsInstance(batch, pyarrow.RecordBatch)
+        self.assertEqual(batch.schema.names, ['n', 'title', 'data', 'id', 'ts'])
+        self.assertEqual(batch.column('n').to_pylist(), list(range(1, 11)))
+        self.assertEqual(batch.column('title').to_pylist(), [None if n % 3 == 0 else f'title {n}' for n in range(1, 11)])
+        self.assertEqual(batch.column('title').null_count, 3)
+        self.assertEqual(batch.column('data').to_pylist()[0], {'n': 1})
+        self.assertIsInstance(batches[0].column('ts').to_pylist()[0], datetime.datetime)
+
+        with PgConnector(test_config) as db:
+            batch = next(db.fetch_columns('SELECT md5(1::text)::uuid AS id;'))
+        self.assertIsInstance(batch['id'][0], uuid.UUID)
+
+    def test_decoder_chunks(self):
+        '''
+        COPY data split into chunks of any size gives the same result
+        '''
+        data = io.BytesIO()
+        with PgConnector(test_config) as db:
+            db.copy_expert('COPY (SELECT n, NULLIF(n % 5, 0) FROM generate_series(1, 100) AS s(n)) TO STDOUT WITH (FORMAT binary);', data)
+        data = data.getvalue()
+
+        for chunk_size in (1, 7, 100, len(data)):
+            with self.subTest(chunk_size=chunk_size):
+                decoder = PgColumnarDecoder(['n', 'm'], ['int4', 'int4'], batch_size=30)
+                batches = []
+                for pos in range(0, len(data), chunk_size):
+                    batches.extend(decoder.feed(data[pos:pos + chunk_size]))
+                batches.extend(decoder.finish())
+                self.assertEqual([len(batch) for batch in batches], [30, 30, 30, 10])
+                self.assertEqual(numpy.ma.concatenate([batch.masked('m') for batch in batches]).tolist(), [None if n % 5 == 0 else n % 5 for n in range(1, 101)])
+
+        decoder = PgColumnarDecoder(['n', 'm'], ['int4', 'int4'])
+        decoder.feed(data[:-1])
+        self.assertRaises(PgColumnarError, decoder.finish)
+        self.assertRaises(PgColumnarError, PgColumnarDecoder, ['n'], ['numeric'])
+
+    def test_errors_and_early_stop(self):
+        threads = threading.active_count()
+        with PgConnector(test_config) as db:
+            batches = db.fetch_columns('SELECT n FROM generate_series(1, 1000000) AS s(n)', batch_size=1000, chunk_size=1024)
+            self.assertEqual(len(next(batches)), 1000)
+            batches.close()
+            self.assertEqual(threading.active_count(), threads)
+            self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+            db.commit()
+
+            with self.assertRaises(PgConnectorError):
+                list(db.fetch_columns('SELECT 1::numeric'))
+            with self.assertRaises(PgConnectorError):
+                list(db.fetch_columns('SELECT 1 / (n - 5) FROM generate_series(1, 10) AS s(n)'))
+            self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+
+    def test_busy_connection(self):
+        with PgConnector(test_config) as db:
+            batches = db.fetch_columns('SELECT n FROM generate_series(1, 100000) AS s(n)', batch_size=1000, chunk_size=1024)
+            for _ in range(3):
+                next(batches)
+            # the connection is receiving COPY data, other queries must not be sent
+            with self.assertRaises(PgConnectorError):
+                db.execute('SELECT 1;')
+            with self.assertRaises(PgConnectorError):
+                list(db.iter_query('SELECT 1;'))
+            with self.assertRaises(PgConnectorError):
+                next(db.fetch_columns('SELECT 1'))
+            self.assertRaises(PgConnectorError, db.commit)
+
+            self.assertEqual(sum(len(batch) for batch in batches), 100000 - 3000)
+            self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
+import datetime
+import decimal
 import logging
 import logging.config
 import os
 import unittest
 from dataclasses import asdict
 
+import psycopg2.extensions
+
 from etltools.local_settings import test_config
 from etltools.pg_tools.db_config import DBConfig
 from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
@@ -92,3 +96,233 @@ class PgConnectorTest(unittest.TestCase):
         for expected_value, received_value in test_data:
             with self.subTest(expected_value=expected_value, received_value=received_value):
                 self.assertEqual(expected_value, received_value)
+
+    def test_iter_query(self):
+        '''
+        iterate over query results with a server-side cursor
+        '''
+        query = 'SELECT s1.n FROM generate_series(1, %s) AS s1(n);'
+
+        with PgConnector(test_config) as db:
+            rows = [row[0] for row in db.iter_query(query, (10000,), itersize=128)]
+            batches = list(db.iter_query(query, (1000,), itersize=300, batches=True))
+
+            # the transaction opened by iter_query() is closed after the iteration
+            status_after_iteration = db._conn.status
+
+        self.assertEqual(rows, list(range(1, 10000+1)))
+        self.assertEqual([len(batch) for batch in batches], [300, 300, 300, 100])
+        self.assertEqual(sum(batches, []), [(n,) for n in range(1, 1000+1)])
+        self.assertEqual(status_after_iteration, psycopg2.extensions.STATUS_READY)
+
+    def test_iter_query_early_stop(self):
+        '''
+        stop the iteration early: the server-side cursor should be closed and an outer transaction should stay open
+        '''
+        query = 'SELECT s1.n FROM generate_series(1, 1000000) AS s1(n);'
+        cursors_query = 'SELECT COUNT(*) FROM pg_cursors;'
+
+        with PgConnector(test_config) as db:
+            for row in db.iter_query(query, itersize=100):
+                if row[0] == 10:
+                    break
+            self.assertEqual(db._conn.status, psycopg2.extensions.STATUS_READY)
+
+            # the outer transaction should not be committed by iter_query()
+            db.execute('CREATE TEMP TABLE test_iter_query (n INTEGER);')
+            db.execute('INSERT INTO test_iter_query VALUES (1);')
+            rows = db.iter_query(query, itersize=100)
+            self.assertEqual(next(rows), (1,))
+            self.assertEqual(db.execute(cursors_query)[0][0], 1)
+            rows.close()
+            self.assertEqual(db.execute(cursors_query)[0][0], 0)
+
+            db.rollback()
+            self.assertIsNone(db.execute('SELECT n FROM test_iter_query;')) # the table was rolled back
+
+    def test_iter_query_error(self):
+        '''
+        error in query should raise PgConnectorError and rollback the transaction
+        '''
+        with PgConnector(test_config) as db:
+            with self.assertRaises(PgConnectorError):
+                _ = list(db.iter_query('SELECT * FROM table_does_not_exist;'))
+            self.assertEqual(db._conn.status, psycopg2.extensions.STATUS_READY)
+            self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+
+    def test_execute_many_execute_values(self):
+        '''
+        batch execution of queries
+        '''
+        with PgConnector(test_config) as db:
+            db.execute('CREATE TEMP TABLE test_batch (test_batch_id SERIAL PRIMARY KEY, amount INTEGER NOT NULL);')
+
+            # multi-row `INSERT ... VALUES` with aggregated `RETURNING` results from all pages
+            returning = db.execute_values(
+                'INSERT INTO test_batch (amount) VALUES %s RETURNING test_batch_id;'
+                , [(n,) for n in range(1, 1000+1)]
+                , page_size=64
+                , fetch=True
+            )
+            inserted = db.execute_values('INSERT INTO test_batch (amount) VALUES %s;', [(n,) for n in range(10)], template='(%s * 0)')
+
+            # double all amounts with `UPDATE` for each row
+            updated = db.execute_many('UPDATE test_batch SET amount=amount*2 WHERE test_batch_id=%s;', returning, page_size=50)
+            amount_sum = db.execute('SELECT SUM(amount) FROM test_batch;')[0][0]
+
+            error = db.execute_many('UPDATE table_does_not_exist SET amount=%s;', [(1,)])
+            db.rollback()
+
+        self.assertEqual(returning, [(n,) for n in range(1, 1000+1)])
+        self.assertEqual((inserted, updated), (10, 1000))
+        self.assertEqual(amount_sum, 2 * sum(range(1, 1000+1)))
+        self.assertIsNone(error)
+
+    def test_copy_in(self):
+        '''
+        stream rows from a generator with text and binary COPY
+        '''
+        ddl_create_table = (
+            'CREATE TEMP TABLE test_copy ('
+            '  test_copy_id INTEGER, title TEXT, amount DOUBLE PRECISION, flag BOOLEAN, '
+            '  tags TEXT[], numbers INTEGER[], insert_tz TIMESTAMPTZ, insert_date DATE, data BYTEA'
+            ');'
+        )
+        columns = ('test_copy_id', 'title', 'amount', 'flag', 'tags', 'numbers', 'insert_tz', 'insert_date', 'data')
+        insert_tz = datetime.datetime(2021, 3, 4, 5, 6, 7, 890123, tzinfo=datetime.timezone.utc)
+        rows = [
+            (1, 'tab\there', 3.14, True, ['alpha', 'beta'], [1, 2, 3], insert_tz, datetime.date(2021, 3, 4), b'\x00\x01'),
+            (2, 'new\nline\r\nand back\\slash', -2.5, False, [], [42], insert_tz, datetime.date(1999, 12, 31), b''),
+            (3, None, None, None, None, None, None, None, None),
+            (4, '\\N', float('inf'), True, ['gamma'], [], insert_tz, datetime.date(2000, 1, 1), b'\\'),
+            (5, 'arrays', 0.0, False, ['a"b', 'c\\d', 'e,f', None, 'tab\tin', 'NULL'], [1, None], insert_tz, datetime.date(2000, 1, 1), b''),
+        ]
+        binary_columns = ('test_copy_id', 'title', 'amount', 'flag', 'insert_tz', 'insert_date', 'data')
+        binary_rows = [(n, f'title {n}', n / 3, n % 2 == 0, insert_tz + datetime.timedelta(days=n), datetime.date(2021, 3, 4), bytes([n % 256])) for n in range(5000)]
+
+        with PgConnector(test_config) as db:
+            db.execute(ddl_create_table)
+
+            # small chunks to check streaming of many rows
+            text_total = db.copy_in('test_copy', columns, (row for row in rows), chunk_size=16)
+            text_rows = [tuple(bytes(value) if isinstance(value, memoryview) else value for value in row) for row in db.execute('SELECT * FROM test_copy ORDER BY test_copy_id;')]
+
+            db.execute('TRUNCATE TABLE test_copy;')
+            binary_total = db.copy_in('pg_temp.test_copy', binary_columns, (row for row in binary_rows), chunk_size=1024, binary=True)
+            binary_result = [
+                tuple(bytes(value) if isinstance(value, memoryview) else value for value in row)
+                for row in db.execute('SELECT test_copy_id, title, amount, flag, insert_tz, insert_date, data FROM test_copy ORDER BY test_copy_id;')
+            ]
+
+            with self.assertRaises(PgConnectorError):
+                db.copy_in('test_copy', ('test_copy_id', 'numbers'), [(1, [1, 2])], binary=True) # no binary encoder for arrays
+            db.rollback()
+
+        self.assertEqual((text_total, binary_total), (len(rows), len(binary_rows)))
+        self.assertEqual(text_rows, rows)
+        self.assertEqual(binary_result, binary_rows)
+
+    def test_copy_in_formats(self):
+        '''
+        text and binary COPY store the same values of date and time columns
+        '''
+        moscow = datetime.timezone(datetime.timedelta(hours=3))
+        rows = [
+            (1, datetime.datetime(2021, 3, 4, 12, 0, tzinfo=moscow), datetime.datetime(2021, 3, 4, 12, 0, tzinfo=moscow), datetime.date(2021, 3, 4)),
+            (2, datetime.datetime(2021, 3, 4, 12, 0), datetime.datetime(2021, 3, 4, 12, 0, tzinfo=datetime.timezone.utc), datetime.datetime(2021, 3, 4, 23, 59)),
+        ]
+        columns = ('n', 'ts', 'tstz', 'd')
+        results = []
+        with PgConnector(test_config) as db:
+            db.execute('CREATE TEMP TABLE test_copy_formats (n INTEGER, ts TIMESTAMP, tstz TIMESTAMPTZ, d DATE);')
+            for binary in (False, True):
+                db.copy_in('test_copy_formats', columns, rows, binary=binary)
+                results.append(db.execute('SELECT * FROM test_copy_formats ORDER BY n;'))
+                db.execute('TRUNCATE TABLE test_copy_formats;')
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][0][1], datetime.datetime(2021, 3, 4, 12, 0)) # the wall time, not UTC
+        self.assertEqual(results[1][0][2], rows[0][2])
+        self.assertEqual(results[1][1][3], datetime.date(2021, 3, 4))
+
+    def test_prepared_statements(self):
+        '''
+        hot queries are prepared after the threshold and executed with `EXECUTE`
+        '''
+        query = 'SELECT amount * %s FROM test_prepared WHERE test_prepared_id = %s;'
+        prepared_query = 'SELECT name FROM pg_prepared_statements WHERE statement LIKE %s;'
+
+        with PgConnector(test_config, prepare_threshold=3, prepared_cache_size=2) as db:
+            self.assertEqual(db.prepared_stats(), {'cached': 0, 'hits': 0, 'misses': 0, 'prepares': 0, 'evictions': 0, 'invalidations': 0})
+
+            db.execute('CREATE TEMP TABLE test_prepared (test_prepared_id INTEGER, amount INTEGER);')
+            db.execute('INSERT INTO test_prepared SELECT n, n FROM generate_series(1, 10) AS s(n);')
+            results = [db.execute(query, (2, n))[0][0] for n in range(1, 10+1)]
+            prepared_names = db.execute(prepared_query, ('%test_prepared_id = $2%',))
+            stats = db.prepared_stats()
+
+            # the schema change invalidates the prepared statement of `SELECT *`
+            select_all = 'SELECT * FROM test_prepared WHERE test_prepared_id = %s;'
+            for _ in range(3):
+                db.execute(select_all, (1,))
+            db.commit()
+            db.execute('ALTER TABLE test_prepared ADD COLUMN title TEXT;')
+            db.commit()
+            select_all_result = db.execute(select_all, (1,)) # repeated without preparing in a new transaction
+            invalidations = db.prepared_stats()['invalidations']
+
+            # not preparable queries are executed as is
+            for _ in range(5):
+                in_result = db.execute('SELECT COUNT(*) FROM test_prepared WHERE test_prepared_id IN %s;', ((1, 2, 3),))
+
+        self.assertEqual(results, [2 * n for n in range(1, 10+1)])
+        self.assertEqual(len(prepared_names), 1)
+        self.assertEqual(stats, {'cached': 1, 'hits': 7, 'misses': 6, 'prepares': 1, 'evictions': 0, 'invalidations': 0})
+        self.assertEqual(select_all_result, [(1, 1, None)])
+        self.assertEqual(invalidations, 1)
+        self.assertEqual(in_result, [(3,)])
+
+    def test_prepared_statements_types(self):
+        '''
+        results of prepared statements are the same as results of the queries with literals
+        '''
+        cases = [
+            ('SELECT %s, %s + 1;', (5, 5)),
+            ('SELECT %s::int + %s;', (1, 2.5)),
+            ('SELECT %s, %s, %s;', (2**40, 2**70, float('inf'))),
+            ('SELECT %s, %s || %s, %s IS NULL;', (True, 'a', 'b', None)),
+            ('SELECT %s + 1, %s::text;', (datetime.date(2024, 1, 31), decimal.Decimal('1.50'))),
+            ('SELECT %s, %s;', (b'bytes', datetime.timedelta(hours=1))),
+        ]
+        with PgConnector(test_config) as db:
+            expected = [db.execute(query, args) for query, args in cases]
+
+        with PgConnector(test_config, prepare_threshold=2) as db:
+            for _ in range(3):
+                for (query, args), result in zip(cases, expected):
+                    with self.subTest(query=query, args=args):
+                        self.assertEqual(db.execute(query, args), result)
+            # args of another type are another statement
+            self.assertEqual(db.execute('SELECT %s::int + %s;', (1, 2)), [(3,)])
+            stats = db.prepared_stats()
+
+        # the type of NULL in `%s IS NULL` can't be inferred, the query is executed as is
+        self.assertEqual((stats['cached'], stats['prepares']), (len(cases) - 1, len(cases) - 1))
+
+    def test_prepared_statements_eviction(self):
+        '''
+        the least recently used statements are deallocated
+        '''
+        with PgConnector(test_config, prepare_threshold=1, prepared_cache_size=2) as db:
+            for n in range(5):
+                self.assertEqual(db.execute(f'SELECT {n} + %s;', (1,)), [(n + 1,)])
+            prepared_total = db.execute('SELECT COUNT(*) FROM pg_prepared_statements;')[0][0]
+            stats = db.prepared_stats()
+
+            # an error in PREPARE must not abort the open transaction
+            db.execute('CREATE TEMP TABLE test_prepared (n INTEGER);')
+            self.assertIsNone(db.execute('SELECT * FROM table_does_not_exist WHERE n = %s;', (1,)))
+            db.rollback()
+
+        self.assertEqual(prepared_total, 2) # the last query to pg_prepared_statements is prepared too
+        self.assertEqual((stats['cached'], stats['evictions']), (2, 4))
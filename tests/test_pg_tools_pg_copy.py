@@ -0,0 +1,66 @@
+import datetime
+import unittest
+
+from etltools.pg_tools.pg_copy import PgCopyError, PgCopyReader
+
+
+class PgCopyReaderTest(unittest.TestCase):
+
+    def test_text_value(self):
+        '''
+        encode Python values for the text format of COPY
+        '''
+        test_data = [
+            (None, '\\N'),
+            ('\\N', '\\\\N'),
+            ('a\tb\nc\rd\\e', 'a\\tb\\nc\\rd\\\\e'),
+            (True, 't'),
+            (42, '42'),
+            (0.1, '0.1'),
+            (float('nan'), 'NaN'),
+            (float('-inf'), '-Infinity'),
+            (datetime.date(2021, 3, 4), '2021-03-04'),
+            (b'\x00\xff', '\\\\x00ff'),
+            ({'a': 1}, '{"a": 1}'),
+            ([1, 2, 3], '{1,2,3}'),
+            ([['a"b', None], ['c\td', 'e']], '{{"a\\\\"b",NULL},{"c\\td","e"}}'),
+        ]
+        for idx, (value, result) in enumerate(test_data):
+            with self.subTest(idx=idx, value=value, result=result):
+                self.assertEqual(PgCopyReader.text_value(value), result)
+
+    def test_read_chunks(self):
+        '''
+        rows are read from the iterable lazily, in chunks
+        '''
+        rows_read = []
+
+        def rows():
+            for n in range(100):
+                rows_read.append(n)
+                yield (n, 'x' * 10)
+
+        reader = PgCopyReader(rows(), chunk_size=100)
+        first_chunk = reader.read(10)
+        self.assertLess(len(rows_read), 100)
+        self.assertTrue(first_chunk.startswith('0\txxxxxxxxxx\n1\t'))
+
+        chunks = [first_chunk]
+        while chunk := reader.read(10):
+            chunks.append(chunk)
+        self.assertEqual(''.join(chunks), ''.join(f'{n}\txxxxxxxxxx\n' for n in range(100)))
+        self.assertEqual(reader.rows, 100)
+
+    def test_binary(self):
+        '''
+        binary format : header, rows and trailer
+        '''
+        reader = PgCopyReader([(1, None)], encoders=PgCopyReader.binary_encoders(['int4', 'text']))
+        self.assertEqual(
+            reader.read(),
+            b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8 + b'\x00\x02' + b'\x00\x00\x00\x04\x00\x00\x00\x01' + b'\xff\xff\xff\xff' + b'\xff\xff'
+        )
+        self.assertEqual(reader.read(), b'')
+
+        with self.assertRaises(PgCopyError):
+            PgCopyReader.binary_encoders(['numeric'])
@@ -0,0 +1,123 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import logging.config
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet
+import zstandard
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_export import PgExporter, PgExporterError
+
+
+class PgExporterTest(unittest.TestCase):
+
+    ROWS_TOTAL = 10_000
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        self.out_dir = tempfile.TemporaryDirectory()
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_export;')
+            db.execute('CREATE TABLE test_export (test_export_id INTEGER PRIMARY KEY, title TEXT, amount FLOAT8);')
+            db.execute(
+                "INSERT INTO test_export SELECT n, CASE WHEN n %% 100 = 0 THEN NULL ELSE 'title, \"' || n || E'\\n' END, n / 2.0 "
+                'FROM generate_series(1, %s) AS s(n);'
+                , (self.ROWS_TOTAL,)
+            )
+
+    def tearDown(self):
+        self.out_dir.cleanup()
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_export;')
+
+    def read_files(self, manifest: dict) -> list:
+        '''
+        check checksums and sizes of the files and read all rows
+        '''
+        rows = []
+        for file in manifest['files']:
+            path = os.path.join(self.out_dir.name, file['file'])
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.assertEqual((len(data), hashlib.sha256(data).hexdigest()), (file['bytes'], file['sha256']))
+
+            if manifest['format'] == 'parquet':
+                table = pyarrow.parquet.read_table(path)
+                file_rows = list(zip(*(table.column(idx).to_pylist() for idx in range(table.num_columns))))
+            else:
+                if manifest['compression'] == 'gzip':
+                    data = gzip.decompress(data)
+                elif manifest['compression'] == 'zstd':
+                    data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+                text = data.decode()
+                if manifest['format'] == 'csv':
+                    file_rows = list(csv.reader(io.StringIO(text)))
+                    self.assertEqual(file_rows[0], ['test_export_id', 'title', 'amount'])
+                    file_rows = [(int(n), title or None, float(amount)) for n, title, amount in file_rows[1:]]
+                else:
+                    file_rows = [line.split('\t') for line in text.splitlines()]
+                    file_rows = [(int(n), None if title == '\\N' else title.replace('\\n', '\n'), float(amount)) for n, title, amount in file_rows]
+            self.assertEqual(len(file_rows), file['rows'])
+            rows.extend(file_rows)
+        return sorted(rows)
+
+    def test_export(self):
+        expected = [(n, None if n % 100 == 0 else f'title, "{n}\n', n / 2) for n in range(1, self.ROWS_TOTAL + 1)]
+
+        test_data = [
+            {'format': 'csv', 'compression': 'gzip', 'key_column': 'test_export_id', 'partitions': 2, 'shard_size': 50_000},
+            {'format': 'csv', 'compression': 'zstd', 'workers': 2},
+            {'format': 'tsv', 'compression': None, 'shard_size': 10_000, 'partitions': 3},
+            {'format': 'parquet', 'compression': 'zstd', 'key_column': 'test_export_id', 'partitions': 2, 'batch_size': 1000, 'shard_size': 50_000},
+        ]
+        for idx, params in enumerate(test_data):
+            with self.subTest(idx=idx, params=params):
+                exporter = PgExporter(test_config, 'test_export', self.out_dir.name, name=f'test_export_{idx}', **params)
+                manifest = exporter.export()
+                with open(exporter.manifest_path) as f:
+                    self.assertEqual(json.load(f), manifest)
+
+                self.assertEqual(manifest['rows'], self.ROWS_TOTAL)
+                if 'shard_size' in params:
+                    self.assertGreater(len(manifest['files']), len({file['partition'] for file in manifest['files']}))
+                self.assertEqual(self.read_files(manifest), expected)
+
+    def test_export_query(self):
+        exporter = PgExporter(
+            test_config, None, self.out_dir.name, name='test_query', format='tsv', compression='gzip'
+            , query='SELECT test_export_id, title, amount FROM test_export WHERE test_export_id <= %s;', args=(10,)
+        )
+        manifest = exporter.export()
+        self.assertEqual([row[0] for row in self.read_files(manifest)], list(range(1, 11)))
+        self.assertEqual(len(manifest['files']), 1)
+
+    def test_errors(self):
+        test_data = [
+            {'table': None},
+            {'format': 'xml'},
+            {'format': 'csv', 'compression': 'snappy'},
+        ]
+        for params in test_data:
+            with self.subTest(params=params):
+                self.assertRaises(PgExporterError, PgExporter, test_config, params.pop('table', 'test_export'), self.out_dir.name, **params)
+
+        exporter = PgExporter(test_config, 'test_export', self.out_dir.name, columns=('test_export_id', 'column_does_not_exist'), shard_size=1000)
+        self.assertRaises(PgExporterError, exporter.export)
+        self.assertEqual(os.listdir(self.out_dir.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import logging
+import logging.config
+import os
+import threading
+import unittest
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_extract import PgParallelExtractor, PgParallelExtractorError
+
+
+class PgParallelExtractorTest(unittest.TestCase):
+
+    ROWS_TOTAL = 10_000
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_extract;')
+            db.execute('CREATE TABLE test_extract (test_extract_id INTEGER, title TEXT NOT NULL);')
+            db.execute(
+                "INSERT INTO test_extract SELECT n, 'title ' || n FROM generate_series(1, %s) AS s(n) ORDER BY random();"
+                , (self.ROWS_TOTAL,)
+            )
+            db.execute("INSERT INTO test_extract VALUES (NULL, 'null key');")
+
+    def tearDown(self):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_extract;')
+
+    def test_extract(self):
+        expected = sorted([(n, f'title {n}') for n in range(1, self.ROWS_TOTAL + 1)]) + [(None, 'null key')]
+
+        test_data = [
+            ({'key_column': 'test_extract_id'}, True),
+            ({'key_column': 'test_extract_id', 'workers': 3, 'partitions': 7, 'batch_size': 100}, False),
+            ({}, True),
+            ({'workers': 2, 'batch_size': 333}, False),
+        ]
+        for idx, (params, ordered) in enumerate(test_data):
+            with self.subTest(idx=idx, params=params, ordered=ordered):
+                extractor = PgParallelExtractor(test_config, 'test_extract', columns=('test_extract_id', 'title'), **params)
+                batches = list(extractor.extract(ordered=ordered))
+                rows = [row for batch in batches for row in batch]
+
+                self.assertLessEqual(max(len(batch) for batch in batches), params.get('batch_size', 2000))
+                if ordered and 'key_column' in params:
+                    self.assertEqual(rows, expected)
+                else:
+                    self.assertEqual(sorted(rows, key=lambda row: (row[0] is None, row[0] or 0)), expected)
+
+    def test_extract_where(self):
+        extractor = PgParallelExtractor(
+            test_config, 'test_extract', columns=('title',), key_column='test_extract_id', where='test_extract_id %% %s = 0', args=(1000,)
+        )
+        rows = [row for batch in extractor.extract(ordered=True) for row in batch]
+        self.assertEqual(rows, [(f'title {n}',) for n in range(1000, self.ROWS_TOTAL + 1, 1000)])
+
+    def test_snapshot(self):
+        '''
+        rows committed after the start of the extraction are not extracted
+        '''
+        extractor = PgParallelExtractor(test_config, 'test_extract', key_column='test_extract_id', workers=2, batch_size=100)
+        batches = extractor.extract(ordered=True)
+        rows = list(next(batches))
+
+        with PgConnector(test_config) as db:
+            db.execute("INSERT INTO test_extract SELECT n, 'new' FROM generate_series(%s, %s) AS s(n);", (self.ROWS_TOTAL + 1, self.ROWS_TOTAL + 100))
+            db.execute('DELETE FROM test_extract WHERE test_extract_id > %s;', (self.ROWS_TOTAL - 100,))
+
+        rows.extend(row for batch in batches for row in batch)
+        self.assertEqual(len(rows), self.ROWS_TOTAL + 1)
+        self.assertNotIn('new', {title for _, title in rows})
+
+    def test_early_stop_and_errors(self):
+        threads = threading.active_count()
+        batches = PgParallelExtractor(test_config, 'test_extract', workers=4, batch_size=10, queue_size=1).extract()
+        next(batches)
+        batches.close()
+        self.assertEqual(threading.active_count(), threads)
+
+        with self.assertRaises(PgParallelExtractorError):
+            list(PgParallelExtractor(test_config, 'test_extract', columns=('column_does_not_exist',)).extract())
+        self.assertEqual(threading.active_count(), threads)
+
+        empty = PgParallelExtractor(test_config, 'test_extract', key_column='test_extract_id', where='FALSE')
+        self.assertEqual(list(empty.extract()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import datetime
+import logging
+import logging.config
+import os
+import unittest
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_incremental import PgIncrementalExtractor, PgIncrementalExtractorError
+
+
+class PgIncrementalExtractorTest(unittest.TestCase):
+
+    STATE_TABLE = 'test_watermark'
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS test_incremental, {self.STATE_TABLE};')
+            db.execute(
+                'CREATE TABLE test_incremental ('
+                '  test_incremental_id SERIAL PRIMARY KEY, '
+                '  title TEXT NOT NULL, '
+                '  insert_tz TIMESTAMPTZ NOT NULL, '
+                '  update_tz TIMESTAMPTZ '
+                ');'
+            )
+
+    def tearDown(self):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS test_incremental, {self.STATE_TABLE};')
+
+    def insert(self, titles: list, insert_tz: datetime.datetime, update_tz: datetime.datetime=None):
+        with PgConnector(test_config) as db:
+            db.execute_many('INSERT INTO test_incremental (title, insert_tz, update_tz) VALUES (%s, %s, %s);', [(title, insert_tz, update_tz) for title in titles])
+
+    def extractor(self, **params) -> PgIncrementalExtractor:
+        return PgIncrementalExtractor(
+            test_config, 'test_source', 'test_incremental', params.pop('watermark_column', 'test_incremental_id')
+            , columns=('title',), state_table=self.STATE_TABLE, **params
+        )
+
+    def titles(self, extractor: PgIncrementalExtractor) -> list:
+        return sorted(title for rows in extractor.extract() for title, in rows)
+
+    def test_id_watermark(self):
+        extractor = self.extractor(batch_size=2)
+        self.assertEqual(self.titles(extractor), [])
+
+        self.insert(['a', 'b', 'c'], datetime.datetime.now(datetime.timezone.utc))
+        self.assertEqual(self.titles(extractor), ['a', 'b', 'c'])
+        self.assertEqual(extractor.new_watermark, '3')
+
+        # the watermark is not saved without commit, the same rows are extracted again
+        self.assertEqual(self.titles(extractor), ['a', 'b', 'c'])
+        extractor.commit()
+        self.assertEqual(extractor.watermark(), '3')
+        self.assertEqual(self.titles(extractor), [])
+        self.assertIsNone(extractor.new_watermark)
+
+        self.insert(['d', 'e'], datetime.datetime.now(datetime.timezone.utc))
+        loaded = []
+        self.assertEqual(extractor.run(loaded.extend), 2)
+        self.assertEqual(loaded, [('d',), ('e',)])
+        self.assertEqual(extractor.watermark(), '5')
+
+        # overlap re-reads the last rows
+        self.assertEqual(self.titles(self.extractor(overlap=2)), ['d', 'e'])
+
+        extractor.reset()
+        self.assertIsNone(extractor.watermark())
+        self.assertEqual(len(self.titles(extractor)), 5)
+
+    def test_state_table(self):
+        '''
+        reads don't create the state table, it is created once by `commit()`
+        '''
+        def state_table_exists() -> bool:
+            with PgConnector(test_config) as db:
+                return db.execute('SELECT to_regclass(%s) IS NOT NULL;', (self.STATE_TABLE,))[0][0]
+
+        extractor = self.extractor()
+        self.assertIsNone(extractor.watermark())
+        self.insert(['a'], datetime.datetime.now(datetime.timezone.utc))
+        self.assertEqual(self.titles(extractor), ['a'])
+        self.assertFalse(state_table_exists())
+
+        extractor.commit()
+        self.assertTrue(state_table_exists())
+        self.assertEqual(extractor.watermark(), '1')
+        self.assertEqual(self.extractor().watermark(), '1') # a new extractor finds the table
+
+    def test_failed_load(self):
+        self.insert(['a', 'b'], datetime.datetime.now(datetime.timezone.utc))
+        extractor = self.extractor()
+
+        def load(rows):
+            raise ValueError('load failed')
+
+        self.assertRaises(ValueError, extractor.run, load)
+        self.assertIsNone(extractor.watermark())
+        self.assertEqual(extractor.run(lambda rows: None), 2)
+        self.assertEqual(extractor.watermark(), '2')
+
+    def test_timestamp_watermark(self):
+        '''
+        watermark on `COALESCE(update_tz, insert_tz)` with overlap for late arrivals and filter
+        '''
+        start = datetime.datetime(2021, 3, 4, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+        self.insert(['a', 'b'], start)
+        self.insert(['c'], start - datetime.timedelta(hours=1), start + datetime.timedelta(seconds=1))
+        self.insert(['skip'], start)
+
+        extractor = self.extractor(
+            watermark_column=('update_tz', 'insert_tz'), overlap=datetime.timedelta(minutes=5), where='title <> %s', args=('skip',)
+        )
+        self.assertEqual(extractor.run(lambda rows: None), 3)
+        with PgConnector(test_config) as db:
+            saved = db.execute('SELECT %s::timestamptz;', (extractor.watermark(),))[0][0]
+        self.assertEqual(saved, start + datetime.timedelta(seconds=1))
+
+        # a late row inside the overlap and a new row; the rows near the watermark are extracted again
+        self.insert(['late'], start - datetime.timedelta(minutes=1))
+        self.insert(['old'], start - datetime.timedelta(minutes=10))
+        self.insert(['new'], start + datetime.timedelta(minutes=1))
+        self.assertEqual(self.titles(extractor), ['a', 'b', 'c', 'late', 'new'])
+
+    def test_errors(self):
+        self.assertRaises(PgIncrementalExtractorError, PgIncrementalExtractor, str(test_config), 'source', 'test_incremental', 'title')
+
+        self.insert(['a'], datetime.datetime.now(datetime.timezone.utc))
+        with self.assertRaises(PgIncrementalExtractorError):
+            list(self.extractor(watermark_column='column_does_not_exist').extract())
+
+
+if __name__ == '__main__':
+    unittest.main()
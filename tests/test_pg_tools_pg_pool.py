@@ -0,0 +1,155 @@
+import logging
+import logging.config
+import os
+import threading
+import time
+import unittest
+from dataclasses import asdict
+
+import psycopg2
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.db_config import DBConfig
+from etltools.pg_tools.pg_connector import PgConnector, PgConnectorError
+from etltools.pg_tools.pg_pool import PgPool, PgPoolError
+
+
+class PgPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_pool;')
+            db.execute('CREATE TABLE test_pool (test_pool_id SERIAL PRIMARY KEY, amount INTEGER NOT NULL);')
+
+    @classmethod
+    def tearDownClass(cls):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_pool;')
+
+    def tearDown(self):
+        PgPool.close_all()
+
+    def backend_pid(self) -> int:
+        with PgConnector(test_config) as db:
+            return db.execute('SELECT pg_backend_pid();')[0][0]
+
+    def test_incorrect_pool_configuration(self):
+        test_data = [
+            {'config': str(test_config)},
+            {'config': test_config, 'minconn': 5, 'maxconn': 2},
+            {'config': test_config, 'minconn': 0, 'maxconn': 0},
+        ]
+
+        for kwargs in test_data:
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(PgPoolError):
+                    PgPool(**kwargs)
+
+    def test_reuse_connection(self):
+        '''
+        `PgConnector` with a registered pool should reuse the same server connection
+        '''
+        # without pool, every connector opens a new connection
+        self.assertIsNone(PgPool.get(test_config))
+        self.assertNotEqual(self.backend_pid(), self.backend_pid())
+
+        pool = PgPool.create(test_config, minconn=1, maxconn=2)
+        self.assertIs(PgPool.get(DBConfig(**asdict(test_config))), pool) # pools are registered by configuration values
+        self.assertEqual(self.backend_pid(), self.backend_pid())
+        self.assertEqual(pool.stats(), {'open': 1, 'idle': 1, 'borrowed': 0})
+
+    def test_commit_rollback(self):
+        '''
+        `__exit__()` should commit or rollback transaction before returning the connection to the pool
+        '''
+        PgPool.create(test_config, minconn=1, maxconn=1)
+
+        with PgConnector(test_config) as db:
+            db.execute('TRUNCATE TABLE test_pool;')
+            db.execute('INSERT INTO test_pool (amount) VALUES (1);')
+
+        with self.assertRaises(ZeroDivisionError):
+            with PgConnector(test_config) as db:
+                db.execute('INSERT INTO test_pool (amount) VALUES (2);')
+                _ = 1 / 0
+
+        # the connection must be returned to the pool without open transaction
+        with PgConnector(test_config) as db:
+            self.assertEqual(db.execute('SELECT SUM(amount) FROM test_pool;')[0][0], 1)
+
+    def test_max_lifetime(self):
+        '''
+        connections older than `max_lifetime` are not reused
+        '''
+        PgPool.create(test_config, minconn=0, maxconn=1, max_lifetime=0.0)
+        self.assertNotEqual(self.backend_pid(), self.backend_pid())
+
+    def test_idle_timeout(self):
+        '''
+        idle connections above `minconn` are closed after `idle_timeout`
+        '''
+        pool = PgPool.create(test_config, minconn=1, maxconn=3, idle_timeout=0.1)
+        with PgConnector(test_config), PgConnector(test_config), PgConnector(test_config):
+            self.assertEqual(pool.stats(), {'open': 3, 'idle': 0, 'borrowed': 3})
+        self.assertEqual(pool.stats()['idle'], 3)
+
+        time.sleep(0.2)
+        with PgConnector(test_config):
+            self.assertEqual(pool.stats(), {'open': 1, 'idle': 0, 'borrowed': 1})
+
+    def test_health_check(self):
+        '''
+        broken connections should be replaced on checkout
+        '''
+        PgPool.create(test_config, minconn=1, maxconn=1, health_check_interval=0.0)
+        pid = self.backend_pid()
+
+        # terminate the pooled connection from another (not pooled) connection
+        conn = psycopg2.connect(**test_config.connect_params())
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_terminate_backend(%s);', (pid,))
+        conn.close()
+
+        new_pid = self.backend_pid()
+        self.assertNotEqual(pid, new_pid)
+        self.assertEqual(PgPool.get(test_config).stats()['open'], 1)
+
+    def test_timeout(self):
+        '''
+        error if all connections are borrowed longer than `timeout`
+        '''
+        PgPool.create(test_config, minconn=0, maxconn=1, timeout=0.1)
+        with PgConnector(test_config):
+            with self.assertRaises(PgConnectorError):
+                with PgConnector(test_config):
+                    pass
+
+    def test_threads(self):
+        '''
+        many threads share a small pool
+        '''
+        pool = PgPool.create(test_config, minconn=1, maxconn=4)
+        pids = set()
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(20):
+                    pids.add(self.backend_pid())
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(pids), 4)
+        self.assertEqual(pool.stats()['borrowed'], 0)
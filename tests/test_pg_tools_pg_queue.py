@@ -0,0 +1,100 @@
+import logging
+import logging.config
+import os
+import threading
+import time
+import unittest
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_queue import PgJobQueue, PgJobQueueError
+
+
+class PgJobQueueTest(unittest.TestCase):
+    TABLE = 'etltools_job_test'
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS {self.TABLE};')
+
+    @classmethod
+    def tearDownClass(cls):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS {cls.TABLE};')
+
+    def test_claim_ack(self):
+        with PgJobQueue(test_config, 'test', table=self.TABLE) as job_queue:
+            ids = job_queue.enqueue([{'url': f'/page/{n}'} for n in range(5)])
+            PgJobQueue(test_config, 'other', table=self.TABLE).enqueue([{'url': '/other'}])
+            job_queue.enqueue([{'url': '/delayed'}], delay=60)
+
+            jobs = job_queue.claim(3)
+            self.assertEqual([job.id for job in jobs], ids[:3])
+            self.assertEqual([job.payload for job in jobs], [{'url': f'/page/{n}'} for n in range(3)])
+            self.assertEqual({job.attempts for job in jobs}, {1})
+
+            self.assertEqual(job_queue.ack(jobs), 3)
+            self.assertEqual(job_queue.ack(jobs), 0) # already done
+            self.assertEqual([job.id for job in job_queue.claim(10)], ids[3:]) # not the other queue and not the delayed job
+            self.assertEqual(job_queue.claim(10), [])
+            self.assertEqual(job_queue.stats(), {'ready': 1, 'running': 2, 'done': 3, 'failed': 0})
+
+        self.assertRaises(PgJobQueueError, PgJobQueue, 'config')
+
+    def test_visibility_timeout_and_attempts(self):
+        job_queue = PgJobQueue(test_config, 'test', table=self.TABLE, visibility_timeout=0.1, max_attempts=2, retry_delay=0)
+        job_queue.enqueue([{'n': 1}, {'n': 2}])
+
+        jobs = job_queue.claim(2)
+        self.assertEqual(job_queue.fail(jobs[1:], error='error 1'), 1)
+        time.sleep(0.2)
+
+        # the worker of the first job is "crashed", the job is claimed again and the old claim is not valid
+        again = job_queue.claim(2)
+        self.assertEqual([(job.id, job.attempts) for job in again], [(jobs[0].id, 2), (jobs[1].id, 2)])
+        self.assertEqual(job_queue.ack(jobs[:1]), 0)
+        self.assertEqual(job_queue.extend(again[:1], timeout=60), 1)
+
+        self.assertEqual(job_queue.fail(again[1:], error='error 2'), 1)
+        time.sleep(0.2)
+        self.assertEqual(job_queue.claim(2), []) # the first job is extended, the second one is failed
+        self.assertEqual(job_queue.stats(), {'ready': 0, 'running': 1, 'done': 0, 'failed': 1})
+
+    def test_concurrent_workers(self):
+        '''
+        every job is claimed exactly once by concurrent workers, waiting workers are woken up by new jobs
+        '''
+        jobs_total = 500
+        claimed = []
+        lock = threading.Lock()
+
+        def worker():
+            with PgJobQueue(test_config, 'test', table=self.TABLE) as job_queue:
+                while jobs := job_queue.claim(20, wait=1.0):
+                    job_queue.ack(jobs)
+                    with lock:
+                        claimed.extend(job.payload['n'] for job in jobs)
+
+        PgJobQueue(test_config, 'test', table=self.TABLE).create_table()
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        start = time.monotonic()
+        time.sleep(0.3) # the workers are waiting for jobs
+        PgJobQueue(test_config, 'test', table=self.TABLE).enqueue([{'n': n} for n in range(jobs_total)])
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claimed), list(range(jobs_total)))
+        self.assertLess(time.monotonic() - start, PgJobQueue.POLL_INTERVAL) # woken up by the notification, not by polling
+
+
+if __name__ == '__main__':
+    unittest.main()
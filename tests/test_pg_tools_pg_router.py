@@ -0,0 +1,136 @@
+import logging
+import logging.config
+import os
+import time
+import unittest
+from dataclasses import replace
+
+import psycopg2
+
+from etltools import local_settings
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_router import PgReplicaRouter
+
+
+# optional streaming replica of `test_config`, for example `DBConfig(host='localhost', port='5433', ...)`
+test_replica_config = getattr(local_settings, 'test_replica_config', None)
+
+
+class PgReplicaRouterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        PgReplicaRouter.reset()
+
+    def tearDown(self):
+        PgReplicaRouter.configure(lag_check_interval=1.0, retry_interval=30.0)
+        PgReplicaRouter.reset()
+
+    def test_round_robin_and_failover(self):
+        '''
+        the primary server plays the role of its replicas under different host names
+        '''
+        replicas = [replace(test_config, host='127.0.0.1'), replace(test_config, host='localhost'), replace(test_config, port='1')]
+        config = replace(test_config, replicas=replicas)
+
+        hosts = []
+        for _ in range(6):
+            with PgConnector(config, read_only=True) as db:
+                self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+                hosts.append(db.replica.host)
+        # the failed replica is skipped, the next one in order is used instead of it
+        self.assertEqual(hosts, ['127.0.0.1', 'localhost', '127.0.0.1', 'localhost', '127.0.0.1', 'localhost'])
+
+        with PgConnector(config) as db: # writes go to the primary
+            self.assertIsNone(db.replica)
+
+        config = replace(test_config, replicas=[replace(test_config, port='1')])
+        with PgConnector(config, read_only=True) as db: # no available replicas
+            self.assertIsNone(db.replica)
+            self.assertEqual(db.execute('SELECT 1;'), [(1,)])
+
+        # the failed replica is used again after `retry_interval`
+        PgReplicaRouter.configure(retry_interval=0.0)
+        PgReplicaRouter.reset()
+        config = replace(test_config, replicas=[replace(test_config, port='1'), replace(test_config, host='127.0.0.1')])
+        with PgConnector(config, read_only=True) as db:
+            self.assertEqual(db.replica.host, '127.0.0.1')
+        self.assertEqual(PgReplicaRouter.replicas(config), config.replicas[::-1])
+
+    @unittest.skipIf(test_replica_config is None, 'test_replica_config is not defined in local_settings')
+    def test_replication_lag(self):
+        PgReplicaRouter.configure(lag_check_interval=0.0)
+        config = replace(test_config, replicas=[test_replica_config], max_replica_lag=0.5)
+
+        with PgConnector(config, read_only=True) as db:
+            self.assertEqual(db.replica, test_replica_config)
+            self.assertEqual(db.execute('SELECT pg_is_in_recovery();'), [(True,)])
+            db.execute('SELECT pg_wal_replay_pause();')
+        try:
+            with PgConnector(test_config) as db:
+                db.execute('CREATE TABLE IF NOT EXISTS etltools_router_test (n INT);')
+                db.execute('INSERT INTO etltools_router_test VALUES (1);')
+            time.sleep(1.0)
+
+            with PgConnector(config, read_only=True) as db: # the replica is too far behind
+                self.assertIsNone(db.replica)
+        finally:
+            with PgConnector(replace(config, max_replica_lag=None), read_only=True) as db:
+                db.execute('SELECT pg_wal_replay_resume();')
+            with PgConnector(test_config) as db:
+                db.execute('DROP TABLE IF EXISTS etltools_router_test;')
+
+        time.sleep(0.5)
+        with PgConnector(config, read_only=True) as db:
+            self.assertEqual(db.replica, test_replica_config)
+
+    @unittest.skipIf(test_replica_config is None, 'test_replica_config is not defined in local_settings')
+    def test_disconnected_replica(self):
+        '''
+        the replica without WAL receiver has replayed all received WAL, but it isn't up to date
+        '''
+        PgReplicaRouter.configure(lag_check_interval=0.0)
+        config = replace(test_config, replicas=[test_replica_config], max_replica_lag=0.5)
+
+        # ALTER SYSTEM can't be executed in a transaction
+        conn = psycopg2.connect(**test_replica_config.connect_params())
+        conn.autocommit = True
+        primary_conninfo = None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SHOW primary_conninfo;')
+                primary_conninfo = cur.fetchone()[0]
+                cur.execute("ALTER SYSTEM SET primary_conninfo = '';")
+                cur.execute('SELECT pg_reload_conf();')
+                self.wait_wal_receiver(cur, 0)
+
+            with PgConnector(config, read_only=True) as db:
+                self.assertIsNone(db.replica)
+        finally:
+            if primary_conninfo is not None:
+                with conn.cursor() as cur:
+                    cur.execute('ALTER SYSTEM SET primary_conninfo = %s;', (primary_conninfo,))
+                    cur.execute('SELECT pg_reload_conf();')
+                    self.wait_wal_receiver(cur, 1)
+            conn.close()
+
+        with PgConnector(config, read_only=True) as db:
+            self.assertEqual(db.replica, test_replica_config)
+
+    def wait_wal_receiver(self, cur, receivers: int):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            cur.execute("SELECT COUNT(*) FROM pg_stat_wal_receiver WHERE status = 'streaming';")
+            if cur.fetchone()[0] == receivers:
+                return
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import logging
+import logging.config
+import os
+import unittest
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_stats import PgQueryStats
+
+
+class PgQueryStatsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        PgQueryStats.reset()
+
+    def tearDown(self):
+        PgQueryStats.configure(enabled=True, slow_query_threshold=1.0, slow_query_sample_rate=1.0)
+        PgQueryStats.reset()
+
+    def test_normalize(self):
+        test_data = [
+            ("SELECT * FROM t WHERE id IN (1, 2, 3) AND title = 'a''b' AND n > %s;", 'SELECT * FROM t WHERE id IN (...) AND title = ? AND n > ?;'),
+            ('SELECT  title\n FROM user_agent\tWHERE hardware=%(hardware)s;', 'SELECT title FROM user_agent WHERE hardware=?;'),
+            ('EXECUTE etltools_ps_12 ($1, -2.5e3);', 'EXECUTE etltools_ps_12 (?, ?);'),
+            ('SELECT col1 FROM t2 LIMIT 10;', 'SELECT col1 FROM t2 LIMIT ?;'),
+        ]
+        for idx, (query, result) in enumerate(test_data):
+            with self.subTest(idx=idx, query=query, result=result):
+                self.assertEqual(PgQueryStats.normalize(query), result)
+
+    def test_record_top(self):
+        for n in range(100):
+            PgQueryStats.record(f'SELECT {n};', 0.001 * (n + 1), rows=1)
+        PgQueryStats.record('UPDATE t SET a=1;', 0.5, rows=10)
+        PgQueryStats.record('UPDATE t SET a=2;', 0.1, error=True)
+
+        select, update = PgQueryStats.top(10)
+        self.assertEqual(select['query'], 'SELECT ?;')
+        self.assertEqual((select['calls'], select['rows'], select['errors']), (100, 100, 0))
+        self.assertAlmostEqual(select['total_time'], 0.001 * 5050)
+        self.assertAlmostEqual(select['mean_time'], 0.0505)
+        self.assertAlmostEqual(select['p99_time'], 0.1)
+        self.assertEqual((update['calls'], update['rows'], update['errors']), (2, 10, 1))
+
+        self.assertEqual([row['query'] for row in PgQueryStats.top(1, key='max_time')], ['UPDATE t SET a=?;'])
+        self.assertRaises(ValueError, PgQueryStats.top, 1, 'unknown')
+
+        PgQueryStats.configure(enabled=False)
+        PgQueryStats.record('SELECT 1;', 1.0)
+        self.assertEqual(PgQueryStats.top(1)[0]['calls'], 100)
+
+    def test_slow_query_log(self):
+        PgQueryStats.configure(slow_query_threshold=0.5, slow_query_sample_rate=1.0)
+        with self.assertLogs(PgQueryStats.logger, level='WARNING') as logs:
+            PgQueryStats.record('SELECT 1;', 0.1)
+            PgQueryStats.record('SELECT 2;', 0.6, args=('x' * 1000,))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Slow query', logs.output[0])
+        self.assertLess(len(logs.output[0]), 500)
+
+        PgQueryStats.configure(slow_query_sample_rate=0.0)
+        with self.assertNoLogs(PgQueryStats.logger, level='WARNING'):
+            PgQueryStats.record('SELECT 3;', 0.6)
+
+    def test_pg_connector(self):
+        '''
+        statistics of queries executed by `PgConnector`
+        '''
+        with PgConnector(test_config) as db:
+            for n in range(5):
+                db.execute('SELECT * FROM generate_series(1, %s);', (n,))
+            db.execute('SELECT * FROM table_does_not_exist;')
+            db.rollback()
+            db.execute_many('SELECT %s;', [(n,) for n in range(10)])
+            rows = sum(1 for _ in db.iter_query('SELECT * FROM generate_series(1, 100);', itersize=30))
+
+        stats = {row['query']: row for row in PgQueryStats.top(100, key='calls')}
+        self.assertEqual(rows, 100)
+        self.assertEqual((stats['SELECT * FROM generate_series(?, ?);']['calls'], stats['SELECT * FROM generate_series(?, ?);']['rows']), (6, 0+1+2+3+4+100))
+        self.assertEqual(stats['SELECT * FROM table_does_not_exist;']['errors'], 1)
+        self.assertEqual(stats['SELECT ?;']['rows'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
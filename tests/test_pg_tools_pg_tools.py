@@ -1,5 +1,9 @@
 import unittest
 
+import numpy
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
 from etltools.pg_tools.pg_tools import PgTools, PgToolsError
 
 
@@ -15,6 +19,8 @@ class PgToolsTest(unittest.TestCase):
             ([1.123, 2.7, 3.14, 4.5, 5.585], 'int', '{1,2,3,4,5}'),
             ([1.123, 2.7, 3.14, 4.5, 5.585], 'float', '{1.123,2.7,3.14,4.5,5.585}'),
             ([3.14, 2.81, 1.67], 'str', '{"3.14","2.81","1.67"}'),
+            (['say "hi"', 'C:\\dir', None], 'str', '{"say \\"hi\\"","C:\\\\dir",NULL}'),
+            ((1, None, 3), 'int', '{1,NULL,3}'),
         ]
 
         for idx, (lst, dtype, result) in enumerate(test_data):
@@ -36,3 +42,77 @@ class PgToolsTest(unittest.TestCase):
             with self.subTest(idx=idx, lst=lst, dtype=dtype, result=result):
                 with self.assertRaises(PgToolsError):
                     _ = PgTools.list_to_array(lst=lst, dtype=dtype)
+
+    def test_encode_array(self):
+        test_data = [
+            ([], '{}'),
+            ([1, -2, 3], '{1,-2,3}'),
+            ([1.5, 2, float('nan'), float('inf'), float('-inf')], '{1.5,2,NaN,Infinity,-Infinity}'),
+            ([[1, 2], [3, None]], '{{1,2},{3,NULL}}'),
+            ([True, False, None], '{t,f,NULL}'),
+            (['a,b', '{c}', ' d ', 'NULL', ''], '{"a,b","{c}"," d ","NULL",""}'),
+            (['a"b', 'c\\d', 'e\nf'], '{"a\\"b","c\\\\d","e\nf"}'),
+            ([b'\x00\xff', 'x'], '{"\\\\x00ff","x"}'),
+            (numpy.arange(6, dtype='int16').reshape(2, 3), '{{0,1,2},{3,4,5}}'),
+            (numpy.array([0.5, numpy.nan, -numpy.inf]), '{0.5,NaN,-Infinity}'),
+            (numpy.array([True, False]), '{t,f}'),
+            (numpy.array(['a"', 'b']), '{"a\\"","b"}'),
+        ]
+        for idx, (value, result) in enumerate(test_data):
+            with self.subTest(idx=idx, value=value, result=result):
+                self.assertEqual(PgTools.encode_array(value), result)
+
+        # sub-arrays which PostgreSQL rejects
+        for value in ([[1, 2], [3]], [[1, 2], 3], [[1, 2], None], [[[1, 2]], [[3]]], [[], []], [numpy.array([1, 2]), [3]]):
+            with self.subTest(value=value):
+                self.assertRaises(PgToolsError, PgTools.encode_array, value)
+
+        for value in ('abc', 42, numpy.int64(42), {'a': 1}):
+            with self.subTest(value=value):
+                self.assertRaises(PgToolsError, PgTools.encode_array, value)
+
+    def test_decode_array(self):
+        test_data = [
+            ('{}', str, []),
+            ('{1,2,3}', int, [1, 2, 3]),
+            ('{ 1 , NULL , 3 }', int, [1, None, 3]),
+            ('{1.5,NaN,-Infinity}', float, [1.5, float('-inf')]), # NaN is checked separately
+            ('[0:1][1:2]={{1,2},{3,NULL}}', int, [[1, 2], [3, None]]),
+            ('{t,f,NULL}', 'bool', [True, False, None]),
+            ('{"a,b","{c}"," d ","NULL","",x y,null}', str, ['a,b', '{c}', ' d ', 'NULL', '', 'x y', None]),
+            ('{"a\\"b","c\\\\d"}', str, ['a"b', 'c\\d']),
+            ('{"a","b c"}', str, ['a', 'b c']),
+            ('{ "a" , b }', str, ['a', 'b']),
+            ('{a\\,b,\\NULL,c\\"d}', str, ['a,b', 'NULL', 'c"d']),
+        ]
+        for idx, (text, dtype, result) in enumerate(test_data):
+            with self.subTest(idx=idx, text=text, result=result):
+                value = PgTools.decode_array(text, dtype)
+                if idx == 3:
+                    self.assertNotEqual(value[1], value[1])
+                    del value[1]
+                self.assertEqual(value, result)
+
+        for text in ('', '1,2', '{1,,2}', '{1', '{{1},2', '{"a""b"}', '{1}x', '{1},{2}', '{abc}'):
+            with self.subTest(text=text):
+                self.assertRaises(PgToolsError, PgTools.decode_array, text, int)
+
+        for text in ('{"a",,"b"}', '{"a""b"}', '{"a" b}', '{a,"b"}x', '{"a}', '{,"a"}'):
+            with self.subTest(text=text):
+                self.assertRaises(PgToolsError, PgTools.decode_array, text, str)
+
+    def test_round_trip(self):
+        '''
+        encoded arrays are read by PostgreSQL as the same values and its output is decoded back
+        '''
+        test_data = [
+            (['plain', 'a"b', 'c\\d', 'e,f', '{g}', ' h ', 'NULL', '', None], 'text[]', str),
+            ([[1, 2, 3], [4, None, 6]], 'int8[]', int),
+            ([0.1, -1e300, 2.5], 'float8[]', float),
+        ]
+        with PgConnector(test_config) as db:
+            for idx, (value, type_name, dtype) in enumerate(test_data):
+                with self.subTest(idx=idx, value=value, type_name=type_name):
+                    array, text = db.execute(f'SELECT %s::{type_name}, %s::{type_name}::text;', (PgTools.encode_array(value),) * 2)[0]
+                    self.assertEqual(array, value)
+                    self.assertEqual(PgTools.decode_array(text, dtype), value)
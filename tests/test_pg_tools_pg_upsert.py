@@ -0,0 +1,135 @@
+import logging
+import logging.config
+import os
+import unittest
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_upsert import PgUpsert, PgUpsertError
+
+
+class PgUpsertTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_upsert;')
+            db.execute(
+                'CREATE TABLE test_upsert ('
+                '  test_upsert_id SERIAL PRIMARY KEY, '
+                '  code TEXT NOT NULL, region INTEGER NOT NULL, title TEXT, amount INTEGER, '
+                '  UNIQUE (code, region)'
+                ');'
+            )
+            db.execute("INSERT INTO test_upsert (code, region, title, amount) VALUES ('a', 1, 'alpha', 1), ('b', 1, 'beta', 2), ('c', 1, NULL, 3);")
+
+    def tearDown(self):
+        with PgConnector(test_config) as db:
+            db.execute('DROP TABLE IF EXISTS test_upsert;')
+
+    def select_rows(self) -> list:
+        with PgConnector(test_config) as db:
+            return db.execute('SELECT code, region, title, amount FROM test_upsert ORDER BY code, region;')
+
+    def test_incorrect_columns(self):
+        with self.assertRaises(PgUpsertError):
+            PgUpsert(test_config, 'test_upsert', ('code', 'title'), key_columns=('code', 'region'))
+
+    def test_upsert(self):
+        '''
+        insert new rows, update changed rows and skip identical rows
+        '''
+        upsert = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'title', 'amount'), key_columns=('code', 'region'))
+        rows = [
+            ('a', 1, 'alpha', 1),   # unchanged
+            ('b', 1, 'beta', 20),   # updated
+            ('c', 1, None, 3),      # unchanged, NULL values are compared as equal
+            ('a', 2, 'alpha', 1),   # inserted
+            ('d', 1, 'delta', 4),   # duplicate, the next row is used
+            ('d', 1, 'delta', 5),   # inserted
+        ]
+
+        stats = upsert.upsert(iter(rows))
+
+        self.assertEqual(stats, {'rows': 6, 'inserted': 2, 'updated': 1, 'unchanged': 2, 'duplicates': 1})
+        self.assertEqual(self.select_rows(), [
+            ('a', 1, 'alpha', 1),
+            ('a', 2, 'alpha', 1),
+            ('b', 1, 'beta', 20),
+            ('c', 1, None, 3),
+            ('d', 1, 'delta', 5),
+        ])
+
+        # the same rows again - nothing to change
+        self.assertEqual(upsert.upsert(rows), {'rows': 6, 'inserted': 0, 'updated': 0, 'unchanged': 5, 'duplicates': 1})
+
+    def test_upsert_update_columns(self):
+        '''
+        only `update_columns` are compared and updated; empty list means insert only
+        '''
+        rows = [('a', 1, 'new alpha', 10), ('e', 1, 'epsilon', 5)]
+
+        stats = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'title', 'amount'), ('code', 'region'), update_columns=('amount',)).upsert(rows)
+        self.assertEqual(stats, {'rows': 2, 'inserted': 1, 'updated': 1, 'unchanged': 0, 'duplicates': 0})
+        self.assertEqual(self.select_rows()[0], ('a', 1, 'alpha', 10))
+
+        stats = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'title', 'amount'), ('code', 'region'), update_columns=()).upsert(rows)
+        self.assertEqual(stats, {'rows': 2, 'inserted': 0, 'updated': 0, 'unchanged': 2, 'duplicates': 0})
+
+    def test_upsert_with_connection(self):
+        '''
+        upsert in the caller's transaction
+        '''
+        upsert = PgUpsert(test_config, 'public.test_upsert', ('code', 'region', 'amount'), key_columns=('code', 'region'))
+        with PgConnector(test_config) as db:
+            first = upsert.upsert([('x', 1, 1)], db=db)
+            second = upsert.upsert([('x', 1, 2)], db=db) # the staging table is recreated in the same transaction
+            db.rollback()
+
+        self.assertEqual((first['inserted'], second['updated']), (1, 1))
+        self.assertEqual(len(self.select_rows()), 3)
+
+    def test_upsert_parallel(self):
+        '''
+        split rows between several connections
+        '''
+        upsert = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'title', 'amount'), key_columns=('code', 'region'))
+        rows = [(f'code {n % 1000}', n // 1000, f'title {n}', n) for n in range(10_000)]
+
+        stats = upsert.upsert_parallel(iter(rows), workers=4, queue_size=100)
+        self.assertEqual(stats, {'rows': 10_000, 'inserted': 10_000, 'updated': 0, 'unchanged': 0, 'duplicates': 0})
+
+        rows = [(code, region, title, amount + (amount % 2)) for code, region, title, amount in rows]
+        stats = upsert.upsert_parallel(rows, workers=3)
+        self.assertEqual(stats, {'rows': 10_000, 'inserted': 0, 'updated': 5_000, 'unchanged': 5_000, 'duplicates': 0})
+        self.assertEqual(len(self.select_rows()), 10_000 + 3)
+
+    def test_upsert_parallel_error(self):
+        '''
+        error in workers should be raised after all workers are finished
+        '''
+        upsert = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'amount'), key_columns=('code', 'region'))
+        rows = [(f'code {n}', 1, 'not a number') for n in range(1000)]
+
+        with self.assertRaises(PgUpsertError):
+            upsert.upsert_parallel(rows, workers=2, queue_size=10)
+
+    def test_upsert_parallel_rows_error(self):
+        '''
+        error in the rows iterator: all workers roll back, nothing is committed
+        '''
+        upsert = PgUpsert(test_config, 'test_upsert', ('code', 'region', 'amount'), key_columns=('code', 'region'))
+
+        def rows():
+            for n in range(1000):
+                yield f'code {n}', 1, n
+            raise ValueError('source is broken')
+
+        with self.assertRaises(ValueError):
+            upsert.upsert_parallel(rows(), workers=2, queue_size=10)
+        self.assertEqual(len(self.select_rows()), 3)
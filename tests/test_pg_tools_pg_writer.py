@@ -0,0 +1,134 @@
+import logging
+import logging.config
+import os
+import time
+import unittest
+from dataclasses import replace
+
+from etltools.local_settings import test_config
+from etltools.pg_tools.pg_connector import PgConnector
+from etltools.pg_tools.pg_writer import PgBatchWriter, PgBatchWriterError
+
+
+class PgBatchWriterTest(unittest.TestCase):
+    TABLE = 'etltools_writer_test'
+
+    @classmethod
+    def setUpClass(cls):
+        # apply logging during testing
+        logging.config.fileConfig(fname='test_logging.conf', disable_existing_loggers=False)
+        cls.logger = logging.getLogger(os.path.basename(__file__))
+
+    def setUp(self):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS {self.TABLE};')
+            db.execute(f'CREATE TABLE {self.TABLE} (url TEXT PRIMARY KEY, title TEXT, price NUMERIC);')
+
+    @classmethod
+    def tearDownClass(cls):
+        with PgConnector(test_config) as db:
+            db.execute(f'DROP TABLE IF EXISTS {cls.TABLE};')
+
+    def rows(self) -> list:
+        with PgConnector(test_config) as db:
+            return db.execute(f'SELECT url, title, price FROM {self.TABLE} ORDER BY url;')
+
+    def test_batches(self):
+        with PgBatchWriter(test_config, self.TABLE, ('url', 'title', 'price'), batch_size=1000, flush_interval=10) as writer:
+            for n in range(2500):
+                if n % 2:
+                    writer.put((f'/item/{n:04}', f'title {n}', n))
+                else:
+                    writer.put({'price': n, 'url': f'/item/{n:04}', 'title': f'title {n}'})
+
+        rows = self.rows()
+        self.assertEqual(len(rows), 2500)
+        self.assertEqual(rows[1], ('/item/0001', 'title 1', 1))
+        self.assertEqual((writer.rows, writer.batches, writer.dropped), (2500, 3, 0))
+        self.assertRaises(PgBatchWriterError, writer.put, ('/item/late', None, None)) # the writer is closed
+
+    def test_flush_interval_and_flush(self):
+        with PgBatchWriter(test_config, self.TABLE, ('url', 'title', 'price'), batch_size=1000, flush_interval=0.2) as writer:
+            for n in range(5):
+                writer.put((f'/item/{n}', None, None))
+            time.sleep(0.6)
+            self.assertEqual(len(self.rows()), 5) # the batch is written by time
+
+            writer.flush_interval = 60
+            writer.put(('/item/5', None, None))
+            writer.flush()
+            self.assertEqual(len(self.rows()), 6)
+            self.assertEqual(writer.batches, 2)
+
+    def test_backpressure(self):
+        with PgConnector(test_config) as lock:
+            # the writer waits for the lock, as if the database is too slow
+            lock.execute(f'LOCK TABLE {self.TABLE} IN ACCESS EXCLUSIVE MODE;')
+            writer = PgBatchWriter(test_config, self.TABLE, ('url', 'title', 'price'), batch_size=2, flush_interval=10, queue_size=4, put_timeout=0.2)
+            writer.start()
+            with self.assertRaises(PgBatchWriterError):
+                for n in range(100):
+                    writer.put((f'/item/{n:02}', None, None))
+            self.assertEqual(n, 6) # 2 rows in the blocked batch and 4 rows in the queue
+            self.assertGreaterEqual(writer.stats()['blocked_time'], 0.2)
+
+        writer.close()
+        self.assertEqual(len(self.rows()), 6)
+
+    def test_upsert(self):
+        with PgBatchWriter(test_config, self.TABLE, ('url', 'title', 'price'), key_columns=('url',)) as writer:
+            for n in range(10):
+                writer.put((f'/item/{n % 3}', f'title {n}', n))
+        self.assertEqual(self.rows(), [('/item/0', 'title 9', 9), ('/item/1', 'title 7', 7), ('/item/2', 'title 8', 8)])
+
+    def test_bad_rows(self):
+        '''
+        bad rows are rejected, the writer continues without repeats
+        '''
+        rejected = []
+        start = time.perf_counter()
+        with PgBatchWriter(test_config, self.TABLE, ('url', 'title', 'price'), batch_size=100, flush_interval=0.1,
+                           on_reject=lambda row, ex: rejected.append(row)) as writer:
+            for n in range(10):
+                writer.put((f'/item/{n}', f'title {n}', n))
+            writer.put(('/item/bad price', 'title', 'abc')) # DataError
+            writer.put(('/item/1', 'duplicate', 1)) # IntegrityError
+            writer.put(('/item/bad array', [[1], [2, 3]], 1)) # can't be encoded
+            writer.put(('/item/bad length', 'title')) # the row is shorter than the columns
+            writer.flush()
+            writer.put(('/item/after', 'title', 1))
+
+        self.assertLess(time.perf_counter() - start, 3.0) # data errors are not repeated with delays
+        self.assertEqual([row[0] for row in rejected], ['/item/bad price', '/item/1', '/item/bad array', '/item/bad length'])
+        self.assertEqual((writer.rows, writer.rejected, writer.dropped), (11, 4, 0))
+        self.assertEqual(len(self.rows()), 11)
+
+    def test_errors(self):
+        # the error isn't caused by the connection or the data, the batch isn't repeated
+        writer = PgBatchWriter(test_config, 'etltools_writer_not_exists', ('url',), flush_interval=0, retries=1, retry_delay=5)
+        writer.start()
+        writer.put(('/item/0',))
+        start = time.perf_counter()
+        with self.assertRaises(PgBatchWriterError):
+            writer.flush()
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertRaises(PgBatchWriterError, writer.put, ('/item/1',))
+        with self.assertRaises(PgBatchWriterError):
+            writer.close()
+        self.assertEqual(writer.dropped, 1)
+
+        # errors of the connection are repeated after 0.1 and 0.2 s
+        writer = PgBatchWriter(replace(test_config, port='1'), self.TABLE, ('url',), flush_interval=0, retries=2, retry_delay=0.1)
+        writer.start()
+        writer.put(('/item/0',))
+        start = time.perf_counter()
+        with self.assertRaises(PgBatchWriterError):
+            writer.flush()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+        self.assertRaises(PgBatchWriterError, writer.close)
+
+        self.assertRaises(PgBatchWriterError, PgBatchWriter, 'config', self.TABLE, ('url',))
+
+
+if __name__ == '__main__':
+    unittest.main()